@@ -1,14 +1,31 @@
-from transformers import MusicgenForConditionalGeneration, AutoProcessor
-import torchaudio
 import os
 
-model = MusicgenForConditionalGeneration.from_pretrained("facebook/musicgen-small")
-processor = AutoProcessor.from_pretrained("facebook/musicgen-small")
+MODEL_NAME = "facebook/musicgen-small"
+SAMPLE_RATE = 32000
+MAX_NEW_TOKENS = 800
+OUTPUT_DIR = "MusicGen_output"
 
-inputs = processor(text=["a relaxing lo-fi beat with rain sounds"], return_tensors="pt")
-audio_values = model.generate(**inputs, max_new_tokens=800)
 
-output_dir = "MusicGen_output"
-os.makedirs(output_dir, exist_ok=True)
-output_path = os.path.join(output_dir, "output.wav")
-torchaudio.save(output_path, audio_values[0], 32000)
+def load_model(model_name=MODEL_NAME):
+    """回傳 (model, processor)；transformers 延到真正需要時才 import"""
+    from transformers import MusicgenForConditionalGeneration, AutoProcessor
+    model = MusicgenForConditionalGeneration.from_pretrained(model_name)
+    processor = AutoProcessor.from_pretrained(model_name)
+    return model, processor
+
+
+def generate_music(model, processor, prompt, max_new_tokens=MAX_NEW_TOKENS, output_path=None):
+    import torchaudio
+    inputs = processor(text=[prompt], return_tensors="pt")
+    audio_values = model.generate(**inputs, max_new_tokens=max_new_tokens)
+
+    if output_path is None:
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        output_path = os.path.join(OUTPUT_DIR, "output.wav")
+    torchaudio.save(output_path, audio_values[0], SAMPLE_RATE)
+    return output_path
+
+
+if __name__ == "__main__":
+    model, processor = load_model()
+    generate_music(model, processor, "a relaxing lo-fi beat with rain sounds")
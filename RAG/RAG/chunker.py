@@ -0,0 +1,161 @@
+import re
+from collections import deque
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+# === 切塊設定 ===
+CHUNK_STRATEGY = "paragraph"  # paragraph / tokens / headings / sentences
+CHUNK_TOKENS = 256            # 每塊 token 上限（tokens/headings/sentences 使用）
+CHUNK_OVERLAP = 32            # tokens 視窗之間重疊的 token 數
+STRATEGIES = ("paragraph", "tokens", "headings", "sentences")
+
+# CJK 字各算一個 token，英數字詞算一個 token，空白與標點附在前一個 token 上
+TOKEN_PATTERN = re.compile(r"[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯][^\S\n]*|[A-Za-z0-9]+[^\S\n]*|[^\w\s][^\S\n]*|\s+|_")
+# 句子邊界：中日文全形句號/問號/驚嘆號（含後接引號）與英文句點後接空白
+SENTENCE_END = re.compile(r"[。！？!?]+[」』”’）)]*|\.(?=\s)")
+HEADING = re.compile(r"^\s{0,3}#{1,6}\s")
+
+
+# === 串流讀檔 ===
+def iter_lines(path: Path) -> Iterator[str]:
+    """逐行讀取，不會一次把整份文件載入記憶體"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+
+def iter_tokens(text: str) -> Iterator[str]:
+    for m in TOKEN_PATTERN.finditer(text):
+        yield m.group(0)
+
+
+def count_tokens(text: str) -> int:
+    return sum(1 for t in iter_tokens(text) if not t.isspace())
+
+
+# === 各種切塊策略 ===
+def chunk_paragraphs(lines: Iterable[str]) -> Iterator[str]:
+    """舊行為：每個非空白行是一塊"""
+    for line in lines:
+        if line.strip():
+            yield line.strip()
+
+
+def chunk_token_windows(pieces: Iterable[str], max_tokens: int = CHUNK_TOKENS,
+                        overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    """固定 token 視窗，相鄰視窗重疊 overlap 個 token"""
+    overlap = max(0, min(overlap, max_tokens - 1))
+    window: deque = deque()
+    count = 0  # 視窗中的 token 數（不含空白）
+    fresh = 0  # 上次輸出後新加入的 token 數
+    for piece in pieces:
+        for token in iter_tokens(piece + "\n"):
+            if token.isspace():
+                if window:
+                    window.append(token)
+                continue
+            window.append(token)
+            count += 1
+            fresh += 1
+            if count >= max_tokens:
+                yield "".join(window).strip()
+                while count > overlap:
+                    if not window.popleft().isspace():
+                        count -= 1
+                while window and window[0].isspace():
+                    window.popleft()
+                fresh = 0
+    if fresh:
+        yield "".join(window).strip()
+
+
+def iter_sentences(lines: Iterable[str]) -> Iterator[str]:
+    """以中英文句尾切句，空行與標題也視為邊界"""
+    buffer = ""
+    for line in lines:
+        if not line.strip() or HEADING.match(line):
+            if buffer.strip():
+                yield buffer.strip()
+            buffer = ""
+            if line.strip():
+                yield line.strip()
+            continue
+        buffer += line.strip() + " "
+        start = 0
+        for m in SENTENCE_END.finditer(buffer):
+            sentence = buffer[start:m.end()].strip()
+            if sentence:
+                yield sentence
+            start = m.end()
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def chunk_sentences(lines: Iterable[str], max_tokens: int = CHUNK_TOKENS) -> Iterator[str]:
+    """
+    把連續句子裝進同一塊直到接近 token 上限；單句過長則再以 token 視窗切開。
+    標題一律開新的一塊，不會黏在上一節最後一句後面。
+    """
+    current: List[str] = []
+    used = 0
+    for sentence in iter_sentences(lines):
+        cost = count_tokens(sentence)
+        if current and HEADING.match(sentence):
+            yield " ".join(current)
+            current, used = [], 0
+        if cost > max_tokens:
+            if current:
+                yield " ".join(current)
+                current, used = [], 0
+            yield from chunk_token_windows([sentence], max_tokens, 0)
+            continue
+        if current and used + cost > max_tokens:
+            yield " ".join(current)
+            current, used = [], 0
+        current.append(sentence)
+        used += cost
+    if current:
+        yield " ".join(current)
+
+
+def iter_sections(lines: Iterable[str]) -> Iterator[List[str]]:
+    section: List[str] = []
+    for line in lines:
+        if HEADING.match(line) and section:
+            yield section
+            section = []
+        section.append(line)
+    if section:
+        yield section
+
+
+def chunk_headings(lines: Iterable[str], max_tokens: int = CHUNK_TOKENS,
+                   overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    """以 Markdown 標題分段；過長的段落再切成 token 視窗，每塊都帶上標題"""
+    for section in iter_sections(lines):
+        heading = section[0].strip() if HEADING.match(section[0]) else ""
+        body = [line for line in (section[1:] if heading else section) if line.strip()]
+        text = "\n".join(body)
+        if count_tokens(heading) + count_tokens(text) <= max_tokens:
+            chunk = "\n".join(part for part in (heading, text) if part)
+            if chunk:
+                yield chunk
+            continue
+        budget = max(max_tokens - count_tokens(heading), 1)
+        for window in chunk_token_windows(body, budget, min(overlap, budget - 1)):
+            yield f"{heading}\n{window}" if heading else window
+
+
+def iter_file_chunks(path: Path, strategy: str = CHUNK_STRATEGY,
+                     max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    lines = iter_lines(path)
+    if strategy == "paragraph":
+        return chunk_paragraphs(lines)
+    if strategy == "tokens":
+        return chunk_token_windows(chunk_paragraphs(lines), max_tokens, overlap)
+    if strategy == "headings":
+        return chunk_headings(lines, max_tokens, overlap)
+    if strategy == "sentences":
+        return chunk_sentences(lines, max_tokens)
+    raise ValueError(f"未知的切塊策略: {strategy}（可用：{', '.join(STRATEGIES)}）")
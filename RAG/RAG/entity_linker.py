@@ -0,0 +1,215 @@
+import re
+import json
+from collections import deque
+from pathlib import Path
+from typing import List, Dict, Iterable, Iterator, Tuple
+
+# === 關係分類規則（依優先順序比對 mention 所在子句） ===
+# supplies：描述的主體供應 mention（「供應」「提供」）
+# supplied_by：主體使用 mention 的產品（「使用」「來自」），輸出時反轉成 mention supplies 主體
+RELATION_RULES = [
+    ("competes_with", ["競爭", "爭鋒", "對手"]),
+    ("supplies", ["供應", "提供", "來源", "整合於"]),
+    ("supplied_by", ["使用", "模組來自", "來自", "依賴", "採用", "整合"]),
+    ("collaborates_with", ["合作", "共同", "夥伴", "交換"]),
+]
+DEFAULT_RELATION = "related"
+INVERSE_RELATIONS = {"supplies": "supplied_by", "supplied_by": "supplies"}
+# 緊接在 mention 前的被動標記會反轉供應方向：「由NeuralVision提供」「被AutoCompute採用」
+PASSIVE_MARKERS = ("由", "被")
+# 「與X…整合」：mention 在「與」之後、使用方關鍵字在 mention 之後，是雙方共同進行
+JOINT_MARKERS = ("與", "和")
+
+# 子句邊界：中英文標點、換行與連接詞「並」
+CLAUSE_SPLIT = re.compile(r"[，。；！？,;!?\n]|並")
+
+
+# === Aho-Corasick 自動機 ===
+class AhoCorasick:
+    """多字串比對自動機，建構 O(總模式長度)，比對 O(文字長度 + 命中數)"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str):
+        state = 0
+        for ch in pattern:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = nxt
+        self.output[state].append(len(self.patterns))
+        self.patterns.append(pattern)
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(ch, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """產生所有命中 (start, end, pattern_index)，可能重疊"""
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for pattern_idx in self.output[state]:
+                yield i + 1 - len(self.patterns[pattern_idx]), i + 1, pattern_idx
+
+    def find_longest(self, text: str) -> List[Tuple[int, int, int]]:
+        """
+        取最左最長、互不重疊的命中，並要求英數名稱前後不能緊接英數字
+        （避免 "ChargeX" 命中 "ChargeXL"）。
+        """
+        candidates = sorted(self.iter_matches(text), key=lambda m: (m[0], -(m[1] - m[0])))
+        result = []
+        last_end = 0
+        for start, end, pattern_idx in candidates:
+            if start < last_end or not self._on_boundary(text, start, end):
+                continue
+            result.append((start, end, pattern_idx))
+            last_end = end
+        return result
+
+    @staticmethod
+    def _on_boundary(text: str, start: int, end: int) -> bool:
+        def is_word(ch: str) -> bool:
+            return ch.isascii() and ch.isalnum()
+        if start > 0 and is_word(text[start]) and is_word(text[start - 1]):
+            return False
+        if end < len(text) and is_word(text[end - 1]) and is_word(text[end]):
+            return False
+        return True
+
+
+# === 邊抽取 ===
+def classify_relation(clause: str, start: int = 0, end: int = 0) -> str:
+    """
+    以子句中距離 mention [start, end) 最近的關鍵字決定關係，距離相同時依 RELATION_RULES 順序。
+    例："與AutoCompute合作進行AI駕駛整合" → 「合作」比「整合」近 → collaborates_with
+    供應關係再依 mention 前的被動 / 共同標記調整方向。
+    """
+    best_relation, best_distance, best_after = DEFAULT_RELATION, None, False
+    for relation, keywords in RELATION_RULES:
+        for keyword in keywords:
+            pos = clause.find(keyword)
+            while pos != -1:
+                if pos >= end:
+                    distance = pos - end
+                elif pos + len(keyword) <= start:
+                    distance = start - (pos + len(keyword))
+                else:
+                    distance = 0
+                if best_distance is None or distance < best_distance:
+                    best_relation, best_distance, best_after = relation, distance, pos >= end
+                pos = clause.find(keyword, pos + 1)
+
+    if best_relation in INVERSE_RELATIONS and start > 0:
+        marker = clause[start - 1]
+        if marker in PASSIVE_MARKERS:
+            return INVERSE_RELATIONS[best_relation]
+        if marker in JOINT_MARKERS and best_after and best_relation == "supplied_by":
+            return "collaborates_with"
+    return best_relation
+
+
+def clause_around(text: str, start: int, end: int) -> Tuple[str, int]:
+    """回傳包含 [start, end) 的子句與子句在原文中的起點"""
+    left = 0
+    for m in CLAUSE_SPLIT.finditer(text, 0, start):
+        left = m.end()
+    m = CLAUSE_SPLIT.search(text, end)
+    right = m.start() if m else len(text)
+    return text[left:right], left
+
+
+def build_automaton(nodes: Iterable[Dict]) -> Tuple[AhoCorasick, List[str]]:
+    """以節點 id 與 aliases 建立自動機，回傳 (自動機, 每個模式對應的節點 id)"""
+    names, owners = [], []
+    for node in nodes:
+        for name in [node["id"]] + list(node.get("aliases", [])):
+            names.append(name)
+            owners.append(node["id"])
+    return AhoCorasick(names), owners
+
+
+def extract_edges(source_id: str, text: str, automaton: AhoCorasick, owners: List[str]) -> List[Dict]:
+    """
+    每個 mention 依其所在子句判斷關係，同一文件中重複的 (target, relation) 只保留一次。
+    supplied_by 一律輸出成反向的 supplies 邊，圖中的供應關係都是「供應方 → 使用方」。
+    """
+    edges, seen = [], set()
+    for start, end, pattern_idx in automaton.find_longest(text):
+        target = owners[pattern_idx]
+        if target == source_id:
+            continue
+        clause, offset = clause_around(text, start, end)
+        relation = classify_relation(clause, start - offset, end - offset)
+        if (target, relation) in seen:
+            continue
+        seen.add((target, relation))
+        if relation == "supplied_by":
+            edges.append({"source": target, "target": source_id, "relation": "supplies"})
+        else:
+            edges.append({"source": source_id, "target": target, "relation": relation})
+    return edges
+
+
+def iter_edges(docs: Iterable[Dict], automaton: AhoCorasick, owners: List[str],
+               text_key: str = "description") -> Iterator[Dict]:
+    """
+    逐文件串流產生邊，不需一次持有所有文件。
+    供應邊會被反轉，A 的描述與 B 的描述可能產生同一條邊，跨文件以 (source, target, relation) 去重，
+    只保留第一次出現的；記住的只有邊的鍵，比輸入小得多。
+    """
+    seen = set()
+    for doc in docs:
+        for edge in extract_edges(doc["id"], doc.get(text_key, ""), automaton, owners):
+            key = (edge["source"], edge["target"], edge["relation"])
+            if key not in seen:
+                seen.add(key)
+                yield edge
+
+
+# === 大型語料串流 ===
+def iter_jsonl(path: Path) -> Iterator[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def stream_edges_jsonl(input_path: Path, output_path: Path, text_key: str = "description") -> int:
+    """
+    輸入為每行一筆 {"id", "description", "aliases"?} 的 JSONL：
+    第一遍只讀取名稱建立自動機，第二遍逐行抽取邊並直接寫出（與 build_graph 相同的去重），回傳邊數。
+    """
+    automaton, owners = build_automaton(
+        {"id": doc["id"], "aliases": doc.get("aliases", [])} for doc in iter_jsonl(input_path)
+    )
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as out:
+        for edge in iter_edges(iter_jsonl(input_path), automaton, owners, text_key):
+            out.write(json.dumps(edge, ensure_ascii=False) + "\n")
+            count += 1
+    return count
@@ -1,12 +1,15 @@
 import json
+import argparse
 from pathlib import Path
 
+from entity_linker import build_automaton, iter_edges, stream_edges_jsonl
+
 # 定義節點與關係（基於之前的虛構 30 家公司）
 nodes = [
     {"id": "Taiwan Chip Co", "type": "company", "description": "專注於高效能晶片設計，是多家AI設備商的核心供應商，與NeuralVision合作密切。"},
     {"id": "NeuralVision", "type": "company", "description": "製造人工智慧相機與感測器，晶片來自Taiwan Chip Co，產品被AutoCompute廣泛採用。"},
     {"id": "AutoCompute", "type": "company", "description": "自駕車系統開發商，整合NeuralVision感測器並與SkyRoute Navigation展開競爭。"},
-    {"id": "SkyRoute Navigation", "type": "company", "description": "提供自駕車路徑演算法，與AutoCompute在市場上爭鋒相對，雙方同時依賴NeuralVision感測器。"},
+    {"id": "SkyRoute Navigation", "type": "company", "aliases": ["SkyRoute"], "description": "提供自駕車路徑演算法，與AutoCompute在市場上爭鋒相對，雙方同時依賴NeuralVision感測器。"},
     {"id": "GreenEnergyTech", "type": "company", "description": "製造太陽能與風力儲能模組，與ChargeX電池模組有密切合作關係。"},
     {"id": "ChargeX", "type": "company", "description": "生產次世代鋰電池，為GreenEnergyTech與HyperCycle的電力來源。"},
     {"id": "HyperCycle", "type": "company", "description": "電動車初創公司，使用GreenEnergyTech能源模組與ChargeX電池，與AutoCompute合作進行AI駕駛整合。"},
@@ -35,32 +38,32 @@ nodes = [
     {"id": "EchoStream", "type": "company", "description": "即時音訊串流平台，與NextGen Audio與SmartLogix共同打造語音監控系統。"}
 ]
 
-# 簡化邏輯：根據描述建立關聯邊
-edges = []
-for node in nodes:
-    src = node["id"]
-    desc = node["description"]
-    for target_node in nodes:
-        tgt = target_node["id"]
-        if tgt != src and tgt in desc:
-            relation = "related"
-            if "合作" in desc:
-                relation = "collaborates_with"
-            elif "供應" in desc or "使用" in desc or "模組來自" in desc:
-                relation = "supplies"
-            elif "競爭" in desc or "爭鋒" in desc:
-                relation = "competes_with"
-            edges.append({"source": src, "target": tgt, "relation": relation})
 
-graph = {
-    "nodes": nodes,
-    "edges": edges
-}
+def build_graph(nodes):
+    """以 Aho-Corasick 一次掃描每段描述找出所有提到的公司，並依 mention 所在子句判斷關係"""
+    automaton, owners = build_automaton(nodes)
+    return {
+        "nodes": nodes,
+        "edges": list(iter_edges(nodes, automaton, owners))  # 重複的邊已由 iter_edges 去除
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="從公司描述抽取關係邊")
+    parser.add_argument("--input", type=Path, help="大型語料：每行一筆 {id, description, aliases?} 的 JSONL")
+    parser.add_argument("--output", type=Path, help="搭配 --input，邊以 JSONL 串流寫出")
+    args = parser.parse_args()
 
-# 儲存成 graph.json
-output_path = Path("rag/graph.json")
-output_path.parent.mkdir(parents=True, exist_ok=True)
-with open(output_path, "w", encoding="utf-8") as f:
-    json.dump(graph, f, ensure_ascii=False, indent=2)
+    if args.input:
+        output = args.output or args.input.with_name(args.input.stem + "_edges.jsonl")
+        count = stream_edges_jsonl(args.input, output)
+        print(f"✅ 已寫出 {count} 條邊至 {output}")
+    else:
+        graph = build_graph(nodes)
 
-output_path
+        # 儲存成 graph.json
+        output_path = Path("rag/graph.json")
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(graph, f, ensure_ascii=False, indent=2)
+        print(f"✅ 已寫出 {len(graph['edges'])} 條邊至 {output_path}")
@@ -1,70 +1,256 @@
 import os
 import json
+import time
+import hashlib
+import argparse
 import requests
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Tuple, Iterator
 from tqdm import tqdm  # ✅ 加入 tqdm 進度條套件
 
+from chunker import iter_file_chunks, CHUNK_STRATEGY, CHUNK_TOKENS, CHUNK_OVERLAP, STRATEGIES
+
 DATA_DIR = Path("rag/data")
 OUTPUT_PATH = Path("rag/embeddings.json")
+MANIFEST_PATH = Path("rag/embeddings_manifest.json")  # 每個檔案的 mtime/size 紀錄
 OLLAMA_MODEL = "shaw/dmeta-embedding-zh"
-OLLAMA_URL = "http://localhost:11434/api/embeddings"
+OLLAMA_URL = "http://localhost:11434/api/embed"
+WATCH_INTERVAL = 2.0  # watch 模式輪詢秒數
+EMBED_BATCH = 16      # 累積多少段就一次送去 /api/embed（讀檔與 embedding 交錯進行）
+
+def text_hash(text: str) -> str:
+    """段落內容雜湊，用來判斷段落是否需要重新 embedding"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def iter_file_documents(file: Path, chunking: Dict) -> Iterator[Dict]:
+    """串流讀取單一 .md 文件並依切塊設定產生段落"""
+    for i, chunk in enumerate(iter_file_chunks(file, chunking["strategy"], chunking["tokens"], chunking["overlap"])):
+        yield {
+            "source": file.name,
+            "paragraph_id": f"{file.stem}_{i}",
+            "text": chunk,
+            "hash": text_hash(chunk)
+        }
 
-def split_into_paragraphs(text: str) -> List[str]:
-    """將文件按段落切分"""
-    return [p.strip() for p in text.split("\n") if p.strip()]
+def iter_documents(data_dir: Path, chunking: Dict) -> Iterator[Dict]:
+    """逐檔逐段產生文件段落"""
+    for file in sorted(data_dir.glob("*.md")):
+        yield from iter_file_documents(file, chunking)
 
-def load_documents(data_dir: Path) -> List[Dict]:
+def load_documents(data_dir: Path, chunking: Dict = None) -> List[Dict]:
     """讀取所有 .md 文件並切分段落"""
-    documents = []
-    for file in data_dir.glob("*.md"):
-        with open(file, "r", encoding="utf-8") as f:
-            content = f.read()
-        paragraphs = split_into_paragraphs(content)
-        for i, paragraph in enumerate(paragraphs):
-            documents.append({
-                "source": file.name,
-                "paragraph_id": f"{file.stem}_{i}",
-                "text": paragraph
-            })
-    return documents
-
-def generate_embeddings_ollama(docs: List[Dict], model_name: str) -> List[Dict]:
-    """使用 Ollama 的 embedding API 產生向量，含 tqdm 進度條"""
-    for doc in tqdm(docs, desc="🧠 Generating embeddings"):
+    return list(iter_documents(data_dir, chunking or default_chunking()))
+
+def default_chunking() -> Dict:
+    return {"strategy": CHUNK_STRATEGY, "tokens": CHUNK_TOKENS, "overlap": CHUNK_OVERLAP}
+
+def generate_embeddings_ollama(docs: List[Dict], model_name: str, progress=None) -> List[Dict]:
+    """
+    使用 Ollama 的 /api/embed 產生向量，每 EMBED_BATCH 段以 list input 一次送出，
+    含 tqdm 進度條（可傳入共用的 progress）
+    """
+    bar = progress if progress is not None else tqdm(total=len(docs), desc="🧠 Generating embeddings")
+    for start in range(0, len(docs), EMBED_BATCH):
+        batch = docs[start:start + EMBED_BATCH]
         payload = {
             "model": model_name,
-            "prompt": doc["text"]
+            "input": [doc["text"] for doc in batch]
         }
         try:
             res = requests.post(OLLAMA_URL, json=payload)
             res.raise_for_status()
-            result = res.json()
-            doc["embedding"] = result["embedding"]
+            embeddings = res.json()["embeddings"]
+            if len(embeddings) != len(batch):
+                raise ValueError(f"回傳 {len(embeddings)} 個向量，預期 {len(batch)} 個")
+            for doc, embedding in zip(batch, embeddings):
+                doc["embedding"] = embedding
         except Exception as e:
-            print(f"❌ 無法為段落產生 embedding: {doc['paragraph_id']} - {e}")
-            doc["embedding"] = None
+            print(f"❌ 無法為段落產生 embedding: {batch[0]['paragraph_id']} ~ {batch[-1]['paragraph_id']} - {e}")
+            for doc in batch:
+                doc["embedding"] = None
+        bar.update(len(batch))
+    if progress is None:
+        bar.close()
     return docs
 
 def save_embeddings(docs: List[Dict], output_path: Path):
-    """儲存結果為 JSON"""
-    with open(output_path, "w", encoding="utf-8") as f:
+    """儲存結果為 JSON（先寫暫存檔再替換，避免中斷時留下半個檔案）"""
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
         json.dump(docs, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, output_path)
+
+# === 增量索引 ===
+def load_json(path: Path, default):
+    if not path.exists():
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def file_signature(file: Path) -> Dict:
+    stat = file.stat()
+    return {"mtime": stat.st_mtime, "size": stat.st_size}
+
+def scan_data_dir(data_dir: Path) -> Dict[str, Tuple[float, int]]:
+    """回傳 {檔名: (mtime, size)}，watch 模式用來偵測變更"""
+    return {
+        file.name: (sig["mtime"], sig["size"])
+        for file in sorted(data_dir.glob("*.md"))
+        for sig in [file_signature(file)]
+    }
+
+def incremental_index(data_dir: Path = DATA_DIR,
+                      output_path: Path = OUTPUT_PATH,
+                      manifest_path: Path = MANIFEST_PATH,
+                      model_name: str = OLLAMA_MODEL,
+                      full: bool = False,
+                      chunking: Dict = None) -> Dict[str, int]:
+    """
+    只為新增或內容改變的段落產生 embedding，並移除已刪除段落的向量。
+    - manifest 紀錄每個檔案的 mtime/size，未變動的檔案完全不讀取
+    - 變動檔案的段落以內容雜湊比對，相同內容沿用舊向量
+    - 段落以串流方式切出，每累積 EMBED_BATCH 段就送去 embedding，不必等所有文件讀完
+    - 所有段落（含向量）會保留在記憶體中，最後一次寫出 embeddings.json
+    """
+    chunking = chunking or default_chunking()
+    manifest = load_json(manifest_path, {})
+    old_docs = [] if full else load_json(output_path, [])
+
+    # 換了 embedding 模型，舊向量全部失效
+    if manifest.get("model") != model_name and manifest:
+        print(f"⚠️ Embedding 模型由 {manifest.get('model')} 變更為 {model_name}，重新建立索引")
+        old_docs = []
+    file_entries = manifest.get("files", {}) if old_docs else {}
+    # 切塊設定改變時所有檔案都要重新切，但內容相同的段落仍沿用舊向量
+    if manifest.get("chunking", default_chunking()) != chunking:
+        file_entries = {}
+
+    old_by_source: Dict[str, List[Dict]] = {}
+    vector_pool: Dict[str, List[float]] = {}
+    for doc in old_docs:
+        old_by_source.setdefault(doc["source"], []).append(doc)
+        if doc.get("embedding") is not None:
+            vector_pool[doc.get("hash") or text_hash(doc["text"])] = doc["embedding"]
+
+    docs: List[Dict] = []
+    failed_sources = set()
+    batch: List[Dict] = []
+    new_entries: Dict[str, Dict] = {}
+    stats = {"files_unchanged": 0, "files_changed": 0, "files_removed": 0,
+             "reused": 0, "embedded": 0, "removed": 0}
+    progress = tqdm(desc="🧠 Generating embeddings", unit="段")
+
+    def flush_batch():
+        generate_embeddings_ollama(batch, model_name, progress)
+        stats["embedded"] += len(batch)
+        failed_sources.update(doc["source"] for doc in batch if doc["embedding"] is None)
+        batch.clear()
+
+    for file in sorted(data_dir.glob("*.md")):
+        signature = file_signature(file)
+        previous = old_by_source.get(file.name, [])
+        entry = file_entries.get(file.name)
+        unchanged = (
+            entry is not None
+            and entry["mtime"] == signature["mtime"]
+            and entry["size"] == signature["size"]
+            and len(previous) == entry.get("paragraphs")
+            and all(doc.get("embedding") is not None for doc in previous)
+        )
+        if unchanged:
+            for doc in previous:
+                doc.setdefault("hash", text_hash(doc["text"]))
+            docs.extend(previous)
+            new_entries[file.name] = entry
+            stats["files_unchanged"] += 1
+            continue
+
+        stats["files_changed"] += 1
+        kept_hashes = set()
+        count = 0
+        for doc in iter_file_documents(file, chunking):
+            kept_hashes.add(doc["hash"])
+            count += 1
+            embedding = vector_pool.get(doc["hash"])
+            if embedding is not None:
+                doc["embedding"] = embedding
+                stats["reused"] += 1
+            else:
+                batch.append(doc)
+                if len(batch) >= EMBED_BATCH:
+                    flush_batch()
+            docs.append(doc)
+        stats["removed"] += sum(
+            1 for doc in previous if (doc.get("hash") or text_hash(doc["text"])) not in kept_hashes
+        )
+        new_entries[file.name] = dict(signature, paragraphs=count)
+
+    if batch:
+        flush_batch()
+    progress.close()
+
+    current_names = set(new_entries)
+    for source, previous in old_by_source.items():
+        if source not in current_names:
+            stats["files_removed"] += 1
+            stats["removed"] += len(previous)
+
+    changed = stats["files_changed"] or stats["files_removed"] or len(docs) != len(old_docs)
+    if changed or not output_path.exists():
+        save_embeddings(docs, output_path)
+        # 失敗的段落不寫入 manifest，下次執行會重試
+        for name in failed_sources:
+            new_entries.pop(name, None)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump({"model": model_name, "chunking": chunking, "files": new_entries},
+                      f, ensure_ascii=False, indent=2)
+
+    return stats
+
+def print_stats(stats: Dict[str, int]):
+    print(
+        f"📊 檔案 未變動 {stats['files_unchanged']} / 變動 {stats['files_changed']} / 刪除 {stats['files_removed']}，"
+        f"段落 新 embedding {stats['embedded']} / 沿用 {stats['reused']} / 移除 {stats['removed']}"
+    )
+
+def watch(data_dir: Path, interval: float = WATCH_INTERVAL, chunking: Dict = None):
+    """輪詢資料夾，檔案有變動時重新執行增量索引（Ctrl+C 離開）"""
+    print(f"👀 監看 {data_dir} 中，每 {interval} 秒檢查一次（Ctrl+C 離開）")
+    snapshot = scan_data_dir(data_dir)
+    try:
+        while True:
+            time.sleep(interval)
+            current = scan_data_dir(data_dir)
+            if current != snapshot:
+                print("🔄 偵測到檔案變更，重新索引...")
+                print_stats(incremental_index(data_dir, chunking=chunking))
+                snapshot = current
+    except KeyboardInterrupt:
+        print("\n🛑 停止監看")
 
 def main():
+    parser = argparse.ArgumentParser(description="RAG 文件增量 embedding 索引")
+    parser.add_argument("--full", action="store_true", help="忽略既有向量，全部重新 embedding")
+    parser.add_argument("--watch", action="store_true", help="持續監看資料夾並自動重新索引")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="watch 模式輪詢秒數")
+    parser.add_argument("--chunk", choices=STRATEGIES, default=CHUNK_STRATEGY, help="切塊策略")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help="每塊 token 上限")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP, help="token 視窗重疊數")
+    args = parser.parse_args()
+    chunking = {"strategy": args.chunk, "tokens": args.chunk_tokens, "overlap": args.chunk_overlap}
+
     if not DATA_DIR.exists():
         print(f"❌ 資料夾不存在：{DATA_DIR}")
         return
 
-    print("🔍 載入資料中...")
-    docs = load_documents(DATA_DIR)
-
-    print(f"🧠 使用模型 {OLLAMA_MODEL} 產生 embedding 中...")
-    docs = generate_embeddings_ollama(docs, OLLAMA_MODEL)
-
-    print(f"💾 儲存至 {OUTPUT_PATH}")
-    save_embeddings(docs, OUTPUT_PATH)
+    print("🔍 比對資料變更中...")
+    stats = incremental_index(DATA_DIR, full=args.full, chunking=chunking)
+    print_stats(stats)
+    print(f"💾 索引位置 {OUTPUT_PATH}")
     print("✅ 完成！")
 
+    if args.watch:
+        watch(DATA_DIR, args.interval, chunking)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,309 @@
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tracemalloc
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Callable
+
+RAG_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(RAG_DIR.parent / "public"))  # main_conversation_graph_rag 需要 conversation_handler
+
+import main_conversation_rag as rag
+import main_conversation_graph_rag as graph_rag
+from lexical_index import tokenize
+from quantized_store import QuantizedVectorStore
+
+EMBEDDING_PATH = RAG_DIR / "RAG" / "embeddings.json"
+GRAPH_PATH = RAG_DIR / "RAG" / "graph.json"
+STUB_DIM = 256
+TOP_K = 5
+
+RELATION_WORDS = {
+    "supplies": "供應",
+    "collaborates_with": "合作",
+    "competes_with": "競爭",
+}
+SUPPLY_QUESTIONS = {
+    "out": "{node}供應給哪些公司？",
+    "in": "哪些公司是{node}的供應商？",
+}
+# 改寫題用的同義詞（單次掃描替換，不會連鎖替換）
+PARAPHRASES = {
+    "製造商": "生產廠商", "製造": "生產", "生產": "製造", "開發商": "研發廠商", "開發": "研發",
+    "公司": "企業", "提供": "供給", "平台": "系統", "技術": "方案", "模組": "元件",
+    "感測器": "傳感器", "機器人": "機械人", "晶片": "芯片", "軟體": "軟件", "影像": "圖像",
+    "自駕車": "自動駕駛汽車", "無人機": "空拍機", "供應商": "供貨商", "合作": "攜手",
+}
+PARAPHRASE_PATTERN = re.compile("|".join(sorted(map(re.escape, PARAPHRASES), key=len, reverse=True)))
+CLAUSE_SPLIT = re.compile(r"[，。、；]")
+
+
+# === 離線用的決定性 stub embedding ===
+def stub_embedding(text: str, dim: int = STUB_DIM) -> List[float]:
+    """token 雜湊到固定維度（signed hashing trick），相同文字永遠得到相同向量"""
+    vec = np.zeros(dim, dtype=np.float64)
+    for token in tokenize(text):
+        h = int(hashlib.md5(token.encode("utf-8")).hexdigest()[:8], 16)
+        vec[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = np.linalg.norm(vec)
+    return (vec / norm if norm else vec).tolist()
+
+
+def use_embedder(embed: Callable[[str], List[float]]):
+    """把兩個 RAG 模組的 embedding 函式換成指定的實作"""
+    rag.get_query_embedding = lambda query, model=None: embed(query)
+    graph_rag.get_query_embedding = lambda query, model=None: embed(query)
+    graph_rag.get_embeddings = lambda texts, model=None: [embed(t) for t in texts]
+
+
+# === 標註資料集 ===
+def paraphrase(text: str) -> str:
+    return PARAPHRASE_PATTERN.sub(lambda m: PARAPHRASES[m.group(0)], text)
+
+
+def mask_names(text: str, names: List[str]) -> str:
+    for name in sorted(names, key=len, reverse=True):
+        text = text.replace(name, "某公司")
+    return text
+
+
+def build_document_questions(docs: List[Dict]) -> List[Dict]:
+    """
+    每家公司最多五題：
+    - entity：精確名稱查詢
+    - description：用描述第一個子句反問是哪家公司（與原文字面相同，最容易）
+    - paraphrase：第一個子句換成同義詞，字面不再完全重疊
+    - partial：只用描述後段的一個子句，其中的公司名稱遮掉，必須靠業務內容辨識
+    - multi_hop：以改寫的描述指稱一家公司，問與它往來的公司在做什麼；
+      往來對象的名稱只出現在第一家公司的文件裡，所有相關文件都要找到
+    """
+    questions = []
+    by_source: Dict[str, List[str]] = {}
+    for doc in docs:
+        by_source.setdefault(doc["source"], []).append(doc["text"])
+    names = {Path(source).stem: source for source in by_source}
+    for source, texts in sorted(by_source.items()):
+        name = Path(source).stem
+        body = [t for t in texts if not t.startswith("#")]
+        if not body:
+            continue
+        questions.append({"query": name, "expected": [source], "kind": "entity"})
+        clauses = [c for c in CLAUSE_SPLIT.split(" ".join(body)) if c.strip()]
+        first_clause = clauses[0]
+        questions.append({"query": f"哪家公司{first_clause}？", "expected": [source], "kind": "description"})
+
+        rewritten = paraphrase(first_clause)
+        if rewritten != first_clause:
+            questions.append({"query": f"有沒有哪間企業在做{rewritten}？", "expected": [source], "kind": "paraphrase"})
+        if len(clauses) > 1:
+            questions.append({"query": f"是誰{paraphrase(mask_names(clauses[-1], list(names)))}？",
+                              "expected": [source], "kind": "partial"})
+
+        partners = [other for other in names if other != name and other in " ".join(body)]
+        if partners:
+            questions.append({
+                "query": f"{rewritten}的那家公司，和它往來的廠商主要做什麼？",
+                "expected": [source] + [names[p] for p in partners], "kind": "multi_hop"
+            })
+    return questions
+
+
+def build_graph_questions(graph: Dict) -> List[Dict]:
+    """
+    以 graph.json 的邊產生關係題，答案為該關係的所有鄰居。
+    supplies 邊為「供應方 → 使用方」，題目措辭須與 graph_index.infer_direction 的解析一致：
+    「X 供應給哪些公司」答出邊、「哪些公司是 X 的供應商」答入邊；合作、競爭不分方向，答案取兩個方向的鄰居。
+    """
+    grouped: Dict[tuple, set] = {}
+    for edge in graph["edges"]:
+        relation = edge["relation"]
+        if relation not in RELATION_WORDS:
+            continue
+        if relation == "supplies":
+            grouped.setdefault((edge["source"], relation, "out"), set()).add(edge["target"])
+            grouped.setdefault((edge["target"], relation, "in"), set()).add(edge["source"])
+        else:
+            grouped.setdefault((edge["source"], relation, "both"), set()).add(edge["target"])
+            grouped.setdefault((edge["target"], relation, "both"), set()).add(edge["source"])
+
+    questions = []
+    for (node, relation, direction), neighbours in sorted(grouped.items()):
+        neighbours = neighbours - {node}
+        if not neighbours:
+            continue
+        if direction == "both":
+            query, kind = f"哪些公司與{node}有{RELATION_WORDS[relation]}關係？", relation
+        else:
+            query, kind = SUPPLY_QUESTIONS[direction].format(node=node), f"{relation}_{direction}"
+        questions.append({"query": query, "expected": sorted(neighbours), "kind": kind})
+    return questions
+
+
+# === 指標 ===
+def percentile(values: List[float], p: float) -> float:
+    return float(np.percentile(values, p)) if values else 0.0
+
+
+def evaluate(search: Callable[[str], List[str]], questions: List[Dict], k: int) -> Dict:
+    recalls, reciprocal_ranks, latencies = [], [], []
+    by_kind: Dict[str, Dict[str, List[float]]] = {}
+    for question in questions:
+        expected = set(question["expected"])
+        t0 = time.perf_counter()
+        results = search(question["query"])[:k]
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+        recalls.append(len(expected & set(results)) / len(expected))
+        rank = next((i for i, r in enumerate(results, start=1) if r in expected), None)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        kind = by_kind.setdefault(question["kind"], {"recall": [], "rr": []})
+        kind["recall"].append(recalls[-1])
+        kind["rr"].append(reciprocal_ranks[-1])
+
+    return {
+        f"recall@{k}": float(np.mean(recalls)) if recalls else 0.0,
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": float(np.mean(latencies)) if latencies else 0.0,
+        },
+        "queries": len(questions),
+        "by_kind": {
+            kind: {f"recall@{k}": float(np.mean(v["recall"])), "mrr": float(np.mean(v["rr"])), "queries": len(v["recall"])}
+            for kind, v in sorted(by_kind.items())
+        },
+    }
+
+
+def measure_build(build: Callable[[], object]):
+    """回傳 (建構結果, 建構秒數, 建構期間的記憶體峰值 bytes)"""
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def unique(items: List[str]) -> List[str]:
+    return list(dict.fromkeys(items))
+
+
+# === 各後端 ===
+def run_document_backends(docs: List[Dict], questions: List[Dict], embed, k: int) -> Dict:
+    """
+    語料 embedding 只做一次、所有向量後端共用，單獨記在 "embedding"；
+    各後端的 build_s / build_peak_bytes 只量索引本身的建構。
+    """
+    results = {}
+
+    def embed_corpus():
+        return [dict(d, embedding=embed(d["text"])) for d in docs]
+
+    corpus, embed_time, embed_peak = measure_build(embed_corpus)
+
+    def add(name: str, build: Callable[[], object], search: Callable[[object, str], List[str]]):
+        index, build_time, peak = measure_build(build)
+        report = evaluate(lambda q: search(index, q), questions, k)
+        report["build_s"] = build_time
+        report["build_peak_bytes"] = peak
+        results[name] = report
+
+    def sources(hits: List[Dict]) -> List[str]:
+        return unique([h["source"] for h in hits])
+
+    rag.VECTOR_BACKEND = "float"
+    add("brute_force",
+        lambda: np.array([d["embedding"] for d in corpus]),
+        lambda _, q: sources(rag.retrieve(q, corpus, top_k=k * 3, mode="vector")))
+
+    def build_int8():
+        rag._quantized_store = QuantizedVectorStore.from_embeddings(corpus, keep_float=True)
+        return rag._quantized_store
+
+    def search_int8(_, q):
+        rag.VECTOR_BACKEND = "int8"
+        try:
+            return sources(rag.retrieve(q, corpus, top_k=k * 3, mode="vector"))
+        finally:
+            rag.VECTOR_BACKEND = "float"
+
+    add("ann_int8", build_int8, search_int8)
+    add("lexical",
+        lambda: rag.build_lexical_index(corpus),
+        lambda index, q: sources(rag.retrieve(q, corpus, index, top_k=k * 3, mode="lexical")))
+    add("hybrid",
+        lambda: rag.build_lexical_index(corpus),
+        lambda index, q: sources(rag.retrieve(q, corpus, index, top_k=k * 3, mode="hybrid")))
+    return {"embedding": {"embed_s": embed_time, "embed_peak_bytes": embed_peak}, "backends": results}
+
+
+def run_graph_backends(questions: List[Dict], k: int) -> Dict:
+    results = {}
+    graph_rag.GRAPH_PATH = str(GRAPH_PATH)
+    graph_rag._graph_index = None
+
+    for name, mode in (("graph_vector", "vector"), ("graph_expansion", "graph")):
+        _, build_time, peak = measure_build(graph_rag.get_graph_index)
+        report = evaluate(
+            lambda q: [item["node"]["id"] for item in graph_rag.graph_rag_retrieve(q, top_k=k + 1, mode=mode)
+                       if item["node"]["id"] not in q],
+            questions, k
+        )
+        report["build_s"] = build_time
+        report["build_peak_bytes"] = peak
+        results[name] = report
+        graph_rag._graph_index = None
+    return results
+
+
+# === 主程式 ===
+def main():
+    parser = argparse.ArgumentParser(description="RAG / GraphRAG 檢索品質與延遲基準測試")
+    parser.add_argument("--embedder", choices=["stub", "ollama"], default="stub",
+                        help="stub：離線決定性向量；ollama：使用真實 embedding 模型（需 ollama serve）")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--output", type=Path, help="JSON 結果輸出路徑（預設印到 stdout）")
+    args = parser.parse_args()
+
+    if args.embedder == "stub":
+        embed = stub_embedding
+    else:
+        from embedding_cache import get_query_embedding
+        embed = get_query_embedding
+    use_embedder(embed)
+
+    with open(EMBEDDING_PATH, "r", encoding="utf-8") as f:
+        docs = [{k: v for k, v in d.items() if k != "embedding"} for d in json.load(f)]
+    with open(GRAPH_PATH, "r", encoding="utf-8") as f:
+        graph = json.load(f)
+
+    document_questions = build_document_questions(docs)
+    graph_questions = build_graph_questions(graph)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "embedder": args.embedder,
+        "k": args.k,
+        "corpus": {"paragraphs": len(docs), "graph_nodes": len(graph["nodes"]), "graph_edges": len(graph["edges"])},
+        "documents": run_document_backends(docs, document_questions, embed, args.k),
+        "graph": run_graph_backends(graph_questions, args.k),
+    }
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+        print(f"💾 已寫出 {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import re
+import sys
+from pathlib import Path
+from typing import List, Dict, Callable, Optional
+
+# token 估算與歷史修剪與 public/history_manager.py 共用
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "public"))
+from text_tokens import estimate_tokens, estimate_message_tokens, budget_start
+
+DEFAULT_CONTEXT_BUDGET = 1200   # 檢索片段的 token 上限
+DEFAULT_HISTORY_BUDGET = 2000   # 對話歷史的 token 上限
+DUPLICATE_THRESHOLD = 0.8       # 片段重疊比例超過此值視為重複
+SUMMARY_PREFIX = "先前對話摘要："
+SUMMARY_SHARE = 0.2             # 有訊息被捨棄時，預算中保留給摘要的比例
+
+
+# === 片段去重 ===
+def _shingles(text: str, n: int = 3) -> set:
+    compact = re.sub(r"\s+", "", text)
+    if len(compact) <= n:
+        return {compact}
+    return {compact[i:i + n] for i in range(len(compact) - n + 1)}
+
+
+def is_duplicate(text: str, kept: List[set], threshold: float = DUPLICATE_THRESHOLD) -> bool:
+    """與已選片段的字元 3-gram 重疊（以較短者為分母）超過門檻即視為重複"""
+    shingles = _shingles(text)
+    for other in kept:
+        overlap = len(shingles & other) / max(1, min(len(shingles), len(other)))
+        if overlap >= threshold:
+            return True
+    return False
+
+
+# === 檢索片段打包 ===
+def pack_snippets(items: List[Dict], budget: int = DEFAULT_CONTEXT_BUDGET,
+                  text_of: Callable[[Dict], str] = lambda item: item["text"],
+                  score_of: Callable[[Dict], float] = lambda item: item["score"]) -> List[Dict]:
+    """依分數由高到低貪婪放入，跳過重複片段與放不下的片段，直到填滿預算"""
+    packed, kept_shingles, used = [], [], 0
+    for item in sorted(items, key=score_of, reverse=True):
+        text = text_of(item)
+        cost = estimate_tokens(text)
+        if used + cost > budget or is_duplicate(text, kept_shingles):
+            continue
+        packed.append(item)
+        kept_shingles.append(_shingles(text))
+        used += cost
+    return packed
+
+
+# === 對話歷史修剪 ===
+def pack_history(messages: List[Dict], budget: int = DEFAULT_HISTORY_BUDGET,
+                 summarize: Optional[Callable[[List[Dict]], str]] = None) -> List[Dict]:
+    """
+    由最新往回保留訊息直到用完預算（最新一則一定保留）。
+    被捨棄的舊訊息若提供 summarize 則濃縮成一則 system 摘要，否則直接丟棄；
+    摘要同樣計入預算，放不下時從最舊的一行開始捨棄。
+    """
+    start = budget_start(messages, budget)
+    kept = [{"role": m["role"], "content": m["content"]} for m in messages[start:]]
+    if start == 0 or not summarize:
+        return kept
+
+    dropped = list(messages[:start])
+    used = sum(estimate_message_tokens(m) for m in kept)
+    # 先讓出摘要的空間：把保留訊息中最舊的幾則也併入摘要（最新一則仍保留）
+    while len(kept) > 1 and used > budget * (1 - SUMMARY_SHARE):
+        oldest = kept.pop(0)
+        used -= estimate_message_tokens(oldest)
+        dropped.append(oldest)
+    summary = fit_summary(summarize(dropped), budget - used)
+    return ([{"role": "system", "content": summary}] if summary else []) + kept
+
+
+def fit_summary(summary: str, budget: int) -> str:
+    """加上前綴後的摘要訊息不超過 budget；超過時捨棄最舊的行，一行都放不下就回傳空字串"""
+    lines = summary.splitlines() if summary else []
+    while lines:
+        content = SUMMARY_PREFIX + "\n".join(lines)
+        if estimate_message_tokens({"content": content}) <= budget:
+            return content
+        lines.pop(0)
+    return ""
+
+
+def truncate_summary(messages: List[Dict], max_chars: int = 60) -> str:
+    """不呼叫模型的簡易摘要：每則舊訊息只留開頭幾個字（行數由 pack_history 依剩餘預算裁切）"""
+    lines = []
+    for message in messages:
+        content = " ".join(message["content"].split())
+        if len(content) > max_chars:
+            content = content[:max_chars] + "…"
+        lines.append(f"{message['role']}: {content}")
+    return "\n".join(lines)
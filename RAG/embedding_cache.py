@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import requests
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+OLLAMA_URL = "http://localhost:11434"
+# 查詢與批次都走 /api/embed（回傳單位長度向量）；舊的 /api/embeddings 不做正規化，兩者不能混用
+OLLAMA_EMBED_URL = f"{OLLAMA_URL}/api/embed"
+EMBED_ENDPOINT = "embed"                  # 寫進快取鍵，換端點時不會讀到另一種向量
+EMBED_MODEL = "shaw/dmeta-embedding-zh"
+
+MEMORY_CACHE_SIZE = 2048                  # LRU 筆數
+# 放在 rag/ 資料夾（與 embeddings.json 同處），不受執行時的工作目錄影響；設為 None 只使用記憶體
+DISK_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RAG", "embedding_cache.db")
+
+
+def normalize_text(text: str) -> str:
+    """全半形統一（NFKC）並壓縮空白，讓只差在空白或全形字的問題共用同一個快取"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha1(f"{EMBED_ENDPOINT}\0{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+# === 兩層快取：記憶體 LRU + 選用的 SQLite 磁碟層 ===
+class EmbeddingCache:
+    def __init__(self, max_entries: int = MEMORY_CACHE_SIZE, disk_path: Optional[str] = DISK_CACHE_PATH):
+        self.max_entries = max_entries
+        self.memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.conn = None
+        if disk_path:
+            parent = os.path.dirname(disk_path)
+            if not parent or os.path.isdir(parent):
+                self.conn = sqlite3.connect(disk_path, check_same_thread=False)
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB)"
+                )
+                self.conn.commit()
+            else:
+                print(f"⚠️ 找不到 {parent}，embedding 快取只使用記憶體")
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = cache_key(model, text)
+        with self.lock:
+            vector = self.memory.get(key)
+            if vector is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self.conn is not None:
+                row = self.conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row:
+                    vector = array("d", row[0]).tolist()
+                    self._remember(key, vector)
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, vector: List[float]):
+        self.put_many(model, [(text, vector)])
+
+    def put_many(self, model: str, items: List[Tuple[str, List[float]]]):
+        """多筆寫入只 commit 一次"""
+        rows = []
+        with self.lock:
+            for text, vector in items:
+                key = cache_key(model, text)
+                self._remember(key, vector)
+                rows.append((key, model, array("d", vector).tobytes()))
+            if self.conn is not None and rows:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)", rows
+                )
+                self.conn.commit()
+
+    def _remember(self, key: str, vector: List[float]):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+            "memory_entries": len(self.memory)
+        }
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> EmbeddingCache:
+    """第一次用到時才建立（並開啟磁碟檔），import 本模組不會產生任何檔案"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
+
+
+# === Ollama 呼叫 ===
+def fetch_embedding(text: str, model: str = EMBED_MODEL) -> List[float]:
+    return fetch_embeddings_batch([text], model)[0]
+
+
+def fetch_embeddings_batch(texts: List[str], model: str = EMBED_MODEL) -> List[List[float]]:
+    """一次請求取得多筆 embedding（Ollama /api/embed）"""
+    response = requests.post(OLLAMA_EMBED_URL, json={
+        "model": model,
+        "input": texts
+    })
+    response.raise_for_status()
+    return response.json()["embeddings"]
+
+
+# === 對外介面 ===
+def get_query_embedding(query: str, model: str = EMBED_MODEL, cache: EmbeddingCache = None) -> List[float]:
+    cache = cache or get_default_cache()
+    vector = cache.get(model, query)
+    if vector is None:
+        vector = fetch_embedding(query, model)
+        cache.put(model, query, vector)
+    return vector
+
+
+def get_embeddings(texts: List[str], model: str = EMBED_MODEL, cache: EmbeddingCache = None) -> List[List[float]]:
+    """批次版本：只把快取未命中的文字合併成一次請求"""
+    cache = cache or get_default_cache()
+    vectors: List[Optional[List[float]]] = [cache.get(model, text) for text in texts]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        fetched = fetch_embeddings_batch([texts[i] for i in missing], model)
+        cache.put_many(model, [(texts[i], vector) for i, vector in zip(missing, fetched)])
+        for i, vector in zip(missing, fetched):
+            vectors[i] = vector
+    return vectors
+
+
+def format_cache_stats(cache: EmbeddingCache = None) -> str:
+    stats = (cache or get_default_cache()).stats()
+    return (
+        f"📦 Embedding 快取：記憶體命中 {stats['memory_hits']} / 磁碟命中 {stats['disk_hits']} / "
+        f"未命中 {stats['misses']}（命中率 {stats['hit_rate']:.1%}）"
+    )
@@ -0,0 +1,170 @@
+import re
+import numpy as np
+from typing import List, Dict, Iterable, Optional
+
+
+# === 以 CSR 陣列儲存的鄰接索引 ===
+class GraphIndex:
+    """
+    graph.json 的記憶體鄰接索引。
+    out/in 兩個方向各一組 CSR：indptr[node] ~ indptr[node+1] 範圍內的 indices 為鄰居，
+    relations 為對應邊的關係代碼。
+    """
+
+    def __init__(self, graph: Dict):
+        self.nodes: List[Dict] = graph["nodes"]
+        self.node_ids: List[str] = [node["id"] for node in self.nodes]
+        self.node_index: Dict[str, int] = {node_id: i for i, node_id in enumerate(self.node_ids)}
+
+        edges = [
+            e for e in graph.get("edges", [])
+            if e["source"] in self.node_index and e["target"] in self.node_index
+        ]
+        self.relation_types: List[str] = sorted({e["relation"] for e in edges})
+        self.relation_index: Dict[str, int] = {r: i for i, r in enumerate(self.relation_types)}
+
+        sources = np.array([self.node_index[e["source"]] for e in edges], dtype=np.int32)
+        targets = np.array([self.node_index[e["target"]] for e in edges], dtype=np.int32)
+        relations = np.array([self.relation_index[e["relation"]] for e in edges], dtype=np.int16)
+
+        self.out_indptr, self.out_indices, self.out_relations = self._build_csr(sources, targets, relations)
+        self.in_indptr, self.in_indices, self.in_relations = self._build_csr(targets, sources, relations)
+
+    def _build_csr(self, rows: np.ndarray, cols: np.ndarray, relations: np.ndarray):
+        order = np.argsort(rows, kind="stable")
+        counts = np.bincount(rows, minlength=len(self.node_ids))
+        indptr = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return indptr, cols[order], relations[order]
+
+    def relation_codes(self, relations: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        if not relations:
+            return None
+        return np.array([self.relation_index[r] for r in relations if r in self.relation_index], dtype=np.int16)
+
+    def neighbors(self, node_id: str, relations: Optional[Iterable[str]] = None,
+                  direction: str = "both") -> List[Dict]:
+        """回傳單一節點的直接鄰居 [{id, relation, direction}]"""
+        idx = self.node_index.get(node_id)
+        if idx is None:
+            return []
+        codes = self.relation_codes(relations)
+        result = []
+        for name, indptr, indices, rels in self._directions(direction):
+            start, end = indptr[idx], indptr[idx + 1]
+            for nbr, rel in zip(indices[start:end], rels[start:end]):
+                if codes is not None and rel not in codes:
+                    continue
+                result.append({
+                    "id": self.node_ids[nbr],
+                    "relation": self.relation_types[rel],
+                    "direction": name
+                })
+        return result
+
+    def _directions(self, direction: str):
+        if direction in ("out", "both"):
+            yield "out", self.out_indptr, self.out_indices, self.out_relations
+        if direction in ("in", "both"):
+            yield "in", self.in_indptr, self.in_indices, self.in_relations
+
+    def expand(self, seeds: Dict[str, float], hops: int = 1, relations: Optional[Iterable[str]] = None,
+               decay: float = 0.5, direction: str = "both") -> Dict[str, Dict]:
+        """
+        從種子節點沿邊擴展 k 跳，每跳分數乘上 decay，同一節點保留最高分。
+        回傳 {node_id: {"score", "hop", "via"}}，via 為到達此節點的 (前一節點, 關係)。
+        """
+        codes = self.relation_codes(relations)
+        best: Dict[int, Dict] = {}
+        frontier: Dict[int, float] = {}
+        for node_id, score in seeds.items():
+            idx = self.node_index.get(node_id)
+            if idx is None:
+                continue
+            if idx not in best or score > best[idx]["score"]:
+                best[idx] = {"score": score, "hop": 0, "via": None}
+                frontier[idx] = score
+
+        for hop in range(1, hops + 1):
+            next_frontier: Dict[int, float] = {}
+            for idx, score in frontier.items():
+                new_score = score * decay
+                for _, indptr, indices, rels in self._directions(direction):
+                    start, end = indptr[idx], indptr[idx + 1]
+                    nbrs, nbr_rels = indices[start:end], rels[start:end]
+                    if codes is not None:
+                        mask = np.isin(nbr_rels, codes)
+                        nbrs, nbr_rels = nbrs[mask], nbr_rels[mask]
+                    for nbr, rel in zip(nbrs.tolist(), nbr_rels.tolist()):
+                        if nbr in best and best[nbr]["score"] >= new_score:
+                            continue
+                        best[nbr] = {
+                            "score": new_score,
+                            "hop": hop,
+                            "via": (self.node_ids[idx], self.relation_types[rel])
+                        }
+                        next_frontier[nbr] = new_score
+            frontier = next_frontier
+            if not frontier:
+                break
+
+        return {self.node_ids[idx]: info for idx, info in best.items()}
+
+
+def select_per_hop(expanded: Dict[str, Dict], top_k: int, per_hop: int) -> List[str]:
+    """
+    依分數挑出 top_k 個節點，但每一跳（hop >= 1）先保留 per_hop 個名額。
+    擴展節點的分數一定低於種子，只依分數排序時多跳的答案幾乎都會被截掉。
+    """
+    by_hop: Dict[int, List[str]] = {}
+    for node_id, info in sorted(expanded.items(), key=lambda x: x[1]["score"], reverse=True):
+        by_hop.setdefault(info["hop"], []).append(node_id)
+
+    chosen: List[str] = []
+    # 由最遠的一跳開始保留，名額不足時優先保住最遠的結果
+    for hop in sorted((h for h in by_hop if h > 0), reverse=True):
+        for node_id in by_hop[hop][:per_hop]:
+            if len(chosen) < top_k:
+                chosen.append(node_id)
+    for node_id, _ in sorted(expanded.items(), key=lambda x: x[1]["score"], reverse=True):
+        if len(chosen) >= top_k:
+            break
+        if node_id not in chosen:
+            chosen.append(node_id)
+    return sorted(chosen, key=lambda node_id: expanded[node_id]["score"], reverse=True)
+
+
+# === 查詢輔助 ===
+RELATION_KEYWORDS = {
+    "supplies": ["供應", "供貨", "來源", "客戶", "supplier", "supplies", "supply", "customer"],
+    "collaborates_with": ["合作", "夥伴", "partner", "collaborat"],
+    "competes_with": ["競爭", "對手", "compet", "rival"],
+}
+# supplies 邊一律為「供應方 → 使用方」：問供應商要沿入邊走，問客戶（供應給誰）要沿出邊走
+CUSTOMER_PATTERN = re.compile(r"客戶|買家|供應給|賣給|供應(哪些|哪家|誰)|customer|buyer|supplied to|supply to|supplies to|who does .* supply")
+
+
+def infer_relation_filter(query: str) -> Optional[List[str]]:
+    """依查詢中的關鍵字推測要沿著哪些關係擴展，無法判斷時回傳 None（不過濾）"""
+    lowered = query.lower()
+    relations = [
+        relation for relation, keywords in RELATION_KEYWORDS.items()
+        if any(k in lowered for k in keywords)
+    ]
+    return relations or None
+
+
+def infer_direction(query: str, relations: Optional[List[str]]) -> str:
+    """
+    只沿著 supplies 擴展時依問題決定方向：預設問「誰供應」→ in，提到客戶 → out。
+    合作、競爭是對稱關係（邊的方向只代表是誰的描述提到對方），其他情況一律 both。
+    """
+    if relations != ["supplies"]:
+        return "both"
+    return "out" if CUSTOMER_PATTERN.search(query.lower()) else "in"
+
+
+def find_mentioned_nodes(query: str, graph_index: GraphIndex) -> List[str]:
+    """查詢中直接提到的節點名稱（不分大小寫）"""
+    lowered = query.lower()
+    return [node_id for node_id in graph_index.node_ids if node_id.lower() in lowered]
@@ -0,0 +1,59 @@
+from typing import List, Tuple, Callable
+
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+# === 混合檢索設定（RAG 對話腳本與 MCP 伺服器共用）===
+RRF_K = 60
+HYBRID_CANDIDATES = 20        # 每個來源進入 RRF 的候選數
+LEXICAL_DECISIVE_RATIO = 2.0  # 第一名 BM25 分數 >= 第二名的幾倍視為決定性命中
+MODES = ("vector", "lexical", "hybrid")
+
+Hits = List[Tuple[int, float]]
+# (查詢串列, 每筆候選數) -> 每筆查詢的 [(文件索引, 分數)]；多筆查詢可合併成一次 embedding 請求
+VectorRanker = Callable[[List[str], int], List[Hits]]
+
+
+def is_decisive_lexical_hit(query: str, lexical_index: LexicalIndex, hits: Hits) -> bool:
+    """
+    精確名稱查詢（例如 "VoltForge"）：所有 token 都命中，且第一名明顯領先第二名，
+    此時不需要再呼叫 embedding API。
+    """
+    if not hits or not lexical_index.matched_all_terms(query):
+        return False
+    if len(hits) == 1:
+        return True
+    return hits[0][1] >= LEXICAL_DECISIVE_RATIO * hits[1][1]
+
+
+def hybrid_search_batch(queries: List[str], lexical_index: LexicalIndex, vector_ranker: VectorRanker,
+                        top_k: int = 5, mode: str = "hybrid") -> List[Hits]:
+    """
+    vector：純向量 / lexical：純 BM25 / hybrid：BM25 決定性命中時直接採用，否則與向量以 RRF 融合。
+    只有真正需要向量的查詢才會交給 vector_ranker，且一次全部送出。
+    """
+    if mode not in MODES:
+        raise ValueError(f"未知的檢索模式: {mode}")
+
+    lexical_hits = [lexical_index.search(q, HYBRID_CANDIDATES) for q in queries] if mode != "vector" else [[]] * len(queries)
+    results: List[Hits] = [[] for _ in queries]
+    need_vector = []
+    for i, query in enumerate(queries):
+        if mode == "lexical" or (mode == "hybrid" and is_decisive_lexical_hit(query, lexical_index, lexical_hits[i])):
+            results[i] = lexical_hits[i][:top_k]
+        else:
+            need_vector.append(i)
+
+    if need_vector:
+        rankings = vector_ranker([queries[i] for i in need_vector], HYBRID_CANDIDATES if mode == "hybrid" else top_k)
+        for i, vector_hits in zip(need_vector, rankings):
+            if mode == "vector":
+                results[i] = vector_hits[:top_k]
+            else:
+                fused = reciprocal_rank_fusion([[idx for idx, _ in vector_hits], [idx for idx, _ in lexical_hits[i]]], k=RRF_K)
+                results[i] = fused[:top_k]
+    return results
+
+
+def hybrid_search(query: str, lexical_index: LexicalIndex, vector_ranker: VectorRanker,
+                  top_k: int = 5, mode: str = "hybrid") -> Hits:
+    return hybrid_search_batch([query], lexical_index, vector_ranker, top_k, mode)[0]
@@ -0,0 +1,64 @@
+import sys
+import math
+from pathlib import Path
+from collections import Counter
+from typing import List, Dict, Tuple
+
+# === 斷詞：CJK 字元 bigram + 拉丁字詞（與對話搜尋共用 public/text_tokens.py）===
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "public"))
+from text_tokens import tokenize
+
+
+# === BM25 倒排索引 ===
+class LexicalIndex:
+    def __init__(self, docs: List[Dict], text_key: str = "text", k1: float = 1.5, b: float = 0.75):
+        self.docs = docs
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+
+        for doc_idx, doc in enumerate(docs):
+            counts = Counter(tokenize(doc[text_key]))
+            self.doc_lengths.append(sum(counts.values()))
+            for token, tf in counts.items():
+                self.postings.setdefault(token, []).append((doc_idx, tf))
+
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if docs else 0.0
+        total = len(docs)
+        self.idf = {
+            token: math.log(1 + (total - len(plist) + 0.5) / (len(plist) + 0.5))
+            for token, plist in self.postings.items()
+        }
+
+    def score(self, query: str) -> Dict[int, float]:
+        """回傳 {文件索引: BM25 分數}，只包含至少命中一個 token 的文件"""
+        scores: Dict[int, float] = {}
+        for token in set(tokenize(query)):
+            plist = self.postings.get(token)
+            if not plist:
+                continue
+            idf = self.idf[token]
+            for doc_idx, tf in plist:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_idx] / self.avg_length)
+                scores[doc_idx] = scores.get(doc_idx, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        scores = self.score(query)
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+    def matched_all_terms(self, query: str) -> bool:
+        """查詢中的每個 token 是否都存在於索引"""
+        tokens = tokenize(query)
+        return bool(tokens) and all(token in self.postings for token in tokens)
+
+
+# === Reciprocal Rank Fusion ===
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """多組排名（文件索引串列，依名次排序）融合為單一排名"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_idx in enumerate(ranking, start=1):
+            fused[doc_idx] = fused.get(doc_idx, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
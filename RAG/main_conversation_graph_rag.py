@@ -10,14 +10,31 @@ from typing import List, Dict
 from sklearn.metrics.pairwise import cosine_similarity
 
 from conversation_handler import ConversationHandler
+from chat_metrics import TurnTimer, SessionStats
+from embedding_cache import get_query_embedding, get_embeddings
+from graph_index import GraphIndex, infer_relation_filter, infer_direction, find_mentioned_nodes, select_per_hop
+from context_packer import pack_snippets, pack_history, truncate_summary
 
 # === 設定 ===
 OLLAMA_URL = "http://localhost:11434"
 OLLAMA_CHAT_URL = f"{OLLAMA_URL}/api/chat"
-OLLAMA_EMBED_URL = f"{OLLAMA_URL}/api/embeddings"
 EMBED_MODEL = "shaw/dmeta-embedding-zh"
 GRAPH_PATH = "rag/graph.json"
 
+# === 檢索模式 ===
+# vector: 只用節點描述的向量相似度 / graph: 向量結果再沿 graph.json 的邊擴展
+RETRIEVAL_MODE = "graph"
+GRAPH_HOPS = 2            # 擴展跳數
+GRAPH_SCORE_DECAY = 0.5   # 每跳分數衰減
+GRAPH_SEED_K = 3          # 問題沒有提到節點時，取前幾個向量結果作為擴展種子
+GRAPH_SEED_MIN_RATIO = 0.9   # 向量種子的分數至少要有第一名的這個比例
+GRAPH_DIRECTION = "auto"  # auto（依問題推測）/ out / in / both
+
+# === Prompt 預算 ===
+CONTEXT_CANDIDATES = 5          # 檢索候選數，再依預算挑選
+CONTEXT_TOKEN_BUDGET = 1200     # 系統提示中公司資訊的 token 上限
+HISTORY_TOKEN_BUDGET = 2000     # 對話歷史的 token 上限，超過的舊回合以摘要取代
+
 
 # === 載入圖資料與執行 GraphRAG 查詢 ===
 def load_graph_data() -> Dict:
@@ -25,34 +42,24 @@ def load_graph_data() -> Dict:
         return json.load(f)
 
 
-def get_query_embedding(query: str) -> List[float]:
-    response = requests.post(OLLAMA_EMBED_URL, json={
-        "model": EMBED_MODEL,
-        "prompt": query
-    })
-    response.raise_for_status()
-    return response.json()["embedding"]
-
-
-def graph_rag_retrieve(query: str, top_k=5) -> List[Dict]:
-    graph = load_graph_data()
-    nodes = graph["nodes"]
-    embeddings = []
-
-    for node in nodes:
-        desc = node["description"]
-        response = requests.post(OLLAMA_EMBED_URL, json={
-            "model": EMBED_MODEL,
-            "prompt": desc
-        })
-        response.raise_for_status()
-        node_embedding = response.json()["embedding"]
-        embeddings.append({
-            "node": node,
-            "embedding": node_embedding
-        })
-
-    query_embedding = np.array(get_query_embedding(query))
+_graph_index = None
+
+
+def get_graph_index() -> GraphIndex:
+    """鄰接索引只建立一次，之後的查詢共用"""
+    global _graph_index
+    if _graph_index is None:
+        _graph_index = GraphIndex(load_graph_data())
+    return _graph_index
+
+
+def vector_retrieve(query: str, top_k=5) -> List[Dict]:
+    nodes = get_graph_index().nodes
+    # 節點描述與查詢都經過共用的 embedding 快取，重複查詢不會再呼叫 Ollama
+    node_vectors = get_embeddings([node["description"] for node in nodes], EMBED_MODEL)
+    embeddings = [{"node": node, "embedding": vector} for node, vector in zip(nodes, node_vectors)]
+
+    query_embedding = np.array(get_query_embedding(query, EMBED_MODEL))
     matrix = np.array([np.array(e["embedding"]) for e in embeddings])
     similarities = cosine_similarity([query_embedding], matrix)[0]
 
@@ -60,34 +67,82 @@ def graph_rag_retrieve(query: str, top_k=5) -> List[Dict]:
     return [dict(node=item[0]["node"], score=item[1]) for item in ranked[:top_k]]
 
 
+def graph_expand_retrieve(query: str, top_k=5, hops: int = GRAPH_HOPS, relations: List[str] = None,
+                          direction: str = GRAPH_DIRECTION) -> List[Dict]:
+    """
+    以查詢中直接提到的節點為種子（沒有提到任何節點時才改用向量結果），沿 graph.json 的邊擴展 k 跳。
+    例如「誰供應 DriveMind 的供應商」會從 DriveMind 沿 supplies 關係走兩跳，不需要額外的 LLM 回合。
+    種子之外的名額平均分給每一跳。
+    """
+    graph_index = get_graph_index()
+    if relations is None:
+        relations = infer_relation_filter(query)
+    if direction == "auto":
+        direction = infer_direction(query, relations)
+
+    # 提到的節點就是問題的主體；這時向量結果多半只是描述相似的公司，當種子只會佔掉擴展結果的名額
+    seeds = {node_id: 1.0 for node_id in find_mentioned_nodes(query, graph_index)}
+    if not seeds:
+        candidates = vector_retrieve(query, GRAPH_SEED_K)
+        top_score = float(candidates[0]["score"]) if candidates else 0.0
+        seeds = {item["node"]["id"]: float(item["score"]) for item in candidates
+                 if float(item["score"]) >= top_score * GRAPH_SEED_MIN_RATIO}
+
+    expanded = graph_index.expand(seeds, hops=hops, relations=relations,
+                                  decay=GRAPH_SCORE_DECAY, direction=direction)
+    per_hop = max(1, (top_k - len(seeds)) // max(hops, 1))
+    return [
+        dict(node=graph_index.nodes[graph_index.node_index[node_id]],
+             score=expanded[node_id]["score"], hop=expanded[node_id]["hop"], via=expanded[node_id]["via"])
+        for node_id in select_per_hop(expanded, top_k, per_hop)
+    ]
+
+
+def graph_rag_retrieve(query: str, top_k=5, mode: str = RETRIEVAL_MODE) -> List[Dict]:
+    if mode == "vector":
+        return vector_retrieve(query, top_k)
+    if mode == "graph":
+        return graph_expand_retrieve(query, top_k)
+    raise ValueError(f"未知的檢索模式: {mode}")
+
+
+def format_context_entry(item: Dict) -> str:
+    line = f"[{item['node']['id']}]: {item['node']['description']}"
+    if item.get("via"):
+        prev_id, relation = item["via"]
+        line += f"\n（關聯：{prev_id} -[{relation}]- {item['node']['id']}，距離 {item['hop']} 跳）"
+    return line
+
+
 # === 對話控制器 ===
 class ConversationController:
     def __init__(self, model="qwen2.5:3b"):
         self.model = model
         self.conversation_handler = ConversationHandler()
         self.conversation_id = self.conversation_handler.new_conversation(model)
+        self.session_stats = SessionStats()
         print(f"🆕 Started new conversation with ID: {self.conversation_id}")
 
     def chat_with_llm(self, user_input: str):
         self.conversation_handler.add_message("user", user_input)
 
         # 🔍 GraphRAG 檢索最相關的公司節點描述
-        context_entries = graph_rag_retrieve(user_input, top_k=5)
-        context_text = "\n\n".join([
-            f"[{item['node']['id']}]: {item['node']['description']}"
-            for item in context_entries
-        ])
+        candidates = graph_rag_retrieve(user_input, top_k=CONTEXT_CANDIDATES)
+        context_entries = pack_snippets(candidates, CONTEXT_TOKEN_BUDGET, text_of=format_context_entry)
+        context_text = "\n\n".join([format_context_entry(item) for item in context_entries])
 
         # 準備 messages 結構（加入系統提示 + 檢索補充）
         messages = [
             {"role": "system", "content": "你是一位對科技產業公司熟悉的助手，請根據以下公司資訊與對話歷史回覆問題。\n\n" + context_text}
         ]
-        messages += [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in self.conversation_handler.get_conversation_history()
-        ]
+        messages += pack_history(
+            self.conversation_handler.get_conversation_history(),
+            HISTORY_TOKEN_BUDGET,
+            summarize=truncate_summary
+        )
 
         try:
+            timer = TurnTimer()
             response = requests.post(
                 OLLAMA_CHAT_URL,
                 headers={"Content-Type": "application/json"},
@@ -106,6 +161,7 @@ class ConversationController:
 
             print("\nAssistant: ", end="", flush=True)
             full_response = ""
+            final_chunk = None
 
             for line in response.iter_lines():
                 if line:
@@ -114,15 +170,19 @@ class ConversationController:
                         if "message" in chunk and "content" in chunk["message"]:
                             content = chunk["message"]["content"]
                             if content:
+                                timer.mark_token()
                                 print(content, end="", flush=True)
                                 full_response += content
                         if chunk.get("done", False):
+                            final_chunk = chunk
                             break
                     except json.JSONDecodeError:
                         continue
 
             print()
-            self.conversation_handler.add_message("assistant", full_response)
+            metrics = timer.finish(final_chunk) if final_chunk else None
+            self.session_stats.add(metrics)
+            self.conversation_handler.add_message("assistant", full_response, metrics=metrics)
 
         except Exception as e:
             print(f"\n❌ Error communicating with Ollama: {e}")
@@ -132,14 +192,16 @@ class ConversationController:
 if __name__ == "__main__":
     ctrl = ConversationController(model="qwen2.5:3b")
 
-    print("\n✅ GraphRAG 模式啟動：直接輸入問題開始對話")
+    print("\n✅ GraphRAG 模式啟動：直接輸入問題開始對話（/stats 顯示延遲統計）")
 
     while True:
         try:
             user_input = input("\nYou: ").strip()
-            if user_input:
+            if user_input == "/stats":
+                print(ctrl.session_stats.format())
+            elif user_input:
                 ctrl.chat_with_llm(user_input)
         except KeyboardInterrupt:
             print("\n🛑 KeyboardInterrupt detected")
-            ctrl.conversation_handler.save_conversation()
+            ctrl.conversation_handler.close()
             break
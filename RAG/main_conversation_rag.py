@@ -1,44 +1,114 @@
 import os
 import json
 import numpy as np
-import requests
 from sklearn.metrics.pairwise import cosine_similarity
 from typing import List, Dict
 
-OLLAMA_URL = "http://localhost:11434/api/embeddings"
+from lexical_index import LexicalIndex
+from hybrid_search import hybrid_search
+from embedding_cache import get_query_embedding, format_cache_stats
+from quantized_store import QuantizedVectorStore, QUANTIZED_PREFIX
+from reranker import create_reranker
+
 OLLAMA_MODEL = "shaw/dmeta-embedding-zh"
 EMBEDDING_PATH = "rag/embeddings.json"
 
+# === 檢索模式 ===
+# vector: 純向量相似度 / lexical: 純 BM25 / hybrid: BM25 + 向量以 RRF 融合（設定見 hybrid_search.py）
+RETRIEVAL_MODE = "hybrid"
+
+# === 向量後端 ===
+# float: 直接以 embeddings.json 的浮點向量計算 / int8: 只載入 rag/embeddings_q8.npz 做量化掃描
+# （npz 不存在或 embeddings.json 已變更時自動重建；QUANTIZED_KEEP_FLOAT 另存 float 向量（memmap 讀取）
+# 以精確分數重新評分前幾名，關閉後只剩 int8 近似分數）
+VECTOR_BACKEND = "float"
+QUANTIZED_KEEP_FLOAT = True
+
+# === 第二階段重新排序 ===
+RERANKER = None               # None / "ollama" / "cross-encoder"
+RERANK_TOP_N = 20             # 取第一階段前 N 筆交給 reranker
+RERANK_BUDGET_MS = 800        # 超過就沿用第一階段排序
+
 # === 載入 Embedding ===
 def load_rag_embeddings(path: str = EMBEDDING_PATH) -> List[Dict]:
+    """int8 後端只需要段落文字（存在 npz 內），不必把整份浮點向量 JSON 讀進記憶體"""
+    if VECTOR_BACKEND == "int8":
+        return get_quantized_store(path).docs
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-# === 查詢向量 ===
-def get_query_embedding(query: str, model: str = OLLAMA_MODEL) -> List[float]:
-    response = requests.post(OLLAMA_URL, json={
-        "model": model,
-        "prompt": query
-    })
-    response.raise_for_status()
-    return response.json()["embedding"]
+# === 向量排名 ===
+_quantized_store = None
+
+def get_quantized_store(path: str = EMBEDDING_PATH) -> QuantizedVectorStore:
+    global _quantized_store
+    if _quantized_store is None:
+        _quantized_store = QuantizedVectorStore.load_or_build(path, QUANTIZED_PREFIX, QUANTIZED_KEEP_FLOAT)
+    return _quantized_store
+
+def vector_ranking(query: str, embeddings: List[Dict], top_n: int):
+    """回傳 [(embeddings 索引, 分數)]，依 VECTOR_BACKEND 選擇 float 或 int8 掃描"""
+    query_vec = np.array(get_query_embedding(query, OLLAMA_MODEL))
+    if VECTOR_BACKEND == "int8":
+        return get_quantized_store().search(query_vec, top_n)
 
-# === Top-K 相似搜尋 ===
-def search_top_k(query: str, embeddings: List[Dict], top_k=5) -> List[Dict]:
-    query_vec = np.array(get_query_embedding(query))
     all_vecs = np.array([e["embedding"] for e in embeddings])
     scores = cosine_similarity([query_vec], all_vecs)[0]
+    order = np.argsort(-scores)[:top_n]
+    return [(int(idx), float(scores[idx])) for idx in order]
+
+# === Top-K 相似搜尋 ===
+def search_top_k(query: str, embeddings: List[Dict], top_k=5) -> List[Dict]:
+    return [dict(embeddings[idx], score=score) for idx, score in vector_ranking(query, embeddings, top_k)]
+
+# === BM25 / 混合檢索 ===
+def build_lexical_index(embeddings: List[Dict]) -> LexicalIndex:
+    return LexicalIndex(embeddings)
+
+def search_lexical(query: str, embeddings: List[Dict], lexical_index: LexicalIndex, top_k=5) -> List[Dict]:
+    return [dict(embeddings[idx], score=score) for idx, score in lexical_index.search(query, top_k)]
+
+def search_hybrid(query: str, embeddings: List[Dict], lexical_index: LexicalIndex, top_k=5) -> List[Dict]:
+    ranker = lambda queries, top_n: [vector_ranking(q, embeddings, top_n) for q in queries]
+    return [dict(embeddings[idx], score=score) for idx, score in hybrid_search(query, lexical_index, ranker, top_k)]
+
+_reranker = None
+
+def get_reranker():
+    global _reranker
+    if _reranker is None and RERANKER:
+        _reranker = create_reranker(RERANKER, budget_ms=RERANK_BUDGET_MS)
+    return _reranker
+
+def retrieve(query: str, embeddings: List[Dict], lexical_index: LexicalIndex = None,
+             top_k=5, mode: str = RETRIEVAL_MODE) -> List[Dict]:
+    reranker = get_reranker()
+    if reranker is None:
+        return first_stage_retrieve(query, embeddings, lexical_index, top_k, mode)
+    candidates = first_stage_retrieve(query, embeddings, lexical_index, max(top_k, RERANK_TOP_N), mode)
+    return reranker.rerank(query, candidates, top_k)
 
-    ranked = sorted(zip(embeddings, scores), key=lambda x: x[1], reverse=True)
-    return [dict(item[0], score=item[1]) for item in ranked[:top_k]]
+def first_stage_retrieve(query: str, embeddings: List[Dict], lexical_index: LexicalIndex = None,
+                         top_k=5, mode: str = RETRIEVAL_MODE) -> List[Dict]:
+    if mode == "vector":
+        return search_top_k(query, embeddings, top_k)
+    if lexical_index is None:
+        lexical_index = build_lexical_index(embeddings)
+    if mode == "lexical":
+        return search_lexical(query, embeddings, lexical_index, top_k)
+    if mode == "hybrid":
+        return search_hybrid(query, embeddings, lexical_index, top_k)
+    raise ValueError(f"未知的檢索模式: {mode}")
 
 # === 範例執行 ===
 if __name__ == "__main__":
     embeddings_data = load_rag_embeddings()
+    lexical_index = build_lexical_index(embeddings_data)
     question = "哪間廠商同時有相機與感測器？"
-    top_matches = search_top_k(question, embeddings_data)
+    top_matches = retrieve(question, embeddings_data, lexical_index)
 
-    print(f"\n🔍 查詢：「{question}」\n")
+    print(f"\n🔍 查詢（{RETRIEVAL_MODE}）：「{question}」\n")
     for i, match in enumerate(top_matches, 1):
         print(f"#{i} 📝 {match['source']} ({match['score']:.3f})")
         print(f"{match['text']}\n")
+    print(format_cache_stats())
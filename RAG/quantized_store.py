@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from typing import List, Dict, Tuple, Optional
+
+EMBEDDING_PATH = "rag/embeddings.json"
+QUANTIZED_PREFIX = "rag/embeddings_q8"  # 產生 {prefix}.npz（int8 + 段落文字），選用 {prefix}.f32.npy（重新評分用）
+SCAN_BLOCK = 8192      # 量化掃描每批列數，避免一次展開整個矩陣
+RESCORE_FACTOR = 4     # 以 top_k * RESCORE_FACTOR 個候選做 float 重新評分
+HASH_BLOCK = 1 << 20   # 計算 embeddings.json 雜湊時每次讀取的位元組數
+
+
+def file_hash(path: str) -> str:
+    """embeddings.json 的內容雜湊（分塊讀取，不需要把浮點向量解析進記憶體）"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# === int8 純量量化向量庫 ===
+class QuantizedVectorStore:
+    """
+    向量先正規化為單位長度（內積 = cosine），每個維度以 min/max 線性映射到 int8：
+        x ≈ code * scale + offset
+    查詢時 q·x ≈ codes @ (q * scale) + q·offset。
+    預設只保留 int8 codes 與段落文字（docs，不含 embedding）；keep_float 時另存 float32 向量，
+    以 memmap 讀取前幾名做重新評分。
+    """
+
+    def __init__(self, codes: np.ndarray, scale: np.ndarray, offset: np.ndarray, doc_indices: np.ndarray,
+                 docs: List[Dict] = None, vectors: Optional[np.ndarray] = None, source_hash: str = ""):
+        self.codes = codes              # (N, D) int8
+        self.scale = scale              # (D,) float32
+        self.offset = offset            # (D,) float32
+        self.doc_indices = doc_indices  # 對應 embeddings.json 中的索引
+        self.docs = docs or []          # embeddings.json 的段落（不含 embedding），索引與原檔一致
+        self.vectors = vectors          # (N, D) float32 memmap，選用；None 時不重新評分
+        self.source_hash = source_hash  # 建立時 embeddings.json 的雜湊，用來判斷是否過期
+
+    @classmethod
+    def from_embeddings(cls, docs: List[Dict], keep_float: bool = False,
+                        source_hash: str = "") -> "QuantizedVectorStore":
+        doc_indices = np.array([i for i, d in enumerate(docs) if d.get("embedding") is not None], dtype=np.int64)
+        vectors = np.array([docs[i]["embedding"] for i in doc_indices], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        scale = np.maximum((high - low) / 255.0, 1e-12).astype(np.float32)
+        codes = np.clip(np.round((vectors - low) / scale) - 128, -128, 127).astype(np.int8)
+        offset = (low + 128 * scale).astype(np.float32)
+        texts = [{k: v for k, v in d.items() if k != "embedding"} for d in docs]
+        return cls(codes, scale, offset, doc_indices, texts, vectors if keep_float else None, source_hash)
+
+    def save(self, prefix: str = QUANTIZED_PREFIX):
+        np.savez(f"{prefix}.npz", codes=self.codes, scale=self.scale, offset=self.offset,
+                 doc_indices=self.doc_indices, docs=json.dumps(self.docs, ensure_ascii=False),
+                 source_hash=self.source_hash, count=len(self.docs))
+        float_path = f"{prefix}.f32.npy"
+        if self.vectors is not None:
+            np.save(float_path, np.asarray(self.vectors))
+        elif os.path.exists(float_path):
+            os.remove(float_path)  # 舊的 float 檔與新的 codes 對不上
+
+    @classmethod
+    def load(cls, prefix: str = QUANTIZED_PREFIX) -> "QuantizedVectorStore":
+        data = np.load(f"{prefix}.npz", allow_pickle=False)
+        float_path = f"{prefix}.f32.npy"
+        # float 向量只在重新評分時讀取少數幾列，用 memmap 不佔記憶體
+        vectors = np.load(float_path, mmap_mode="r") if os.path.exists(float_path) else None
+        docs = json.loads(str(data["docs"]))
+        if int(data["count"]) != len(docs):
+            raise ValueError(f"{prefix}.npz 段落數不一致")
+        return cls(data["codes"], data["scale"], data["offset"], data["doc_indices"],
+                   docs, vectors, str(data["source_hash"]))
+
+    @classmethod
+    def load_or_build(cls, embedding_path: str = EMBEDDING_PATH, prefix: str = QUANTIZED_PREFIX,
+                      keep_float: bool = False) -> "QuantizedVectorStore":
+        """
+        讀取 {prefix}.npz；檔案不存在、格式不符、embeddings.json 已經改變（雜湊不同），
+        或要求 keep_float 但先前沒有存 float 向量時，從 embeddings.json 重新量化並覆寫。
+        embeddings.json 不存在時直接沿用 npz。
+        """
+        source_hash = file_hash(embedding_path) if os.path.exists(embedding_path) else None
+        if os.path.exists(f"{prefix}.npz") or source_hash is None:
+            try:
+                store = cls.load(prefix)
+                if source_hash is None:
+                    return store
+                if store.source_hash != source_hash:
+                    print(f"🔄 {embedding_path} 已變更，重新建立量化索引")
+                elif keep_float and store.vectors is None:
+                    print(f"🔄 {prefix}.npz 沒有 float 向量，重新建立量化索引以便重新評分")
+                else:
+                    return store
+            except (KeyError, ValueError) as e:
+                if source_hash is None:
+                    raise
+                print(f"🔄 無法讀取 {prefix}.npz（{e}），重新建立量化索引")
+
+        with open(embedding_path, "r", encoding="utf-8") as f:
+            store = cls.from_embeddings(json.load(f), keep_float, source_hash)
+        store.save(prefix)
+        return cls.load(prefix)  # 重新讀取，float 向量改為 memmap，釋放建立時的完整矩陣
+
+    def approximate_scores(self, query_vec: np.ndarray) -> np.ndarray:
+        q = np.asarray(query_vec, dtype=np.float32)
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        q_scaled = q * self.scale
+        bias = float(q @ self.offset)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), SCAN_BLOCK):
+            block = self.codes[start:start + SCAN_BLOCK].astype(np.float32)
+            scores[start:start + SCAN_BLOCK] = block @ q_scaled + bias
+        return scores
+
+    def search(self, query_vec, top_k: int = 5, rescore: bool = True) -> List[Tuple[int, float]]:
+        """回傳 [(embeddings.json 索引, 分數)]；沒有 float 向量時不重新評分"""
+        if len(self.codes) == 0:
+            return []
+        rescore = rescore and self.vectors is not None
+        scores = self.approximate_scores(query_vec)
+        n_candidates = min(len(scores), top_k * RESCORE_FACTOR if rescore else top_k)
+        candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+
+        if rescore:
+            q = np.asarray(query_vec, dtype=np.float32)
+            q = q / max(float(np.linalg.norm(q)), 1e-12)
+            candidates = np.sort(candidates)  # memmap 依序讀取較快
+            exact = np.asarray(self.vectors[candidates]) @ q
+            order = np.argsort(-exact)[:top_k]
+            return [(int(self.doc_indices[candidates[i]]), float(exact[i])) for i in order]
+
+        order = candidates[np.argsort(-scores[candidates])][:top_k]
+        return [(int(self.doc_indices[i]), float(scores[i])) for i in order]
+
+    def memory_bytes(self) -> Dict[str, int]:
+        n, d = self.codes.shape
+        return {
+            "json_float_list": n * d * 32,  # Python list：8 bytes 指標 + 24 bytes float 物件
+            "float32_matrix": n * d * 4,
+            "int8_matrix": self.codes.nbytes + self.scale.nbytes + self.offset.nbytes,
+        }
+
+
+# === 報告：記憶體節省與 recall@k 差異 ===
+def recall_report(store: QuantizedVectorStore, exact_vectors: np.ndarray, queries: np.ndarray, k: int = 5) -> Dict:
+    """exact_vectors 為完整精度的正規化向量（只在產生報告時建立），作為 recall 的基準"""
+    recall_plain, recall_rescored = [], []
+    t_exact = t_plain = t_rescored = 0.0
+    for q in queries:
+        q = q / max(float(np.linalg.norm(q)), 1e-12)
+        t0 = time.perf_counter()
+        truth = set(store.doc_indices[np.argsort(-(exact_vectors @ q))[:k]].tolist())
+        t1 = time.perf_counter()
+        plain = {i for i, _ in store.search(q, k, rescore=False)}
+        t2 = time.perf_counter()
+        rescored = {i for i, _ in store.search(q, k, rescore=True)}
+        t3 = time.perf_counter()
+        recall_plain.append(len(truth & plain) / k)
+        recall_rescored.append(len(truth & rescored) / k)
+        t_exact, t_plain, t_rescored = t_exact + t1 - t0, t_plain + t2 - t1, t_rescored + t3 - t2
+
+    n = max(len(queries), 1)
+    return {
+        "k": k,
+        "queries": len(queries),
+        "recall_int8": float(np.mean(recall_plain)) if recall_plain else 0.0,
+        "recall_int8_rescored": float(np.mean(recall_rescored)) if recall_rescored else 0.0,
+        "avg_ms_float": t_exact / n * 1000,
+        "avg_ms_int8": t_plain / n * 1000,
+        "avg_ms_int8_rescored": t_rescored / n * 1000,
+    }
+
+
+def print_report(store: QuantizedVectorStore, report: Dict):
+    memory = store.memory_bytes()
+    print(f"📦 向量數 {store.codes.shape[0]}，維度 {store.codes.shape[1]}")
+    for name, size in memory.items():
+        ratio = memory["json_float_list"] / max(size, 1)
+        print(f"   {name:<16} {size / 2**20:8.2f} MB（{ratio:.1f}x 較小）" if name != "json_float_list"
+              else f"   {name:<16} {size / 2**20:8.2f} MB")
+    print(f"🎯 recall@{report['k']}（{report['queries']} 筆查詢，以完整精度為基準）")
+    print(f"   int8            {report['recall_int8']:.3f}（Δ {report['recall_int8'] - 1:+.3f}）")
+    print(f"   int8 + 重新評分  {report['recall_int8_rescored']:.3f}（Δ {report['recall_int8_rescored'] - 1:+.3f}）")
+    print(f"⏱️ 平均查詢 float {report['avg_ms_float']:.2f} ms / int8 {report['avg_ms_int8']:.2f} ms / "
+          f"int8+rescore {report['avg_ms_int8_rescored']:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把 embeddings.json 量化為 int8 向量庫")
+    parser.add_argument("path", nargs="?", default=EMBEDDING_PATH)
+    parser.add_argument("--keep-float", action="store_true",
+                        help=f"另存 {QUANTIZED_PREFIX}.f32.npy，查詢時以 float 向量重新評分前幾名")
+    args = parser.parse_args()
+    with open(args.path, "r", encoding="utf-8") as f:
+        docs = json.load(f)
+
+    store = QuantizedVectorStore.from_embeddings(docs, keep_float=True, source_hash=file_hash(args.path))
+    exact_vectors = store.vectors
+    if not args.keep_float:
+        store.vectors = None
+    store.save(QUANTIZED_PREFIX)
+    print(f"💾 已儲存 {QUANTIZED_PREFIX}.npz" + (f" / {QUANTIZED_PREFIX}.f32.npy" if args.keep_float else ""))
+
+    # 以語料本身加上少量雜訊作為查詢，估計量化造成的排名差異（報告同時比較有無重新評分）
+    store.vectors = exact_vectors
+    rng = np.random.default_rng(0)
+    sample = exact_vectors[rng.choice(len(exact_vectors), min(200, len(exact_vectors)), replace=False)]
+    queries = sample + rng.normal(0, 0.01, sample.shape).astype(np.float32)
+    print_report(store, recall_report(store, exact_vectors, queries, k=5))
@@ -0,0 +1,162 @@
+import re
+import json
+import time
+import hashlib
+import threading
+import requests
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Dict, Optional
+
+from embedding_cache import normalize_text
+
+OLLAMA_CHAT_URL = "http://localhost:11434/api/chat"
+RERANK_LLM_MODEL = "qwen2.5:3b"
+CROSS_ENCODER_MODEL = "BAAI/bge-reranker-base"
+RERANK_BUDGET_MS = 800       # 超過預算就回退到第一階段排序
+RERANK_CACHE_SIZE = 4096     # (query, doc) 分數快取筆數
+PASSAGE_MAX_CHARS = 300      # LLM 評分時每段最多帶入的字數
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="reranker")
+
+
+def passage_key(text: str) -> str:
+    """以段落內容（正規化後的雜湊）當快取鍵；paragraph_id 是位置編號，重新索引後會指向別的段落"""
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+# === 第二階段重新排序 ===
+class Reranker(ABC):
+    """
+    對第一階段的前 N 筆候選重新評分。
+    評分在背景執行緒進行，超過 budget_ms 就放棄並沿用第一階段順序；
+    逾時的評分完成後仍會寫入快取，下次相同 (query, doc) 可直接使用。
+    同一個 reranker 同時只會有一個評分工作：上一個逾時的工作還沒結束時，直接沿用第一階段排序，
+    不會在執行緒池裡越堆越多。
+    """
+
+    def __init__(self, budget_ms: float = RERANK_BUDGET_MS, cache_size: int = RERANK_CACHE_SIZE):
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self.cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.fallbacks = 0
+        self.pending = None          # 進行中的評分工作（Future）
+
+    @abstractmethod
+    def score_batch(self, query: str, texts: List[str], timeout: float) -> List[float]:
+        """回傳每段文字對 query 的相關分數，順序與 texts 相同"""
+
+    def _cache_get(self, key):
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        return None
+
+    def _cache_put(self, key, score: float):
+        with self.lock:
+            self.cache[key] = score
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def rerank(self, query: str, candidates: List[Dict], top_k: int = 5, text_key: str = "text") -> List[Dict]:
+        started = time.perf_counter()
+        query_key = normalize_text(query)
+        keys = [(query_key, passage_key(c[text_key])) for c in candidates]
+        scores: List[Optional[float]] = [self._cache_get(key) for key in keys]
+        missing = [i for i, s in enumerate(scores) if s is None]
+
+        if missing:
+            with self.lock:
+                busy = self.pending is not None and not self.pending.done()
+                if not busy:
+                    remaining = self.budget_ms / 1000 - (time.perf_counter() - started)
+                    texts = [candidates[i][text_key] for i in missing]
+                    future = self.pending = _executor.submit(self.score_batch, query, texts, max(remaining, 0.01))
+            if busy:
+                self.fallbacks += 1
+                print("⏳ 上一次 Rerank 仍在進行，沿用第一階段排序")
+                return candidates[:top_k]
+
+            def remember(done):
+                if done.exception() is None:
+                    for i, score in zip(missing, done.result()):
+                        self._cache_put(keys[i], score)
+
+            future.add_done_callback(remember)
+            try:
+                fresh = future.result(timeout=max(remaining, 0))
+                for i, score in zip(missing, fresh):
+                    scores[i] = score
+            except FutureTimeout:
+                self.fallbacks += 1
+                print(f"⏱️ Rerank 超過 {self.budget_ms:.0f} ms，沿用第一階段排序")
+                return candidates[:top_k]
+            except Exception as e:
+                self.fallbacks += 1
+                print(f"⚠️ Rerank 失敗，沿用第一階段排序: {e}")
+                return candidates[:top_k]
+
+        ranked = sorted(zip(candidates, scores), key=lambda x: x[1], reverse=True)
+        return [dict(c, first_stage_score=c.get("score"), score=s) for c, s in ranked[:top_k]]
+
+
+class CrossEncoderReranker(Reranker):
+    """本機 cross-encoder（需要 sentence-transformers），模型在第一次使用時才載入"""
+
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL, **kwargs):
+        super().__init__(**kwargs)
+        self.model_name = model_name
+        self.model = None
+        self.model_lock = threading.Lock()
+
+    def score_batch(self, query: str, texts: List[str], timeout: float) -> List[float]:
+        with self.model_lock:
+            if self.model is None:
+                from sentence_transformers import CrossEncoder
+                self.model = CrossEncoder(self.model_name)
+        return [float(s) for s in self.model.predict([(query, t) for t in texts])]
+
+
+class OllamaReranker(Reranker):
+    """一次 LLM 呼叫為所有候選打 0~10 分"""
+
+    PROMPT = (
+        "請評估每段文字對回答問題的相關程度，0 分表示無關，10 分表示完全能回答。\n"
+        "只輸出 JSON 物件，格式為 {{\"scores\": [每段的分數，依段落編號順序]}}。\n\n"
+        "問題：{query}\n\n{passages}"
+    )
+
+    def __init__(self, model: str = RERANK_LLM_MODEL, **kwargs):
+        super().__init__(**kwargs)
+        self.model = model
+
+    def score_batch(self, query: str, texts: List[str], timeout: float) -> List[float]:
+        passages = "\n".join(f"[{i}] {t[:PASSAGE_MAX_CHARS]}" for i, t in enumerate(texts, 1))
+        response = requests.post(OLLAMA_CHAT_URL, json={
+            "model": self.model,
+            "messages": [{"role": "user", "content": self.PROMPT.format(query=query, passages=passages)}],
+            "stream": False,
+            "format": "json",
+            "options": {"temperature": 0}
+        }, timeout=timeout)
+        response.raise_for_status()
+        content = response.json().get("message", {}).get("content", "")
+        try:
+            scores = json.loads(content).get("scores", [])
+        except (json.JSONDecodeError, AttributeError):
+            scores = [float(x) for x in re.findall(r"-?\d+(?:\.\d+)?", content)]
+        if len(scores) != len(texts):
+            raise ValueError(f"模型回傳 {len(scores)} 個分數，預期 {len(texts)} 個")
+        return [float(s) for s in scores]
+
+
+def create_reranker(kind: str, **kwargs) -> Reranker:
+    if kind == "ollama":
+        return OllamaReranker(**kwargs)
+    if kind == "cross-encoder":
+        return CrossEncoderReranker(**kwargs)
+    raise ValueError(f"未知的 reranker: {kind}")
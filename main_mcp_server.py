@@ -12,6 +12,7 @@ import mcp_server_sub.main_mcp_server_filesystem
 import mcp_server_sub.main_mcp_server_text
 import mcp_server_sub.main_mcp_server_internet
 import mcp_server_sub.main_mcp_server_sqlite
+import mcp_server_sub.main_mcp_server_rag
 
 app = FastAPI()
 
@@ -0,0 +1,151 @@
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+import numpy as np
+from tools_registry import tool
+
+# RAG 模組在 RAG/ 底下，與 RAG 對話腳本共用同一套索引與快取
+RAG_DIR = Path(__file__).resolve().parent.parent / "RAG"
+sys.path.insert(0, str(RAG_DIR))
+
+from embedding_cache import get_query_embedding, get_embeddings, EMBED_MODEL
+from lexical_index import LexicalIndex
+from hybrid_search import hybrid_search_batch
+from graph_index import GraphIndex
+
+EMBEDDING_PATH = RAG_DIR / "RAG" / "embeddings.json"
+GRAPH_PATH = RAG_DIR / "RAG" / "graph.json"
+
+
+# === 常駐索引：伺服器啟動時載入一次，所有請求共用 ===
+class RagIndex:
+    def __init__(self):
+        started = time.perf_counter()
+        with open(EMBEDDING_PATH, "r", encoding="utf-8") as f:
+            self.docs = [d for d in json.load(f) if d.get("embedding") is not None]
+        matrix = np.array([d["embedding"] for d in self.docs], dtype=np.float32)
+        self.matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self.lexical = LexicalIndex(self.docs)
+
+        with open(GRAPH_PATH, "r", encoding="utf-8") as f:
+            self.graph = GraphIndex(json.load(f))
+
+        self.load_ms = (time.perf_counter() - started) * 1000
+        print(f"📚 RAG 索引已載入：{len(self.docs)} 段落、{len(self.graph.node_ids)} 節點（{self.load_ms:.0f} ms）")
+
+    def _vector_rankings(self, queries, top_n: int):
+        """需要向量的查詢合併成一次 embedding 請求與一次矩陣乘法"""
+        vectors = get_embeddings(queries, EMBED_MODEL) if len(queries) > 1 else [get_query_embedding(queries[0], EMBED_MODEL)]
+        q = np.array(vectors, dtype=np.float32)
+        scores = (q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)) @ self.matrix.T
+        return [
+            [(int(idx), float(row[idx])) for idx in np.argsort(-row)[:top_n]]
+            for row in scores
+        ]
+
+    def search_batch(self, queries, top_k: int = 5, mode: str = "hybrid"):
+        """多筆查詢一起處理，檢索邏輯與 RAG 對話腳本共用 hybrid_search"""
+        results = hybrid_search_batch(queries, self.lexical, self._vector_rankings, top_k, mode)
+        return [
+            [dict(source=self.docs[idx]["source"], text=self.docs[idx]["text"], score=score) for idx, score in hits]
+            for hits in results
+        ]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> RagIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = RagIndex()
+    return _index
+
+
+try:
+    get_index()
+except Exception as e:
+    # 索引檔不存在時伺服器仍可啟動，第一次呼叫工具時會再嘗試載入
+    print(f"⚠️ RAG 索引載入失敗: {e}")
+
+
+def format_hits(query, hits):
+    lines = [f"🔍 {query}"]
+    for i, hit in enumerate(hits, 1):
+        lines.append(f"#{i} {hit['source']} ({hit['score']:.3f})\n{hit['text']}")
+    return "\n".join(lines)
+
+
+def parse_queries(queries):
+    """接受 JSON 陣列字串或以換行分隔的多筆查詢"""
+    try:
+        parsed = json.loads(queries)
+        if isinstance(parsed, list):
+            return [str(q).strip() for q in parsed if str(q).strip()]
+    except (json.JSONDecodeError, TypeError):
+        pass
+    return [q.strip() for q in str(queries).splitlines() if q.strip()]
+
+
+@tool(
+    name="rag_search",
+    description="📚 在公司知識庫中搜尋相關段落（BM25 + 向量混合檢索）",
+    parameters={"query": "查詢文字", "top_k": "回傳筆數（預設 5）", "mode": "檢索模式 hybrid / vector / lexical（預設 hybrid）"},
+    returns="相關段落與分數"
+)
+def rag_search(query, top_k="5", mode="hybrid"):
+    try:
+        hits = get_index().search_batch([query], int(top_k), mode)[0]
+        return format_hits(query, hits)
+    except Exception as e:
+        return f"❌ 知識庫搜尋失敗: {str(e)}"
+
+
+@tool(
+    name="rag_search_batch",
+    description="📚 一次搜尋多個問題（共用一次 embedding 請求）",
+    parameters={"queries": "JSON 陣列或以換行分隔的多筆查詢", "top_k": "每筆回傳筆數（預設 5）", "mode": "檢索模式 hybrid / vector / lexical（預設 hybrid）"},
+    returns="每個查詢的相關段落"
+)
+def rag_search_batch(queries, top_k="5", mode="hybrid"):
+    try:
+        query_list = parse_queries(queries)
+        if not query_list:
+            return "❌ 沒有任何查詢"
+        results = get_index().search_batch(query_list, int(top_k), mode)
+        return "\n\n".join(format_hits(q, hits) for q, hits in zip(query_list, results))
+    except Exception as e:
+        return f"❌ 知識庫搜尋失敗: {str(e)}"
+
+
+@tool(
+    name="graph_neighbors",
+    description="🕸️ 查詢公司關係圖中某節點 k 跳內的鄰居",
+    parameters={
+        "node": "節點名稱（公司名）",
+        "hops": "擴展跳數（預設 1）",
+        "relation": "只沿指定關係擴展，逗號分隔（supplies, collaborates_with, competes_with；空白為全部）",
+        "direction": "out / in / both（預設 both）"
+    },
+    returns="鄰居節點與關係"
+)
+def graph_neighbors(node, hops="1", relation="", direction="both"):
+    try:
+        graph = get_index().graph
+        if node not in graph.node_index:
+            return f"❌ 找不到節點: {node}"
+        relations = [r.strip() for r in relation.split(",") if r.strip()] or None
+        expanded = graph.expand({node: 1.0}, hops=int(hops), relations=relations, decay=0.5, direction=direction)
+        lines = []
+        for node_id, info in sorted(expanded.items(), key=lambda x: (x[1]["hop"], x[0])):
+            if info["hop"] == 0:
+                continue
+            prev_id, rel = info["via"]
+            lines.append(f"[{info['hop']} 跳] {node_id} ← {prev_id} ({rel})")
+        return "\n".join(lines) if lines else f"ℹ️ {node} 沒有符合條件的鄰居"
+    except Exception as e:
+        return f"❌ 查詢關係圖失敗: {str(e)}"
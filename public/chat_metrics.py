@@ -0,0 +1,107 @@
+import time
+
+NS_PER_MS = 1_000_000
+
+# Fields shown by SessionStats, in display order: (key, label, unit)
+STAT_FIELDS = [
+    ("ttft_ms", "TTFT", "ms"),
+    ("load_ms", "Model load", "ms"),
+    ("prompt_eval_ms", "Prefill", "ms"),
+    ("prompt_tokens", "Prompt tokens", ""),
+    ("eval_ms", "Generation", "ms"),
+    ("eval_tokens", "Output tokens", ""),
+    ("tokens_per_sec", "Output tok/s", ""),
+    ("total_ms", "Turn total", "ms"),
+]
+
+
+def percentile(values, p):
+    """Linear-interpolated percentile (same definition as numpy's default)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def build_turn_metrics(final_chunk, started, first_token_at=None, finished=None):
+    """
+    Combine Ollama's server-side timings from the final stream chunk (nanoseconds)
+    with client-side perf_counter timestamps into one flat dict of milliseconds/counts.
+    """
+    final_chunk = final_chunk or {}
+    finished = finished or time.perf_counter()
+    metrics = {
+        "ttft_ms": round((first_token_at - started) * 1000, 1) if first_token_at else None,
+        "total_ms": round((finished - started) * 1000, 1),
+        "load_ms": round(final_chunk.get("load_duration", 0) / NS_PER_MS, 1),
+        "prompt_eval_ms": round(final_chunk.get("prompt_eval_duration", 0) / NS_PER_MS, 1),
+        "prompt_tokens": final_chunk.get("prompt_eval_count", 0),
+        "eval_ms": round(final_chunk.get("eval_duration", 0) / NS_PER_MS, 1),
+        "eval_tokens": final_chunk.get("eval_count", 0),
+    }
+    metrics["tokens_per_sec"] = (
+        round(metrics["eval_tokens"] / (metrics["eval_ms"] / 1000), 1) if metrics["eval_ms"] else None
+    )
+    return metrics
+
+
+def format_turn(metrics, label=None):
+    """One-line summary of a single turn"""
+    ttft = f"{metrics['ttft_ms']:.0f} ms" if metrics.get("ttft_ms") is not None else "-"
+    tps = f"{metrics['tokens_per_sec']:.1f}" if metrics.get("tokens_per_sec") is not None else "-"
+    prefix = f"[{label}] " if label else ""
+    return (f"⏱️ {prefix}TTFT {ttft} | load {metrics['load_ms']:.0f} ms | "
+            f"prefill {metrics['prompt_tokens']} tok / {metrics['prompt_eval_ms']:.0f} ms | "
+            f"gen {metrics['eval_tokens']} tok @ {tps} tok/s | total {metrics['total_ms']:.0f} ms")
+
+
+class TurnTimer:
+    """Client-side timestamps for one streamed turn"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token_at = None
+
+    def mark_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def finish(self, final_chunk):
+        return build_turn_metrics(final_chunk, self.started, self.first_token_at)
+
+
+class SessionStats:
+    """Per-turn metrics collected over a session, with percentile summaries"""
+
+    def __init__(self):
+        self.turns = []
+
+    def add(self, metrics):
+        if metrics:
+            self.turns.append(metrics)
+
+    def summary(self):
+        result = {"turns": len(self.turns)}
+        for key, _, _ in STAT_FIELDS:
+            values = [t[key] for t in self.turns if t.get(key) is not None]
+            result[key] = {
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "mean": sum(values) / len(values) if values else 0.0,
+                "max": max(values) if values else 0.0,
+            }
+        return result
+
+    def format(self, title="Session stats"):
+        if not self.turns:
+            return "📊 No completed turns yet"
+        summary = self.summary()
+        lines = [f"📊 {title} ({summary['turns']} turns)", f"{'':<15}{'p50':>10}{'p95':>10}{'mean':>10}{'max':>10}"]
+        for key, label, unit in STAT_FIELDS:
+            s = summary[key]
+            lines.append(f"{label:<15}" + "".join(f"{s[col]:>10.1f}" for col in ("p50", "p95", "mean", "max"))
+                         + (f" {unit}" if unit else ""))
+        return "\n".join(lines)
@@ -0,0 +1,254 @@
+import os
+import io
+import re
+import gzip
+import json
+import time
+
+from conversation_store import (
+    read_jsonl_conversation,
+    parse_jsonl_records,
+    parse_markdown_conversation,
+    dump_jsonl_records,
+    summary_path,
+    read_summary,
+)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_DIR = "archive"
+ARCHIVE_AFTER_DAYS = 30
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 9
+SEGMENT_PATTERN = re.compile(r"segment_(\d+)\.jsonl\.(gz|zst)$")
+INDEX_SUFFIX = ".idx"   # sidecar next to each segment: one JSON line per archived (or forgotten) conversation
+
+
+def compress(data, codec):
+    if codec == "zst":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    # mtime=0 keeps members byte-identical for identical input
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def decompress(data, codec):
+    if codec == "zst":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read .zst archive segments")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class ConversationArchive:
+    """
+    Packs old conversations into compressed segment files.
+    Every conversation is its own compressed member (gzip member / zstd frame), so one can be read
+    by seeking to its offset without touching the rest of the segment. The offset index lives in
+    the catalog database next to the conversation metadata, and every segment has a sidecar
+    <segment>.idx with the same entries, so the index can be rebuilt when catalog.db is recreated.
+    A conversation's rolling-summary cache (<id>.summary.json) is stored in its meta record as
+    "summary" and restored by the handler once the conversation gets a live log again.
+    """
+
+    def __init__(self, base_path, catalog, codec=None):
+        self.base_path = base_path
+        self.archive_path = os.path.join(base_path, ARCHIVE_DIR)
+        self.catalog = catalog
+        self.codec = codec or ("zst" if zstandard is not None else "gz")
+        with catalog.lock:
+            catalog.conn.execute("""
+                CREATE TABLE IF NOT EXISTS archive_index (
+                    id TEXT PRIMARY KEY,
+                    segment TEXT,
+                    offset INTEGER,
+                    length INTEGER
+                )
+            """)
+            catalog.conn.commit()
+
+    def contains(self, conversation_id):
+        return self._lookup(conversation_id) is not None
+
+    def load(self, conversation_id):
+        """Return (meta, messages) for an archived conversation, or None if it is not archived"""
+        location = self._lookup(conversation_id)
+        if location is None:
+            return None
+        segment, offset, length = location
+        with open(os.path.join(self.archive_path, segment), "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        text = decompress(data, SEGMENT_PATTERN.search(segment).group(2)).decode("utf-8")
+        return parse_jsonl_records(io.StringIO(text))
+
+    def rebuild_index(self):
+        """Refill archive_index from the segment sidecars; returns how many conversations are archived"""
+        entries = {}
+        if os.path.isdir(self.archive_path):
+            segments = sorted(name for name in os.listdir(self.archive_path) if SEGMENT_PATTERN.match(name))
+            for segment in segments:
+                for record in self._read_sidecar(segment):
+                    if record.get("forgotten"):
+                        entries.pop(record["id"], None)
+                    else:
+                        entries[record["id"]] = (record["id"], segment, record["offset"], record["length"])
+        with self.catalog.lock:
+            self.catalog.conn.execute("DELETE FROM archive_index")
+            self.catalog.conn.executemany(
+                "INSERT INTO archive_index (id, segment, offset, length) VALUES (?, ?, ?, ?)", list(entries.values())
+            )
+            self.catalog.conn.commit()
+        return len(entries)
+
+    def iter_archived(self):
+        """Yield (conversation_id, meta, messages, segment path) for every archived conversation"""
+        with self.catalog.lock:
+            rows = self.catalog.conn.execute("SELECT id, segment FROM archive_index ORDER BY segment, offset").fetchall()
+        for row in rows:
+            loaded = self.load(row[0])
+            if loaded:
+                yield row[0], loaded[0], loaded[1], os.path.join(self.archive_path, row[1])
+
+    def archive(self, older_than_days=ARCHIVE_AFTER_DAYS, exclude=()):
+        """Move conversations not updated for older_than_days into the archive, returns how many were moved"""
+        cutoff = time.time() - older_than_days * 86400
+        with self.catalog.lock:
+            candidates = self.catalog.conn.execute(
+                "SELECT id, path FROM conversations WHERE updated < ? AND id NOT IN (SELECT id FROM archive_index)",
+                (cutoff,)
+            ).fetchall()
+        candidates = [(row[0], row[1]) for row in candidates if row[0] not in exclude]
+        if not candidates:
+            return 0
+
+        os.makedirs(self.archive_path, exist_ok=True)
+        moved, saved_bytes = [], 0
+        segment, f = self._open_segment()
+        try:
+            for conversation_id, path in candidates:
+                files = self._source_files(conversation_id, path)
+                if not files:
+                    continue
+                meta, messages = self._read_source(files[0])
+                meta = dict(meta, id=conversation_id)
+                summary_file = summary_path(self.base_path, conversation_id)
+                summary = read_summary(summary_file)
+                if summary is not None:
+                    meta["summary"] = summary
+                    files.append(summary_file)
+                data = compress(dump_jsonl_records(meta, messages).encode("utf-8"), self.codec)
+
+                if f.tell() > 0 and f.tell() + len(data) > SEGMENT_MAX_BYTES:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+                    segment, f = self._open_segment(new=True)
+
+                offset = f.tell()
+                f.write(data)
+                moved.append((conversation_id, segment, offset, len(data), files))
+                saved_bytes += sum(os.path.getsize(p) for p in files) - len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+
+        by_segment = {}
+        for cid, seg, offset, length, _ in moved:
+            by_segment.setdefault(seg, []).append({"id": cid, "offset": offset, "length": length})
+        for seg, records in by_segment.items():
+            self._append_sidecar(seg, records)
+
+        # Only drop the originals after the segment and its index are durable
+        with self.catalog.lock:
+            self.catalog.conn.executemany(
+                "INSERT OR REPLACE INTO archive_index (id, segment, offset, length) VALUES (?, ?, ?, ?)",
+                [(cid, seg, offset, length) for cid, seg, offset, length, _ in moved]
+            )
+            self.catalog.conn.executemany(
+                "UPDATE conversations SET path = ? WHERE id = ?",
+                [(os.path.join(self.archive_path, seg), cid) for cid, seg, _, _, _ in moved]
+            )
+            self.catalog.conn.commit()
+        for *_, files in moved:
+            for path in files:
+                os.remove(path)
+
+        print(f"📦 Archived {len(moved)} conversations ({saved_bytes / 1024:.0f} KB saved)")
+        return len(moved)
+
+    def forget(self, conversation_id):
+        """Drop the index entry (the live log took over); the bytes stay until the segment is rewritten"""
+        location = self._lookup(conversation_id)
+        if location is None:
+            return
+        self._append_sidecar(location[0], [{"id": conversation_id, "forgotten": True}])
+        with self.catalog.lock:
+            self.catalog.conn.execute("DELETE FROM archive_index WHERE id = ?", (conversation_id,))
+            self.catalog.conn.commit()
+
+    def _append_sidecar(self, segment, records):
+        with open(os.path.join(self.archive_path, segment + INDEX_SUFFIX), "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read_sidecar(self, segment):
+        path = os.path.join(self.archive_path, segment + INDEX_SUFFIX)
+        if not os.path.exists(path):
+            print(f"Missing archive index {path}; conversations in {segment} cannot be located")
+            return []
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A crash can leave a half-written last line
+                    continue
+        return records
+
+    def _lookup(self, conversation_id):
+        with self.catalog.lock:
+            row = self.catalog.conn.execute(
+                "SELECT segment, offset, length FROM archive_index WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def _open_segment(self, new=False):
+        """Append to the newest segment of the current codec unless it is full (or new=True)"""
+        numbers = []
+        for name in os.listdir(self.archive_path):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                numbers.append((int(match.group(1)), match.group(2), name))
+        numbers.sort()
+        if numbers and not new:
+            number, codec, name = numbers[-1]
+            path = os.path.join(self.archive_path, name)
+            if codec == self.codec and os.path.getsize(path) < SEGMENT_MAX_BYTES:
+                return name, open(path, "ab")
+        number = numbers[-1][0] + 1 if numbers else 1
+        name = f"segment_{number:04d}.jsonl.{self.codec}"
+        return name, open(os.path.join(self.archive_path, name), "ab")
+
+    def _source_files(self, conversation_id, path):
+        """Every plain-text file that holds this conversation; the first one is read"""
+        names = [f"{conversation_id}.jsonl", f"{conversation_id}.md", f"conversation_{conversation_id}.md"]
+        files = [os.path.join(self.base_path, name) for name in names]
+        files = [p for p in files if os.path.exists(p)]
+        if path and os.path.exists(path) and path not in files and not path.startswith(self.archive_path):
+            files.insert(0, path)
+        return files
+
+    @staticmethod
+    def _read_source(path):
+        if path.endswith(".jsonl"):
+            return read_jsonl_conversation(path)
+        with open(path, "r", encoding="utf-8") as f:
+            model_name, _, messages = parse_markdown_conversation(f.read())
+        return {"model": model_name or "unknown", "created": os.path.getctime(path)}, messages
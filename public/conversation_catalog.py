@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+
+CATALOG_NAME = "catalog.db"
+TITLE_MAX_CHARS = 60
+SORT_COLUMNS = {"updated", "created", "message_count", "model", "id"}
+
+
+def make_title(messages, max_chars=TITLE_MAX_CHARS):
+    """Use the first user message (single line, truncated) as the conversation title"""
+    for message in messages:
+        if message["role"] == "user":
+            title = " ".join(message["content"].split())
+            return title if len(title) <= max_chars else title[:max_chars - 1] + "…"
+    return ""
+
+
+class ConversationCatalog:
+    """SQLite index of conversation metadata, so listing never opens conversation files"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                model TEXT,
+                created REAL,
+                updated REAL,
+                message_count INTEGER,
+                title TEXT,
+                path TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated);
+            CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations(created);
+        """)
+        self.conn.commit()
+
+    def upsert(self, conversation_id, model, created, updated, message_count, title, path):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO conversations (id, model, created, updated, message_count, title, path) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (conversation_id, model, created, updated, message_count, title, path)
+            )
+            self.conn.commit()
+
+    def remove(self, conversation_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            self.conn.commit()
+
+    def get(self, conversation_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def list(self, page=1, page_size=20, sort="updated", descending=True):
+        """Return one page of entries; page is 1-based and page_size=None returns everything"""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unknown sort column: {sort}")
+        query = f"SELECT * FROM conversations ORDER BY {sort} {'DESC' if descending else 'ASC'}, id"
+        params = ()
+        if page_size:
+            query += " LIMIT ? OFFSET ?"
+            params = (page_size, (max(page, 1) - 1) * page_size)
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(query, params)]
+
+    def find_prefix(self, prefix, limit=10):
+        """IDs starting with prefix, newest first"""
+        # A range scan instead of LIKE, which SQLite cannot serve from the index
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT * FROM conversations WHERE id >= ? AND id < ? ORDER BY updated DESC LIMIT ?",
+                (prefix, prefix + "\uffff", limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def rebuild(self, entries):
+        """Replace the whole catalog with the given entries (dicts with the column names)"""
+        with self.lock:
+            self.conn.execute("DELETE FROM conversations")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO conversations (id, model, created, updated, message_count, title, path) "
+                "VALUES (:id, :model, :created, :updated, :message_count, :title, :path)",
+                entries
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
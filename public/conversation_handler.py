@@ -1,145 +1,539 @@
 import os
 import datetime
 import re
+import time
+import queue
+import atexit
+import threading
 from pathlib import Path
 
+from conversation_store import (
+    JsonlConversationWriter,
+    read_jsonl_conversation,
+    message_record,
+    parse_markdown_conversation,
+    render_markdown,
+    summary_path,
+    write_summary,
+)
+from conversation_catalog import ConversationCatalog, CATALOG_NAME, make_title
+from conversation_search import ConversationSearchIndex
+from conversation_archive import ConversationArchive, ARCHIVE_AFTER_DAYS
+
+DEBOUNCE_SECONDS = 2.0      # flush a conversation at most this long after its first unsaved message
+FLUSH_EVERY_MESSAGES = 4    # ...or as soon as this many messages are waiting
+
 class ConversationHandler:
-    def __init__(self, base_path="conversations"):
+    def __init__(self, base_path="conversations", storage="jsonl", background=True):
         self.base_path = base_path
+        self.storage = storage  # "jsonl" (append-only) or "markdown" (rewrite on save)
         self.current_id = None
         self.current_conversation = []
         self.model_name = None
-        
+        self.created_at = None
+        self._from_archive = False
+        self._archived_summary = None
+
         # Create conversations directory if it doesn't exist
         os.makedirs(self.base_path, exist_ok=True)
-        
+
+        # Metadata index used by list/prefix lookup; built once from the files if missing
+        self.catalog = ConversationCatalog(os.path.join(self.base_path, CATALOG_NAME))
+        self.search_index = ConversationSearchIndex(self.catalog)
+        self.archive = ConversationArchive(self.base_path, self.catalog)
+        if self.catalog.count() == 0 or self.search_index.is_missing_rows():
+            self.rebuild_catalog()
+
+        # All disk writes (log, catalog, search index) happen on the writer thread;
+        # with background=False they run inline on the caller's thread
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+
+        self._open = {}  # conversation_id -> state owned by the writer
+        self._queue = queue.Queue()
+        self._worker = None
+        if background:
+            self._worker = threading.Thread(target=self._run_writer, name="conversation-writer", daemon=True)
+            self._worker.start()
+        atexit.register(self.close)
+
     def new_conversation(self, model_name):
         """Start a new conversation and save the current one if exists"""
         if self.current_id:
             self.save_conversation()
-            
+            self._submit(("release", self.current_id))
+
         # Generate new conversation ID with timestamp
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         random_hex = os.urandom(4).hex()
         self.current_id = f"{timestamp}_{random_hex}"
         self.current_conversation = []
         self.model_name = model_name
+        self.created_at = datetime.datetime.now().timestamp()
+        self._from_archive = False
+        self._publish("conversation_changed", conversation_id=self.current_id, messages=[])
         return self.current_id
-    
-    def add_message(self, role, content):
-        """Add a message to the current conversation"""
-        self.current_conversation.append({"role": role, "content": content})
-    
+
+    def subscribe(self, callback):
+        """Register callback(event, **data); it runs on the thread that caused the event"""
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._subscribers_lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def _publish(self, event, **data):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event, **data)
+            except Exception as e:
+                print(f"Error in conversation subscriber: {e}")
+
+    def add_message(self, role, content, origin=None, metrics=None):
+        """
+        Add a message to the current conversation; origin tells subscribers which front-end sent it,
+        metrics (see chat_metrics.build_turn_metrics) are stored with the message record
+        """
+        if self._from_archive:
+            # An archived conversation gets a live log again only once it changes
+            if self._archived_summary:
+                # Written before the history manager builds the next turn, so it finds the cache
+                write_summary(summary_path(self.base_path, self.current_id), self._archived_summary)
+            self._submit(("rewrite", self._meta_record(), list(self.current_conversation)))
+            self._from_archive = False
+        message = {"role": role, "content": content}
+        if metrics:
+            message["metrics"] = metrics
+        self.current_conversation.append(message)
+        if self.current_id:
+            self._submit(("append", self._meta_record(), self.current_conversation,
+                          dict(message_record(message), ts=datetime.datetime.now().timestamp())))
+        self._publish(
+            "message_appended",
+            conversation_id=self.current_id,
+            index=len(self.current_conversation) - 1,
+            message=self.current_conversation[-1],
+            origin=origin
+        )
+
     def save_conversation(self):
-        """Save the current conversation to a file"""
+        """Ask the writer to flush the current conversation now (does not wait for the disk)"""
         if not self.current_id or not self.current_conversation:
             return False
-        
-        filepath = os.path.join(self.base_path, f"{self.current_id}.md")
-        with open(filepath, "w", encoding="utf-8") as f:
-            # Write header
-            f.write(f"# Conversation with {self.model_name} (ID: {self.current_id})\n\n")
-            f.write(f"Date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            # Write messages using XML-style tags
-            for message in self.current_conversation:
-                role = message["role"].title()
-                content = message["content"]
-                f.write(f"<{role}>\n{content}\n</{role}>\n\n")
-        
+
+        self._submit(("save", self._meta_record(), self.current_conversation))
         return True
-    
+
+    def flush(self, timeout=None):
+        """Block until every queued update has been written and synced"""
+        if self._worker is None or not self._worker.is_alive():
+            self._flush_all(force=True)
+            return True
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self):
+        """Flush everything and stop the writer thread (also registered with atexit)"""
+        if self._worker is not None and self._worker.is_alive():
+            done = threading.Event()
+            self._queue.put(("stop", done))
+            done.wait()
+            self._worker.join()
+        else:
+            self._handle(("stop",))
+
+    def export_markdown(self, filepath=None):
+        """Write the current conversation as a markdown view and return its path"""
+        if not self.current_id or not self.current_conversation:
+            return None
+        filepath = filepath or os.path.join(self.base_path, f"{self.current_id}.md")
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(render_markdown(self.model_name, self.current_id, self.current_conversation))
+        return filepath
+
     def load_conversation(self, conversation_id):
         """Load a conversation by ID"""
+        # Make sure nothing queued for this conversation is still in flight before reading it back
+        self.flush()
+
+        loaded = self._load(conversation_id)
+        if loaded:
+            self._publish("conversation_changed", conversation_id=self.current_id,
+                          messages=list(self.current_conversation))
+        return loaded
+
+    def _load(self, conversation_id):
+        jsonl_path = os.path.join(self.base_path, f"{conversation_id}.jsonl")
+        if os.path.exists(jsonl_path):
+            return self._load_jsonl(jsonl_path, conversation_id)
+
         # First try with exact ID
         filepath = os.path.join(self.base_path, f"{conversation_id}.md")
-        
+
         # If that doesn't exist, try with legacy "conversation_" prefix
         if not os.path.exists(filepath):
             legacy_filepath = os.path.join(self.base_path, f"conversation_{conversation_id}.md")
             if os.path.exists(legacy_filepath):
                 filepath = legacy_filepath
             else:
-                return False
-        
+                return self._load_archived(conversation_id)
+
         try:
             with open(filepath, "r", encoding="utf-8") as f:
                 content = f.read()
-            
-            # Extract model name and ID from header
-            model_match = re.search(r"# Conversation with (.*?) \(ID: (.*?)\)", content)
-            if model_match:
-                self.model_name = model_match.group(1)
-                self.current_id = model_match.group(2)
-            else:
-                # Fallback if header format is different
-                self.model_name = "unknown"
-                self.current_id = conversation_id
-            
-            # Clear existing conversation
-            self.current_conversation = []
-            
-            # Extract messages using XML-style tags
-            roles = ["User", "System", "Assistant"]
-            
-            for role in roles:
-                pattern = re.compile(f"<{role}>\n(.*?)\n</{role}>", re.DOTALL)
-                for match in pattern.finditer(content):
-                    message_content = match.group(1).strip()
-                    self.add_message(role.lower(), message_content)
-            
-            # If no messages found with XML tags, try legacy format (if any)
-            if not self.current_conversation:
-                # Example of legacy format parsing - adjust as needed
-                user_pattern = re.compile(r"## User\n\n(.*?)(?=\n##|\Z)", re.DOTALL)
-                assistant_pattern = re.compile(r"## Assistant\n\n(.*?)(?=\n##|\Z)", re.DOTALL)
-                
-                for user_match in user_pattern.finditer(content):
-                    self.add_message("user", user_match.group(1).strip())
-                
-                for assistant_match in assistant_pattern.finditer(content):
-                    self.add_message("assistant", assistant_match.group(1).strip())
-            
+
+            model_name, loaded_id, messages = parse_markdown_conversation(content)
+            self._switch_to(loaded_id or conversation_id)
+            # Fallback if header format is different
+            self.model_name = model_name or "unknown"
+            self.current_conversation = messages
+            self.created_at = os.path.getctime(filepath)
+
+            # Migrate once to the append-only log so further messages are O(1) to save
+            if self.storage == "jsonl" and self.current_conversation:
+                self._submit(("rewrite", self._meta_record(), list(self.current_conversation)))
+
             return len(self.current_conversation) > 0
-        
+
+        except Exception as e:
+            print(f"Error loading conversation: {e}")
+            return False
+
+    def _load_jsonl(self, filepath, conversation_id):
+        try:
+            meta, messages = read_jsonl_conversation(filepath)
+        except Exception as e:
+            print(f"Error loading conversation: {e}")
+            return False
+
+        self._switch_to(meta.get("id", conversation_id))
+        self.model_name = meta.get("model", "unknown")
+        self.created_at = meta.get("created", os.path.getctime(filepath))
+        self.current_conversation = messages
+        return len(self.current_conversation) > 0
+
+    def _load_archived(self, conversation_id):
+        try:
+            archived = self.archive.load(conversation_id)
         except Exception as e:
             print(f"Error loading conversation: {e}")
             return False
-    
+        if archived is None:
+            return False
+
+        meta, messages = archived
+        self._switch_to(conversation_id)
+        self.model_name = meta.get("model", "unknown")
+        self.created_at = meta.get("created")
+        self.current_conversation = messages
+        self._from_archive = True
+        self._archived_summary = meta.get("summary")
+        return len(self.current_conversation) > 0
+
+    def archive_conversations(self, older_than_days=ARCHIVE_AFTER_DAYS):
+        """Pack conversations not updated for older_than_days into compressed segments"""
+        # Runs on the writer thread: it owns _open, so no conversation can be opened
+        # (and its log written) between choosing what to pack and packing it
+        result = {}
+        op = ("archive", older_than_days, {self.current_id}, result, threading.Event())
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(op)
+            op[-1].wait()
+        else:
+            self._handle(op)
+        if "error" in result:
+            raise result["error"]
+        return result["archived"]
+
+    def delete_conversation(self, conversation_id):
+        """Delete a conversation: its log or markdown files, summary cache, catalog, search and archive entries"""
+        if self.catalog.get(conversation_id) is None and not self.archive.contains(conversation_id):
+            return False
+        if conversation_id == self.current_id:
+            self.current_id = None
+            self.current_conversation = []
+            self._from_archive = False
+        self._submit(("delete", conversation_id))
+        self.flush()
+        return True
+
+    def _switch_to(self, conversation_id):
+        if self.current_id and self.current_id != conversation_id:
+            self._submit(("release", self.current_id))
+        self.current_id = conversation_id
+        self._from_archive = False
+
     def get_conversation_history(self):
         """Return the conversation history in a format ready for the model"""
         return self.current_conversation
-    
-    def list_conversations(self):
-        """List all available conversations"""
-        conversations = []
-        
-        # Look for .md files in the conversation directory
-        for filename in os.listdir(self.base_path):
-            if filename.endswith('.md'):
-                # Extract ID from filename
-                conv_id = filename.replace('conversation_', '').replace('.md', '')
-                
-                # Get creation time
-                filepath = os.path.join(self.base_path, filename)
-                timestamp = os.path.getctime(filepath)
-                date = datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Try to extract model name from file
-                model_name = "unknown"
-                try:
+
+    def list_conversations(self, page=1, page_size=None, sort="updated", descending=True):
+        """List available conversations from the catalog, optionally one page at a time"""
+        return [
+            {
+                'id': entry['id'],
+                'date': datetime.datetime.fromtimestamp(entry['created']).strftime('%Y-%m-%d %H:%M:%S'),
+                'model': entry['model'],
+                'updated': entry['updated'],
+                'message_count': entry['message_count'],
+                'title': entry['title']
+            }
+            for entry in self.catalog.list(page, page_size, sort, descending)
+        ]
+
+    def find_conversations(self, prefix, limit=10):
+        """Return catalog entries whose ID starts with prefix, newest first"""
+        return self.catalog.find_prefix(prefix, limit)
+
+    def search_conversations(self, query, limit=10):
+        """Full-text search over all saved messages, best matches first"""
+        return self.search_index.search(query, limit)
+
+    def rebuild_catalog(self):
+        """Re-index every conversation file; only needed when the catalog is missing or stale"""
+        entries = {}
+        self.search_index.clear()
+
+        # .jsonl logs take precedence over a markdown view exported for the same ID
+        filenames = sorted(os.listdir(self.base_path), key=lambda name: not name.endswith('.jsonl'))
+        for filename in filenames:
+            if not filename.endswith(('.jsonl', '.md')):
+                continue
+
+            # Extract ID from filename
+            conv_id = filename.replace('conversation_', '').rsplit('.', 1)[0]
+            if conv_id in entries:
+                continue
+
+            filepath = os.path.join(self.base_path, filename)
+            try:
+                if filename.endswith('.jsonl'):
+                    meta, messages = read_jsonl_conversation(filepath)
+                    model_name = meta.get("model")
+                    created = meta.get("created")
+                else:
                     with open(filepath, 'r', encoding='utf-8') as f:
-                        first_line = f.readline().strip()
-                        model_match = re.search(r"# Conversation with (.*?) \(ID:", first_line)
-                        if model_match:
-                            model_name = model_match.group(1)
-                except:
-                    pass
-                
-                conversations.append({
-                    'id': conv_id,
-                    'date': date,
-                    'model': model_name
-                })
-        
-        return sorted(conversations, key=lambda x: x['date'], reverse=True)
+                        model_name, _, messages = parse_markdown_conversation(f.read())
+                    created = None
+            except Exception as e:
+                print(f"Error indexing {filename}: {e}")
+                continue
+
+            entries[conv_id] = {
+                'id': conv_id,
+                'model': model_name or "unknown",
+                'created': created or os.path.getctime(filepath),
+                'updated': os.path.getmtime(filepath),
+                'message_count': len(messages),
+                'title': make_title(messages),
+                'path': filepath
+            }
+            self.search_index.index_conversation(conv_id, messages)
+
+        # Archived conversations have no plain file left; locate them from the segment sidecars
+        # (archive_index lives in catalog.db, which may have just been recreated) and read them back
+        self.archive.rebuild_index()
+        for conv_id, meta, messages, segment_path in self.archive.iter_archived():
+            if conv_id in entries:
+                continue
+            entries[conv_id] = {
+                'id': conv_id,
+                'model': meta.get("model") or "unknown",
+                'created': meta.get("created") or os.path.getctime(segment_path),
+                'updated': os.path.getmtime(segment_path),
+                'message_count': len(messages),
+                'title': make_title(messages),
+                'path': segment_path
+            }
+            self.search_index.index_conversation(conv_id, messages)
+
+        self.catalog.rebuild(list(entries.values()))
+        return len(entries)
+
+    def _meta_record(self):
+        return {
+            "type": "meta",
+            "id": self.current_id,
+            "model": self.model_name,
+            "created": self.created_at or datetime.datetime.now().timestamp()
+        }
+
+    # === Background writer ===
+
+    def _submit(self, op):
+        if self._worker is not None and self._worker.is_alive():
+            self._queue.put(op)
+        else:
+            self._handle(op)
+            self._flush_all()
+
+    def _run_writer(self):
+        while True:
+            try:
+                op = self._queue.get(timeout=self._next_deadline())
+            except queue.Empty:
+                self._flush_all()
+                continue
+
+            stop = op[0] == "stop"
+            try:
+                self._handle(op)
+                self._flush_all()
+            except Exception as e:
+                print(f"Error saving conversation: {e}")
+            if op[0] in ("flush", "stop", "archive"):
+                op[-1].set()
+            if stop:
+                return
+
+    def _next_deadline(self):
+        """Seconds until the oldest unsaved update is due, or None to sleep until the next op"""
+        pending = [state["dirty_since"] for state in self._open.values() if state["dirty"]]
+        if not pending:
+            return None
+        return max(min(pending) + DEBOUNCE_SECONDS - time.monotonic(), 0)
+
+    def _handle(self, op):
+        kind = op[0]
+        if kind == "append":
+            _, meta, messages, record = op
+            state = self._state(meta, messages)
+            if self.storage == "jsonl":
+                if state["writer"] is None:
+                    state["writer"] = self._open_writer(meta)
+                state["writer"].append(record)
+            self._mark_dirty(state)
+        elif kind == "save":
+            _, meta, messages = op
+            state = self._state(meta, messages)
+            self._mark_dirty(state)
+            self._flush(state)
+        elif kind == "rewrite":
+            # messages is a snapshot taken when the conversation was loaded,
+            # so appends queued after this op are not written twice
+            _, meta, messages = op
+            state = self._state(meta, messages)
+            self._rewrite_jsonl(state)
+            self._flush(state)
+            self.archive.forget(meta["id"])
+        elif kind == "release":
+            state = self._open.pop(op[1], None)
+            if state:
+                self._flush(state)
+                if state["writer"]:
+                    state["writer"].close()
+        elif kind == "delete":
+            conversation_id = op[1]
+            state = self._open.pop(conversation_id, None)
+            if state and state["writer"]:
+                state["writer"].close()
+            names = [f"{conversation_id}.jsonl", f"{conversation_id}.md", f"conversation_{conversation_id}.md"]
+            paths = [os.path.join(self.base_path, name) for name in names]
+            for path in paths + [summary_path(self.base_path, conversation_id)]:
+                if os.path.exists(path):
+                    os.remove(path)
+            # Archived bytes stay in their segment until it is rewritten, like archive.forget()
+            self.archive.forget(conversation_id)
+            self.search_index.remove(conversation_id)
+            self.catalog.remove(conversation_id)
+        elif kind == "flush":
+            self._flush_all(force=True)
+        elif kind == "archive":
+            _, older_than_days, exclude, result, _ = op
+            try:
+                self._flush_all(force=True)
+                result["archived"] = self.archive.archive(older_than_days, exclude | set(self._open))
+            except Exception as e:
+                result["error"] = e
+        elif kind == "stop":
+            self._flush_all(force=True)
+            for conversation_id in list(self._open):
+                self._handle(("release", conversation_id))
+
+    def _state(self, meta, messages):
+        state = self._open.get(meta["id"])
+        if state is None:
+            state = self._open[meta["id"]] = {"writer": None, "dirty": 0, "dirty_since": 0.0}
+        # Keep a reference to the live message list; it is only ever appended to
+        state["meta"] = meta
+        state["messages"] = messages
+        return state
+
+    @staticmethod
+    def _mark_dirty(state):
+        if not state["dirty"]:
+            state["dirty_since"] = time.monotonic()
+        state["dirty"] += 1
+
+    def _flush_all(self, force=False):
+        now = time.monotonic()
+        for state in list(self._open.values()):
+            if state["dirty"] and (force or state["dirty"] >= FLUSH_EVERY_MESSAGES
+                                   or now - state["dirty_since"] >= DEBOUNCE_SECONDS):
+                self._flush(state)
+
+    def _flush(self, state):
+        """Sync the log (or rewrite the markdown view) and update the catalog and search index"""
+        if not state["dirty"]:
+            return
+        meta = state["meta"]
+        messages = list(state["messages"])
+        if not messages:
+            state["dirty"] = 0
+            return
+
+        if self.storage == "jsonl":
+            if state["writer"] is None:
+                state["writer"] = self._open_writer(meta)
+            state["writer"].sync()
+            filepath = self._jsonl_path(meta["id"])
+        else:
+            filepath = os.path.join(self.base_path, f"{meta['id']}.md")
+            with open(filepath, "w", encoding="utf-8") as f:
+                f.write(render_markdown(meta["model"], meta["id"], messages))
+
+        self.catalog.upsert(
+            meta["id"],
+            meta["model"],
+            meta["created"],
+            datetime.datetime.now().timestamp(),
+            len(messages),
+            make_title(messages),
+            filepath
+        )
+        self.search_index.index_conversation(meta["id"], messages)
+        state["dirty"] = 0
+
+    # === Append-only log ===
+
+    def _jsonl_path(self, conversation_id):
+        return os.path.join(self.base_path, f"{conversation_id}.jsonl")
+
+    def _open_writer(self, meta):
+        path = self._jsonl_path(meta["id"])
+        new_file = not os.path.exists(path)
+        writer = JsonlConversationWriter(path)
+        if new_file:
+            writer.append(meta)
+        return writer
+
+    def _rewrite_jsonl(self, state):
+        """Write the whole conversation as a fresh log (used for migration only)"""
+        if state["writer"] is not None:
+            state["writer"].close()
+        path = self._jsonl_path(state["meta"]["id"])
+        tmp_path = path + ".tmp"
+        writer = JsonlConversationWriter(tmp_path)
+        writer.append(state["meta"])
+        for message in state["messages"]:
+            writer.append(message_record(message))
+        writer.close()
+        os.replace(tmp_path, path)
+        state["writer"] = JsonlConversationWriter(path)
+        self._mark_dirty(state)
@@ -0,0 +1,135 @@
+from text_tokens import tokenize
+
+SNIPPET_CHARS = 80
+
+
+def make_snippet(content, tokens, width=SNIPPET_CHARS):
+    """Cut a window of the original text around the first matched token"""
+    flat = " ".join(content.split())
+    lowered = flat.lower()
+    positions = [pos for pos in (lowered.find(token) for token in tokens) if pos >= 0]
+    center = min(positions) if positions else 0
+    start = max(center - width // 3, 0)
+    end = min(start + width, len(flat))
+    return ("…" if start > 0 else "") + flat[start:end] + ("…" if end < len(flat) else "")
+
+
+class ConversationSearchIndex:
+    """FTS5 index over conversation messages, stored in the catalog database"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.available = True
+        try:
+            with catalog.lock:
+                catalog.conn.executescript("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                        tokens,
+                        conversation_id UNINDEXED,
+                        seq UNINDEXED,
+                        role UNINDEXED,
+                        content UNINDEXED,
+                        tokenize = 'unicode61'
+                    );
+                    CREATE TABLE IF NOT EXISTS search_progress (
+                        conversation_id TEXT PRIMARY KEY,
+                        indexed_count INTEGER
+                    );
+                """)
+                catalog.conn.commit()
+        except Exception as e:
+            # Some SQLite builds ship without FTS5; search is then simply unavailable
+            print(f"Full-text search disabled: {e}")
+            self.available = False
+
+    def index_conversation(self, conversation_id, messages):
+        """Index only the messages appended since the last call for this conversation"""
+        if not self.available:
+            return 0
+        with self.catalog.lock:
+            conn = self.catalog.conn
+            row = conn.execute(
+                "SELECT indexed_count FROM search_progress WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+            indexed = row[0] if row else 0
+            if indexed > len(messages):
+                # The conversation was rewritten; start over for it
+                conn.execute("DELETE FROM messages_fts WHERE conversation_id = ?", (conversation_id,))
+                indexed = 0
+
+            new_rows = [
+                (" ".join(tokenize(message["content"])), conversation_id, seq, message["role"], message["content"])
+                for seq, message in enumerate(messages[indexed:], start=indexed)
+                if message["role"] != "system"
+            ]
+            conn.executemany(
+                "INSERT INTO messages_fts (tokens, conversation_id, seq, role, content) VALUES (?, ?, ?, ?, ?)",
+                new_rows
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO search_progress (conversation_id, indexed_count) VALUES (?, ?)",
+                (conversation_id, len(messages))
+            )
+            conn.commit()
+        return len(new_rows)
+
+    def remove(self, conversation_id):
+        if not self.available:
+            return
+        with self.catalog.lock:
+            self.catalog.conn.execute("DELETE FROM messages_fts WHERE conversation_id = ?", (conversation_id,))
+            self.catalog.conn.execute("DELETE FROM search_progress WHERE conversation_id = ?", (conversation_id,))
+            self.catalog.conn.commit()
+
+    def is_missing_rows(self):
+        """True when some cataloged conversation has messages the FTS table has not indexed yet"""
+        if not self.available:
+            return False
+        with self.catalog.lock:
+            return self.catalog.conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM conversations c "
+                "LEFT JOIN search_progress p ON p.conversation_id = c.id "
+                "WHERE c.message_count > 0 AND COALESCE(p.indexed_count, 0) < c.message_count)"
+            ).fetchone()[0] == 1
+
+    def clear(self):
+        if not self.available:
+            return
+        with self.catalog.lock:
+            self.catalog.conn.execute("DELETE FROM messages_fts")
+            self.catalog.conn.execute("DELETE FROM search_progress")
+            self.catalog.conn.commit()
+
+    def search(self, query, limit=10):
+        """BM25-ranked hits; all query tokens must match, falling back to any token"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not self.available or not tokens:
+            return []
+
+        quoted = ['"' + token.replace('"', '""') + '"' for token in tokens]
+        rows = []
+        for expression in (" AND ".join(quoted), " OR ".join(quoted)):
+            with self.catalog.lock:
+                rows = self.catalog.conn.execute(
+                    "SELECT f.conversation_id, f.seq, f.role, f.content, bm25(messages_fts) AS rank, "
+                    "c.model, c.title, c.updated "
+                    "FROM messages_fts f LEFT JOIN conversations c ON c.id = f.conversation_id "
+                    "WHERE messages_fts MATCH ? ORDER BY rank LIMIT ?",
+                    (expression, limit)
+                ).fetchall()
+            if rows or len(tokens) == 1:
+                break
+
+        return [
+            {
+                "conversation_id": row["conversation_id"],
+                "seq": row["seq"],
+                "role": row["role"],
+                # bm25() is lower-is-better; flip it so larger means more relevant
+                "score": -row["rank"],
+                "model": row["model"],
+                "title": row["title"],
+                "snippet": make_snippet(row["content"], tokens)
+            }
+            for row in rows
+        ]
@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import time
+
+FSYNC_EVERY = 8          # fsync after this many appended records
+FSYNC_INTERVAL = 2.0     # ...or when this many seconds passed since the last fsync
+
+MARKDOWN_HEADER = re.compile(r"# Conversation with (.*?) \(ID: (.*?)\)")
+MARKDOWN_MESSAGE = re.compile(r"<(User|System|Assistant)>\n(.*?)\n</\1>", re.DOTALL)
+LEGACY_MESSAGE = re.compile(r"## (User|Assistant)\n\n(.*?)(?=\n##|\Z)", re.DOTALL)
+SUMMARY_SUFFIX = ".summary.json"
+
+
+class JsonlConversationWriter:
+    """Append-only writer: one JSON record per line, fsync batched by count or time"""
+
+    def __init__(self, path, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.file = open(path, "a", encoding="utf-8")
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def append(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.pending += 1
+        if self.pending >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Flush Python buffers and force the data to disk"""
+        if self.file.closed:
+            return
+        self.file.flush()
+        if self.pending:
+            os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+
+def read_jsonl_conversation(path):
+    """Read a JSONL conversation in a single streaming pass, returns (meta, messages)"""
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_jsonl_records(f)
+
+
+def parse_jsonl_records(lines):
+    """Parse JSONL lines (a file or any iterable of str), returns (meta, messages)"""
+    meta = {}
+    messages = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # A crash can leave a half-written last line; everything before it is intact
+            continue
+        if record.get("type") == "meta":
+            meta = record
+        elif record.get("type") == "message":
+            message = {"role": record["role"], "content": record["content"]}
+            if record.get("metrics"):
+                message["metrics"] = record["metrics"]
+            messages.append(message)
+    return meta, messages
+
+
+def message_record(message):
+    """JSONL record for an in-memory message (metrics are kept when present)"""
+    record = {"type": "message", "role": message["role"], "content": message["content"]}
+    if message.get("metrics"):
+        record["metrics"] = message["metrics"]
+    return record
+
+
+def summary_path(base_path, conversation_id):
+    """Rolling-summary cache of a conversation (written by history_manager.HistoryManager)"""
+    return os.path.join(base_path, f"{conversation_id}{SUMMARY_SUFFIX}")
+
+
+def read_summary(path):
+    """Return the cached summary state, or None when the file is missing or unreadable"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Error loading summary cache: {e}")
+        return None
+
+
+def write_summary(path, state):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def dump_jsonl_records(meta, messages):
+    """Serialize a conversation to JSONL text (meta record first)"""
+    lines = [json.dumps(dict(meta, type="meta"), ensure_ascii=False)]
+    lines += [json.dumps(message_record(m), ensure_ascii=False) for m in messages]
+    return "\n".join(lines) + "\n"
+
+
+def parse_markdown_conversation(content):
+    """Parse the markdown view, keeping the original message order. Returns (model, id, messages)"""
+    model_name, conversation_id = None, None
+    header = MARKDOWN_HEADER.search(content)
+    if header:
+        model_name, conversation_id = header.group(1), header.group(2)
+
+    # One pass over all roles so user/assistant interleaving is preserved
+    messages = [
+        {"role": match.group(1).lower(), "content": match.group(2).strip()}
+        for match in MARKDOWN_MESSAGE.finditer(content)
+    ]
+    if not messages:
+        messages = [
+            {"role": match.group(1).lower(), "content": match.group(2).strip()}
+            for match in LEGACY_MESSAGE.finditer(content)
+        ]
+    return model_name, conversation_id, messages
+
+
+def render_markdown(model_name, conversation_id, messages, date=None):
+    """Render a conversation as the markdown view used by earlier versions"""
+    date = date or time.strftime("%Y-%m-%d %H:%M:%S")
+    parts = [f"# Conversation with {model_name} (ID: {conversation_id})\n\n", f"Date: {date}\n\n"]
+    for message in messages:
+        role = message["role"].title()
+        parts.append(f"<{role}>\n{message['content']}\n</{role}>\n\n")
+    return "".join(parts)
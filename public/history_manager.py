@@ -0,0 +1,217 @@
+import time
+import threading
+import requests
+
+from text_tokens import estimate_tokens, estimate_message_tokens, budget_start
+from conversation_store import summary_path, read_summary, write_summary
+
+OLLAMA_URL = "http://localhost:11434/api/chat"
+
+HISTORY_STRATEGY = "summary"     # "full", "last_n", "token_budget" or "summary"
+LAST_N_TURNS = 8                 # user turns kept by "last_n"
+HISTORY_TOKEN_BUDGET = 3000      # message budget for "token_budget" and "summary" (summary message included)
+SUMMARY_SHARE = 0.2              # part of the budget kept free for the summary message
+SUMMARY_MODEL = "qwen2.5:1.5b"   # small model used only for background summaries
+SUMMARY_MIN_NEW = 6              # re-summarize once this many messages fell out of the window
+SUMMARY_TIMEOUT = 120
+SUMMARY_RETRY_SECONDS = 60       # back-off after a failed summary, doubled per consecutive failure
+SUMMARY_RETRY_MAX_SECONDS = 900
+GAP_PREVIEW_CHARS = 80
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+STRATEGIES = ("full", "last_n", "token_budget", "summary")
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a chat between a user and an assistant.\n"
+    "Update the summary with the new messages. Keep facts, decisions, names, numbers and open questions; "
+    "drop small talk. Write at most 200 words in the same language as the conversation. "
+    "Output only the summary.\n\n"
+    "Current summary:\n{summary}\n\nNew messages:\n{messages}"
+)
+
+
+def preview(messages, max_chars=GAP_PREVIEW_CHARS):
+    """One short line per message; used for messages the summary does not cover yet"""
+    lines = []
+    for message in messages:
+        content = " ".join(message["content"].split())
+        if len(content) > max_chars:
+            content = content[:max_chars] + "…"
+        lines.append(f"{message['role']}: {content}")
+    return "\n".join(lines)
+
+
+def fit_summary(summary, gap_lines, budget):
+    """
+    Summary message content within budget tokens, or "" when nothing fits.
+    The summary is kept first (its oldest lines go only if it alone is too long),
+    then the newest preview lines that still fit.
+    """
+    used = estimate_message_tokens({"content": SUMMARY_PREFIX})
+    # +1 per line for the joining newline and rounding in estimate_tokens
+    summary_lines = [(line, estimate_tokens(line) + 1) for line in (summary.splitlines() if summary else [])]
+    summary_used = sum(cost for _, cost in summary_lines)
+    while summary_lines and used + summary_used > budget:
+        summary_used -= summary_lines.pop(0)[1]
+    used += summary_used
+
+    kept = []
+    for line in reversed(gap_lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    lines = [line for line, _ in summary_lines] + kept[::-1]
+    return SUMMARY_PREFIX + "\n".join(lines) if lines else ""
+
+
+class HistoryManager:
+    """
+    Chooses which part of the conversation is sent to the model on each turn.
+    Leading system messages (e.g. the CoT prompt) are always kept.
+    The "summary" strategy never waits for the summarizer: it uses the cached summary,
+    previews anything the summary does not cover yet, and refreshes it in a background thread.
+    Summary and preview count against token_budget like context_packer.pack_history;
+    after a failed summary the next attempt waits SUMMARY_RETRY_SECONDS (doubling).
+    """
+
+    def __init__(self, strategy=HISTORY_STRATEGY, last_n=LAST_N_TURNS, token_budget=HISTORY_TOKEN_BUDGET,
+                 summary_model=SUMMARY_MODEL, base_path="conversations", ollama_url=OLLAMA_URL):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown history strategy: {strategy}")
+        self.strategy = strategy
+        self.last_n = last_n
+        self.token_budget = token_budget
+        self.summary_model = summary_model
+        self.base_path = base_path
+        self.ollama_url = ollama_url
+        self.summaries = {}     # conversation_id -> {"covered": int, "summary": str}
+        self.pending = set()
+        self.backoff = {}       # conversation_id -> (consecutive failures, retry not before)
+        self.deleted = set()    # conversations deleted while a summary may still be in flight
+        self.lock = threading.Lock()
+
+    def build(self, conversation_id, messages):
+        """Return the messages to send for this turn"""
+        pinned_count = 0
+        while pinned_count < len(messages) and messages[pinned_count]["role"] == "system":
+            pinned_count += 1
+        pinned = [dict(role=m["role"], content=m["content"]) for m in messages[:pinned_count]]
+
+        if self.strategy == "full":
+            return pinned + self._copy(messages[pinned_count:])
+        if self.strategy == "last_n":
+            start = self._last_n_start(messages, pinned_count)
+            return pinned + self._copy(messages[start:])
+
+        start = budget_start(messages, self.token_budget, pinned_count)
+        if self.strategy == "token_budget" or start == pinned_count:
+            return pinned + self._copy(messages[start:])
+
+        # "summary": older messages are represented by the cached rolling summary.
+        # Make room for it first: the oldest kept messages join the summarized part (the newest stays)
+        used = sum(estimate_message_tokens(m) for m in messages[start:])
+        while start < len(messages) - 1 and used > self.token_budget * (1 - SUMMARY_SHARE):
+            used -= estimate_message_tokens(messages[start])
+            start += 1
+
+        state = self._get_summary(conversation_id)
+        covered = max(state["covered"], pinned_count)
+        gap_lines = []
+        if covered < start:
+            gap_lines = preview(messages[covered:start]).splitlines()
+            if start - covered >= SUMMARY_MIN_NEW:
+                self._schedule_summary(conversation_id, messages[:start], covered, state["summary"])
+        content = fit_summary(state["summary"], gap_lines, self.token_budget - used)
+        summary_message = [{"role": "system", "content": content}] if content else []
+        return pinned + summary_message + self._copy(messages[start:])
+
+    # === Window selection ===
+
+    @staticmethod
+    def _copy(messages):
+        return [{"role": m["role"], "content": m["content"]} for m in messages]
+
+    def _last_n_start(self, messages, pinned_count):
+        seen = 0
+        for index in range(len(messages) - 1, pinned_count - 1, -1):
+            if messages[index]["role"] == "user":
+                seen += 1
+                if seen == self.last_n:
+                    return index
+        return pinned_count
+
+    # === Rolling summary cache ===
+
+    def _get_summary(self, conversation_id):
+        with self.lock:
+            state = self.summaries.get(conversation_id)
+        if state is not None:
+            return state
+
+        state = read_summary(summary_path(self.base_path, conversation_id)) or {"covered": 0, "summary": ""}
+        with self.lock:
+            self.summaries.setdefault(conversation_id, state)
+            return self.summaries[conversation_id]
+
+    def _schedule_summary(self, conversation_id, messages, covered, summary):
+        with self.lock:
+            if conversation_id in self.pending:
+                return
+            if time.time() < self.backoff.get(conversation_id, (0, 0.0))[1]:
+                return
+            self.pending.add(conversation_id)
+        thread = threading.Thread(
+            target=self._summarize,
+            args=(conversation_id, messages, covered, summary),
+            daemon=True
+        )
+        thread.start()
+
+    def _summarize(self, conversation_id, messages, covered, summary):
+        try:
+            new_messages = "\n".join(
+                f"{m['role']}: {m['content']}" for m in messages[covered:] if m["role"] != "system"
+            )
+            response = requests.post(self.ollama_url, json={
+                "model": self.summary_model,
+                "messages": [{"role": "user", "content": SUMMARY_PROMPT.format(
+                    summary=summary or "(empty)", messages=new_messages
+                )}],
+                "stream": False,
+                "options": {"temperature": 0}
+            }, timeout=SUMMARY_TIMEOUT)
+            response.raise_for_status()
+            text = response.json().get("message", {}).get("content", "").strip()
+            if not text:
+                raise ValueError("empty summary")
+
+            state = {"covered": len(messages), "summary": text}
+            with self.lock:
+                if conversation_id in self.deleted:
+                    return
+                if self.summaries.get(conversation_id, {}).get("covered", 0) >= state["covered"]:
+                    return
+                self.summaries[conversation_id] = state
+                self.backoff.pop(conversation_id, None)
+            self._save_summary(conversation_id, state)
+        except Exception as e:
+            with self.lock:
+                failures = self.backoff.get(conversation_id, (0, 0.0))[0] + 1
+                delay = min(SUMMARY_RETRY_SECONDS * 2 ** (failures - 1), SUMMARY_RETRY_MAX_SECONDS)
+                self.backoff[conversation_id] = (failures, time.time() + delay)
+            print(f"\nBackground summary failed (retry in {delay:.0f}s): {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(conversation_id)
+
+    def _save_summary(self, conversation_id, state):
+        write_summary(summary_path(self.base_path, conversation_id), state)
+
+    def forget(self, conversation_id):
+        """Drop the in-memory summary of a deleted conversation (the file is removed by the handler)"""
+        with self.lock:
+            self.summaries.pop(conversation_id, None)
+            self.backoff.pop(conversation_id, None)
+            self.deleted.add(conversation_id)
@@ -0,0 +1,57 @@
+import re
+
+# Shared by the conversation search index (public/) and the RAG BM25 index (RAG/lexical_index.py)
+CJK_PATTERN = r"[㐀-䶿一-鿿豈-﫿]"
+TOKEN_PATTERN = re.compile(rf"{CJK_PATTERN}+|[A-Za-z0-9]+")
+CJK_RUN = re.compile(rf"^{CJK_PATTERN}+$")
+
+# Token estimates shared by the history manager (public/) and the context packer (RAG/context_packer.py)
+CJK_CHAR = re.compile(r"[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]")
+LATIN_WORD = re.compile(r"[A-Za-z0-9]+")
+MESSAGE_OVERHEAD = 4    # role / formatting tokens per chat message
+
+
+def tokenize(text):
+    """
+    CJK runs become character bigrams (a single character stays as is),
+    Latin words and numbers stay whole and are lowercased.
+    e.g. "VoltForge電池模組" -> ["voltforge", "電池", "池模", "模組"]
+    """
+    tokens = []
+    for run in TOKEN_PATTERN.findall(text):
+        if CJK_RUN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def estimate_tokens(text):
+    """
+    Rough token count without loading a tokenizer:
+    about 1 token per CJK character, 1.3 per Latin word and 1 per 4 other characters.
+    """
+    cjk = len(CJK_CHAR.findall(text))
+    words = LATIN_WORD.findall(text)
+    rest = len(text) - cjk - sum(len(w) for w in words)
+    return cjk + int(len(words) * 1.3 + 0.5) + max(rest, 0) // 4
+
+
+def estimate_message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def budget_start(messages, budget, first=0):
+    """
+    Oldest index >= first such that messages[index:] fits the token budget.
+    The newest message is always kept, even when it alone exceeds the budget.
+    """
+    used = 0
+    for index in range(len(messages) - 1, first - 1, -1):
+        used += estimate_message_tokens(messages[index])
+        if used > budget and index < len(messages) - 1:
+            return index + 1
+    return first
@@ -0,0 +1,225 @@
+import json
+import socket
+import asyncio
+import threading
+import concurrent.futures
+import requests
+
+from chat_metrics import TurnTimer
+
+OLLAMA_URL = "http://localhost:11434/api/chat"
+MAX_CONCURRENT_SESSIONS = 2   # 同時進行的生成數量上限
+STREAM_QUEUE_SIZE = 64        # 消費端跟不上時，讀取端最多先緩衝這麼多個 chunk
+PUT_POLL_SECONDS = 0.1
+
+_DONE = object()
+
+
+def abort_response(response):
+    """
+    立即中斷串流：先 shutdown socket 讓阻塞中的讀取馬上返回，再關閉連線。
+    Ollama 偵測到 client 斷線就會停止生成並釋放模型。
+    """
+    try:
+        connection = getattr(response.raw, "_connection", None)  # urllib3 2.x
+        sock = getattr(connection, "sock", None)
+        if sock is None:
+            sock = response.raw._fp.fp.raw._sock                  # urllib3 1.x
+        sock.shutdown(socket.SHUT_RDWR)
+    except Exception:
+        pass
+    try:
+        response.close()
+    except Exception:
+        pass
+
+
+class ChatHandle:
+    """一次生成的控制代碼：可從任何執行緒取消或等待結果"""
+
+    def __init__(self, cancel, result_future):
+        self._cancel = cancel
+        self.result_future = result_future
+
+    def cancel(self):
+        self._cancel()
+
+    def done(self):
+        return self.result_future.done()
+
+    def result(self, timeout=None):
+        """回傳 chat() 的結果 dict；取消時 content 為已收到的部分"""
+        return self.result_future.result(timeout)
+
+
+# === asyncio 串流聊天核心 ===
+class ChatEngine:
+    """
+    所有生成都在同一條背景 event loop 執行緒上跑，CLI 與 GUI 只透過 start() 送出工作。
+    HTTP 串流由獨立的讀取執行緒負責，經由有上限的 asyncio.Queue 交給 event loop，
+    佇列滿時讀取端會停止從 socket 讀取（back-pressure）。
+    """
+
+    def __init__(self, url=OLLAMA_URL, max_concurrent=MAX_CONCURRENT_SESSIONS, queue_size=STREAM_QUEUE_SIZE):
+        self.url = url
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.loop = None
+        self.semaphore = None
+        self.lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(self.loop)
+                    self.semaphore = asyncio.Semaphore(self.max_concurrent)
+                    ready.set()
+                    self.loop.run_forever()
+
+                threading.Thread(target=run, name="chat-engine", daemon=True).start()
+                ready.wait()
+        return self.loop
+
+    async def stream(self, model, messages, options=None, keep_alive=None):
+        """逐一 yield Ollama 的串流 chunk；被取消時會中斷 HTTP 連線。keep_alive 為 None 時沿用 Ollama 預設（5 分鐘）"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        holder = {}
+
+        def put(item):
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    future.result(timeout=PUT_POLL_SECONDS)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        return False
+
+        def reader():
+            try:
+                payload = {"model": model, "messages": messages, "stream": True}
+                if options:
+                    payload["options"] = options
+                if keep_alive is not None:
+                    payload["keep_alive"] = keep_alive
+                response = requests.post(self.url, json=payload, stream=True)
+                holder["response"] = response
+                if stop.is_set():
+                    abort_response(response)
+                    return
+                if response.status_code != 200:
+                    put(RuntimeError(f"Failed to get response: {response.status_code} {response.text}"))
+                    return
+                for line in response.iter_lines():
+                    if stop.is_set():
+                        return
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if not put(chunk) or chunk.get("done", False):
+                        return
+            except Exception as e:
+                if not stop.is_set():
+                    put(e)
+            finally:
+                put(_DONE)
+                loop.call_soon_threadsafe(self.semaphore.release)
+
+        # 名額由讀取執行緒結束時歸還：取消時 requests.post 可能還卡在模型載入，
+        # 這時請求仍在 Ollama 排隊，提早歸還會讓同時送出的請求超過 max_concurrent
+        await self.semaphore.acquire()
+        thread = threading.Thread(target=reader, name="chat-engine-reader", daemon=True)
+        thread.start()
+        completed = False
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    completed = True
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            if "response" in holder:
+                if completed:
+                    holder["response"].close()
+                else:
+                    abort_response(holder["response"])
+
+    async def chat(self, model, messages, on_token=None, options=None, keep_alive=None):
+        """回傳 {"content", "cancelled", "error", "final", "metrics"}，metrics 見 chat_metrics.build_turn_metrics"""
+        content, final = [], None
+        timer = TurnTimer()
+        cancelled, error = False, None
+        try:
+            async for chunk in self.stream(model, messages, options, keep_alive):
+                token = chunk.get("message", {}).get("content", "")
+                if token:
+                    timer.mark_token()
+                    content.append(token)
+                    if on_token:
+                        on_token(token)
+                if chunk.get("done", False):
+                    final = chunk
+        except asyncio.CancelledError:
+            cancelled = True
+        except Exception as e:
+            error = e
+        return {"content": "".join(content), "cancelled": cancelled, "error": error,
+                "final": final, "metrics": timer.finish(final)}
+
+    def start(self, model, messages, on_token=None, on_done=None, options=None, keep_alive=None):
+        """
+        從任意執行緒開始一次生成，立即回傳 ChatHandle。
+        on_token / on_done 在 event loop 執行緒上被呼叫，on_done 收到結果 dict。
+        """
+        loop = self._ensure_loop()
+        result_future = concurrent.futures.Future()
+        finish_lock = threading.Lock()
+        finished = []
+
+        def finish(result):
+            with finish_lock:
+                if finished:
+                    return
+                finished.append(result)
+            # 先跑完 on_done 再讓 result() 返回：呼叫端拿到結果時，on_done 對狀態的更新（例如寫入歷史）已完成
+            try:
+                if on_done:
+                    on_done(result)
+            finally:
+                result_future.set_result(result)
+
+        async def run():
+            try:
+                result = await self.chat(model, messages, on_token, options, keep_alive)
+            except asyncio.CancelledError:
+                result = {"content": "", "cancelled": True, "error": None, "final": None, "metrics": None}
+            finish(result)
+
+        tasks = []
+
+        def create():
+            task = loop.create_task(run())
+            # 在 task 開始執行前就被取消時 run() 不會執行，這裡補上結果
+            task.add_done_callback(lambda t: t.cancelled() and finish(
+                {"content": "", "cancelled": True, "error": None, "final": None, "metrics": None}
+            ))
+            tasks.append(task)
+
+        # create 與 cancel 都排進 event loop，依序執行，cancel 一定看得到 task；
+        # 取消 task 本身（而非外層 future），chat() 才能回傳目前為止的部分內容
+        loop.call_soon_threadsafe(create)
+        return ChatHandle(lambda: loop.call_soon_threadsafe(lambda: tasks[0].cancel()), result_future)
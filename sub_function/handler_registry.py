@@ -0,0 +1,319 @@
+import os
+import re
+import gc
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+import requests
+
+from chat_engine import ChatEngine
+
+OLLAMA_URL = "http://localhost:11434"
+OLLAMA_GENERATE_URL = f"{OLLAMA_URL}/api/generate"
+REASONING_MODEL = "qwen3:4b"
+INTUITION_MODEL = "qwen2.5:3b"
+VISION_MODEL = "llama3.2-vision"
+OLLAMA_KEEP_ALIVE = "30m"     # 由 registry 決定何時卸載，Ollama 這邊先保持載入（每次請求都要帶上，否則會被重設為 5 分鐘）
+
+MEMORY_BUDGET_MB = 12000      # 常駐模型的記憶體預估總量上限
+IDLE_UNLOAD_SECONDS = 600     # 閒置超過這麼久就卸載
+IDLE_CHECK_SECONDS = 30
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_PATH_PATTERN = re.compile(r"\S+\.(?:png|jpe?g|bmp|gif|webp)\b", re.IGNORECASE)
+AUDIO_PATH_PATTERN = re.compile(r"\S+\.(?:wav|mp3|m4a|flac|ogg)\b", re.IGNORECASE)
+
+
+class HandlerEntry:
+    def __init__(self, label, loader, handler, unloader=None, memory_mb=0):
+        self.label = label
+        self.loader = loader          # () -> resource
+        self.handler = handler        # (resource, text) -> result
+        self.unloader = unloader      # (resource) -> None，選用
+        self.memory_mb = memory_mb    # 預估的常駐記憶體（RAM 或 VRAM）
+        self.resource = None
+        self.loaded = False
+        self.last_used = 0.0
+        self.in_use = 0
+        self.load_lock = threading.Lock()
+
+
+# === dispatcher label -> 延遲載入的 handler ===
+class HandlerRegistry:
+    """
+    handler 的模型在第一次被呼叫時才載入，之後常駐，並依最近使用順序（LRU）排列。
+    載入新模型會讓預估記憶體超過 memory_budget_mb 時，先卸載最久沒用、且目前沒在執行的模型，
+    只卸載騰出空間所需的數量，載入期間不會超過預算；新模型載入失敗時再把它們載回來。
+    背景執行緒另外會卸載閒置超過 idle_seconds 的模型。
+    """
+
+    def __init__(self, memory_budget_mb=MEMORY_BUDGET_MB, idle_seconds=IDLE_UNLOAD_SECONDS):
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_seconds = idle_seconds
+        self.entries = {}
+        self.resident = OrderedDict()   # label -> entry，最近使用的在最後
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.reaper = None
+
+    def register(self, label, loader, handler, unloader=None, memory_mb=0):
+        self.entries[label] = HandlerEntry(label, loader, handler, unloader, memory_mb)
+
+    def labels(self):
+        return list(self.entries)
+
+    def handle(self, label, text):
+        """以 label 對應的 handler 處理輸入，必要時先載入模型"""
+        entry = self.entries.get(label)
+        if entry is None:
+            raise KeyError(f"沒有註冊的 handler: {label}")
+        resource = self._acquire(entry)
+        try:
+            return entry.handler(resource, text)
+        finally:
+            with self.lock:
+                entry.in_use -= 1
+                entry.last_used = time.time()
+
+    def _acquire(self, entry):
+        with entry.load_lock:
+            with self.lock:
+                if entry.loaded:
+                    entry.in_use += 1
+                    self.resident.move_to_end(entry.label)
+                    return entry.resource
+                victims = self._evict_for(entry.memory_mb)
+            for victim in victims:
+                self._unload_entry(victim)
+
+            print(f"🔄 載入 {entry.label}...")
+            started = time.perf_counter()
+            try:
+                resource = entry.loader()
+            except Exception:
+                self._reload(victims)
+                raise
+            print(f"✅ {entry.label} 已載入（{time.perf_counter() - started:.1f}s）")
+
+            with self.lock:
+                entry.resource = resource
+                entry.loaded = True
+                entry.in_use += 1
+                entry.last_used = time.time()
+                self.resident[entry.label] = entry
+            self._ensure_reaper()
+            return resource
+
+    def _reload(self, victims):
+        """載入失敗時，把為了騰出空間而卸載的模型載回來，並放回 LRU 最前面（維持原本的先後順序）"""
+        for victim in reversed(victims):
+            with victim.load_lock:
+                if victim.loaded:
+                    continue
+                print(f"🔄 {victim.label} 重新載入...")
+                try:
+                    resource = victim.loader()
+                except Exception as e:
+                    print(f"⚠️ 重新載入 {victim.label} 失敗: {e}")
+                    continue
+                with self.lock:
+                    victim.resource = resource
+                    victim.loaded = True
+                    self.resident[victim.label] = victim
+                    self.resident.move_to_end(victim.label, last=False)
+
+    def _evict_for(self, memory_mb):
+        """挑出要卸載的模型（呼叫端持有 self.lock），從 resident 移除後回傳"""
+        victims = []
+        used = self.memory_used()
+        for label in list(self.resident):
+            if used + memory_mb <= self.memory_budget_mb:
+                break
+            entry = self.resident[label]
+            if entry.in_use:
+                continue
+            del self.resident[label]
+            entry.loaded = False
+            used -= entry.memory_mb
+            victims.append(entry)
+        if used + memory_mb > self.memory_budget_mb:
+            print(f"⚠️ 執行中的模型已佔用 {used} MB，載入後會超過預算 {self.memory_budget_mb} MB")
+        return victims
+
+    def _unload_entry(self, entry):
+        resource, entry.resource = entry.resource, None
+        try:
+            if entry.unloader:
+                entry.unloader(resource)
+        except Exception as e:
+            print(f"⚠️ 卸載 {entry.label} 失敗: {e}")
+        del resource
+        release_memory()
+        print(f"💤 已卸載 {entry.label}")
+
+    def memory_used(self):
+        return sum(entry.memory_mb for entry in self.resident.values())
+
+    def unload(self, label):
+        with self.lock:
+            entry = self.resident.get(label)
+            if entry is None or entry.in_use:
+                return False
+            del self.resident[label]
+            entry.loaded = False
+        self._unload_entry(entry)
+        return True
+
+    def unload_idle(self, idle_seconds=None):
+        idle_seconds = self.idle_seconds if idle_seconds is None else idle_seconds
+        cutoff = time.time() - idle_seconds
+        with self.lock:
+            idle = [label for label, entry in self.resident.items()
+                    if not entry.in_use and entry.last_used < cutoff]
+        return [label for label in idle if self.unload(label)]
+
+    def _ensure_reaper(self):
+        with self.lock:
+            if self.reaper is not None or not self.idle_seconds:
+                return
+
+            def run():
+                while not self.stop_event.wait(IDLE_CHECK_SECONDS):
+                    self.unload_idle()
+
+            self.reaper = threading.Thread(target=run, name="handler-reaper", daemon=True)
+            self.reaper.start()
+
+    def close(self):
+        self.stop_event.set()
+        for label in list(self.resident):
+            self.unload(label)
+
+    def status(self):
+        now = time.time()
+        with self.lock:
+            lines = [f"📦 常駐模型 {self.memory_used()} / {self.memory_budget_mb} MB"]
+            for label, entry in self.entries.items():
+                if entry.loaded:
+                    state = f"已載入，閒置 {now - entry.last_used:.0f}s" + ("，執行中" if entry.in_use else "")
+                else:
+                    state = "未載入"
+                lines.append(f"   {label:<10}{entry.memory_mb:>7} MB  {state}")
+        return "\n".join(lines)
+
+
+def release_memory():
+    """讓 Python 與 PyTorch 真正釋放卸載模型佔用的記憶體"""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+# === Ollama 模型：載入 / 卸載只是調整 keep_alive ===
+def ollama_load(model):
+    requests.post(OLLAMA_GENERATE_URL, json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE}, timeout=300).raise_for_status()
+    return model
+
+
+def ollama_unload(model):
+    requests.post(OLLAMA_GENERATE_URL, json={"model": model, "keep_alive": 0}, timeout=30)
+
+
+def import_from(directory, module_name):
+    """ImageGen / MusicGen 不是套件，把資料夾加進 sys.path 後再 import"""
+    path = os.path.join(ROOT_DIR, directory)
+    if path not in sys.path:
+        sys.path.append(path)
+    return __import__(module_name)
+
+
+def build_default_registry(memory_budget_mb=MEMORY_BUDGET_MB, idle_seconds=IDLE_UNLOAD_SECONDS):
+    """註冊 main_dispatcher 的七個 label；記憶體為預估值，依實際硬體調整"""
+    registry = HandlerRegistry(memory_budget_mb, idle_seconds)
+    engine = ChatEngine()
+
+    def chat(model):
+        def handler(_, text):
+            handle = engine.start(model, [{"role": "user", "content": text}],
+                                  on_token=lambda token: print(token, end="", flush=True),
+                                  keep_alive=OLLAMA_KEEP_ALIVE)
+            result = handle.result()
+            print()
+            return result["content"]
+        return handler
+
+    registry.register("reasoning", lambda: ollama_load(REASONING_MODEL), chat(REASONING_MODEL),
+                      ollama_unload, memory_mb=3500)
+    registry.register("intuition", lambda: ollama_load(INTUITION_MODEL), chat(INTUITION_MODEL),
+                      ollama_unload, memory_mb=2500)
+
+    # --- img2txt：llama3.2-vision ---
+    def load_vision():
+        from main_image import ImageAnalyzer
+        ollama_load(VISION_MODEL)
+        return ImageAnalyzer(VISION_MODEL, keep_alive=OLLAMA_KEEP_ALIVE)
+
+    def analyze(analyzer, text):
+        match = IMAGE_PATH_PATTERN.search(text)
+        if not match:
+            return "❌ 請附上圖片路徑"
+        prompt = text.replace(match.group(0), "").strip() or "Please describe this image in detail."
+        return analyzer.analyze_image(match.group(0), prompt)
+
+    registry.register("img2txt", load_vision, analyze,
+                      lambda analyzer: ollama_unload(analyzer.vision_model), memory_mb=8000)
+
+    # --- img-gen：Stable Diffusion WebUI（模型在 WebUI 行程內）---
+    def load_stable_diffusion():
+        sd = import_from("ImageGen", "main_stable_diffusion_txt2img")
+        if not sd.is_webui_running() and not sd.launch_webui():
+            raise RuntimeError("Failed to launch WebUI")
+        requests.post(f"{sd.API_URL}/sdapi/v1/reload-checkpoint", timeout=300)
+        return sd
+
+    registry.register(
+        "img-gen", load_stable_diffusion, lambda sd, text: sd.generate_image_from_prompt(text),
+        lambda sd: requests.post(f"{sd.API_URL}/sdapi/v1/unload-checkpoint", timeout=60),
+        memory_mb=4000
+    )
+
+    # --- music-gen：MusicGen ---
+    def load_musicgen():
+        return import_from("MusicGen", "main_MusicGen").load_model()
+
+    def compose(resource, text):
+        from main_MusicGen import generate_music
+        path = generate_music(resource[0], resource[1], text)
+        print(f"🎵 已輸出 {path}")
+        return path
+
+    registry.register("music-gen", load_musicgen, compose, memory_mb=3000)
+
+    # --- tts / stt：Coqui TTS、Whisper ---
+    def load_tts():
+        from main_TTS import load_models
+        return load_models()
+
+    def speak(models, text):
+        from main_TTS import speak
+        speak(models, text)
+        return text
+
+    registry.register("tts", load_tts, speak, memory_mb=1200)
+
+    def load_whisper():
+        from main_STT import load_model
+        return load_model()
+
+    def listen(model, text):
+        from main_STT import transcribe, transcribe_recording, record
+        match = AUDIO_PATH_PATTERN.search(text)
+        result = transcribe(model, match.group(0)) if match else transcribe_recording(model, record())
+        print(f"📝 {result}")
+        return result
+
+    registry.register("stt", load_whisper, listen, memory_mb=2000)
+    return registry
@@ -0,0 +1,258 @@
+import os
+import re
+import json
+import time
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import requests
+
+OLLAMA_EMBED_URL = "http://localhost:11434/api/embed"
+EMBED_MODEL = "shaw/dmeta-embedding-zh"
+EMBED_TIMEOUT = 2             # 秒；embedding 服務無回應時直接交給 LLM
+CENTROID_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "router_centroids.npz")
+QUERY_CACHE_SIZE = 256
+RETRY_AFTER_SECONDS = 60      # embedding 服務失敗後，這段時間內直接跳過這一層
+
+KNN_K = 5
+CENTROID_MIN_SIMILARITY = 0.55   # 最相近的 label 中心至少要這麼像
+CENTROID_MIN_MARGIN = 0.08       # 且要比第二名高出這麼多，才不用再看 k-NN
+KNN_MIN_CONFIDENCE = 0.7         # k-NN 加權票數佔比低於此值時交給 LLM
+
+# === 第一層：關鍵字 / 正規表示式規則（依序比對，先命中者為準）===
+KEYWORD_RULES = [
+    # 「畫這張圖」「這張圖改成…」是要產生圖片，不是描述圖片
+    ("img2txt", re.compile(r"\.(png|jpe?g|bmp|gif|webp)\b|(?<!畫)這張(圖|照片)(?!.{0,10}(改成|改為|變成|轉成))|圖(片|中|裡).{0,6}(什麼|描述|內容)|describe (this|the) (image|picture|photo)", re.IGNORECASE)),
+    ("stt", re.compile(r"\.(wav|mp3|m4a|flac|ogg)\b|語音轉文字|逐字稿|聽打|transcri(be|ption)|speech to text", re.IGNORECASE)),
+    ("tts", re.compile(r"唸(出來|給我聽)|念(出來|給我聽)|朗讀|讀(出來|給我聽)|文字轉語音|read (it |this )?(out )?aloud|text to speech", re.IGNORECASE)),
+    # 只收明確的「產生一首 / 一段」，「歌詞」是文字創作
+    ("music-gen", re.compile(r"(作|編)曲|配樂|(產生|生成|做|寫|創作)一(首|段).{0,8}(音樂|歌(?!詞)|旋律|伴奏)|\b(compose|generate|make|create) (me )?(an? |some )?([\w-]+ ){0,3}(music|songs?|melody|tune|beat)\b", re.IGNORECASE)),
+    # 要求「畫」或「一張 / 一幅」，避開計畫與 "a summary of this image" 這類文字任務；
+    # 圖表、流程圖與程式繪圖（python / matplotlib）整句排除，交給後面的分類層
+    ("img-gen", re.compile(r"^(?!.*(圖表|折線圖|長條圖|圓餅圖|散佈圖|流程圖|架構圖|python|matplotlib|mermaid|程式|chart|plot|diagram))"
+                           r".*?((?<![計規企策])畫(一|幾)?(張|幅|隻)|畫這張|這張(圖|照片).{0,10}(改成|改為|變成|轉成)|(繪製|生成|產生|做|設計)(一|幾)(張|幅)"
+                           r"|\bdraw (me )?(an?|some)\b|\b(generate|create|make|design) (me )?an? ((?!of\b|this\b)[\w-]+ ){0,3}(image|picture|illustration|logo|drawing|painting|poster)\b)",
+                           re.IGNORECASE | re.DOTALL)),
+    ("reasoning", re.compile(r"證明|推導|方程式?|微積分|機率|演算法|深度思考|一步一步|\b(prove|derive|calculate|equations?)\b|step by step", re.IGNORECASE)),
+]
+
+# 規則的回歸範例：(輸入, 預期 label)，None 表示不應被規則攔下、交給 embedding / LLM 判斷
+# 修改 KEYWORD_RULES 後執行 `python intent_router.py` 檢查
+RULE_EXAMPLES = [
+    ("幫我畫一隻在月球上的貓", "img-gen"),
+    ("做一張生日派對的海報", "img-gen"),
+    ("Generate an image of a red sports car", "img-gen"),
+    ("幫我畫這張圖的草稿", "img-gen"),
+    ("把這張圖改成水彩風格", "img-gen"),
+    ("這張圖片裡有什麼", "img2txt"),
+    ("幫我描述這張照片的內容", "img2txt"),
+    ("產生一段鋼琴旋律", "music-gen"),
+    ("Compose a lo-fi beat for studying", "music-gen"),
+    ("prove that sqrt 2 is irrational", "reasoning"),
+    ("用 python 畫一張折線圖", None),
+    ("幫我畫一張長條圖比較三季營收", None),
+    ("幫我做一個學習計畫", None),
+    ("幫我產生一個流程圖的 mermaid 程式碼", None),
+    ("generate a summary of this image", None),
+    ("寫一段歌詞給我", None),
+    ("can you solve my relationship problem", None),
+    ("help me improve my resume", None),
+]
+
+# === 第二層：各 label 的標註範例（修改後 centroid 快取會自動重建）===
+LABEL_EXAMPLES = {
+    "reasoning": [
+        "我想要解一個數學問題，關係到相機參數",
+        "我希望你進行深度思考",
+        "幫我分析這段程式碼為什麼會出錯",
+        "比較這兩種方案的優缺點並給出結論",
+        "如果每年成長百分之五，十年後會是多少",
+        "Explain why this algorithm runs in O(n log n)",
+        "Help me figure out the logic of this puzzle",
+    ],
+    "intuition": [
+        "你覺得這件衣服好看嗎",
+        "用一句話形容秋天的感覺",
+        "你對人工智慧的未來有什麼看法",
+        "給我一點鼓勵",
+        "這個名字聽起來如何",
+        "What is your opinion about remote work?",
+        "Tell me how you feel about this idea",
+    ],
+    "img-gen": [
+        "幫我畫一隻在月球上的貓",
+        "產生一張賽博龐克風格的城市夜景",
+        "做一張生日派對的海報",
+        "我想要一張水彩風格的山景圖",
+        "Generate an image of a red sports car",
+        "Draw a cute robot holding a flower",
+    ],
+    "img2txt": [
+        "這張圖片裡有什麼",
+        "幫我描述這張照片的內容",
+        "看一下這張截圖上寫了什麼",
+        "辨識圖片中的物體",
+        "What is in this picture?",
+        "Describe the attached photo",
+    ],
+    "tts": [
+        "把這段文字唸出來",
+        "用語音讀給我聽",
+        "請幫我朗讀這篇文章",
+        "把回覆轉成語音",
+        "Read this paragraph out loud",
+        "Convert this text to speech",
+    ],
+    "stt": [
+        "幫我把這段錄音轉成文字",
+        "這個音檔在說什麼",
+        "把會議錄音整理成逐字稿",
+        "聽這段語音並寫下內容",
+        "Transcribe this audio file",
+        "What does this voice recording say?",
+    ],
+    "music-gen": [
+        "幫我做一首輕快的背景音樂",
+        "產生一段鋼琴旋律",
+        "為我的影片配一段史詩感的配樂",
+        "寫一首關於夏天的歌曲伴奏",
+        "Compose a lo-fi beat for studying",
+        "Generate relaxing music with guitar",
+    ],
+}
+
+
+def match_rules(text):
+    for label, pattern in KEYWORD_RULES:
+        if pattern.search(text):
+            return label
+    return None
+
+
+def check_rules(examples=RULE_EXAMPLES):
+    """回傳與預期不符的 (輸入, 預期, 實際)"""
+    return [(text, expected, match_rules(text)) for text, expected in examples if match_rules(text) != expected]
+
+
+def fetch_embeddings(texts, model=EMBED_MODEL, url=OLLAMA_EMBED_URL):
+    """Ollama /api/embed，回傳已正規化（單位長度）的矩陣"""
+    response = requests.post(url, json={"model": model, "input": texts}, timeout=EMBED_TIMEOUT)
+    response.raise_for_status()
+    matrix = np.array(response.json()["embeddings"], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def examples_fingerprint(examples, model):
+    return hashlib.sha1(json.dumps([model, examples], ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+# === 第二層：embedding 分類器 ===
+class EmbeddingClassifier:
+    """
+    範例向量與每個 label 的中心向量存在 CENTROID_CACHE_PATH，只在範例或模型改變時重新計算。
+    查詢時先比對 label 中心（7 次內積）；差距夠明顯就直接採用，否則以範例 k-NN 加權投票。
+    """
+
+    def __init__(self, examples=None, model=EMBED_MODEL, cache_path=CENTROID_CACHE_PATH, url=OLLAMA_EMBED_URL):
+        self.examples = examples or LABEL_EXAMPLES
+        self.model = model
+        self.cache_path = cache_path
+        self.url = url
+        self.labels = list(self.examples)
+        self.example_vectors = None
+        self.example_labels = None
+        self.centroids = None
+        self.query_cache = OrderedDict()
+        self.unavailable_until = 0.0
+
+    def ready(self):
+        """載入或建立向量；embedding 服務無法使用時回傳 False"""
+        if self.centroids is not None:
+            return True
+        if time.time() < self.unavailable_until:
+            return False
+        fingerprint = examples_fingerprint(self.examples, self.model)
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                data = np.load(self.cache_path, allow_pickle=False)
+                if str(data["fingerprint"]) == fingerprint:
+                    self.example_vectors = data["example_vectors"]
+                    self.example_labels = data["example_labels"]
+                    self.centroids = data["centroids"]
+                    return True
+            except (OSError, KeyError, ValueError):
+                pass
+        try:
+            self.build(fingerprint)
+            return True
+        except Exception as e:
+            print(f"⚠️ 無法建立 embedding 路由（{e}），改由 LLM 判斷")
+            self.unavailable_until = time.time() + RETRY_AFTER_SECONDS
+            return False
+
+    def build(self, fingerprint):
+        texts, labels = [], []
+        for label in self.labels:
+            texts += self.examples[label]
+            labels += [label] * len(self.examples[label])
+        vectors = fetch_embeddings(texts, self.model, self.url)
+        labels = np.array(labels)
+        centroids = np.stack([vectors[labels == label].mean(axis=0) for label in self.labels])
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        self.example_vectors, self.example_labels, self.centroids = vectors, labels, centroids
+        if self.cache_path:
+            # 直接傳檔案物件，避免 np.savez 自動補上 .npz 副檔名
+            with open(self.cache_path, "wb") as f:
+                np.savez(f, fingerprint=fingerprint, example_vectors=vectors,
+                         example_labels=labels, centroids=centroids)
+
+    def embed_query(self, text):
+        vector = self.query_cache.get(text)
+        if vector is None:
+            vector = fetch_embeddings([text], self.model, self.url)[0]
+            self.query_cache[text] = vector
+            if len(self.query_cache) > QUERY_CACHE_SIZE:
+                self.query_cache.popitem(last=False)
+        else:
+            self.query_cache.move_to_end(text)
+        return vector
+
+    def classify(self, text):
+        """回傳 (label, confidence, method)；沒有足夠把握時 label 為 None"""
+        if not self.ready() or time.time() < self.unavailable_until:
+            return None, 0.0, None
+        try:
+            query = self.embed_query(text)
+        except Exception as e:
+            print(f"⚠️ embedding 失敗（{e}），改由 LLM 判斷")
+            self.unavailable_until = time.time() + RETRY_AFTER_SECONDS
+            return None, 0.0, None
+
+        scores = self.centroids @ query
+        order = np.argsort(scores)[::-1]
+        best, second = scores[order[0]], scores[order[1]] if len(order) > 1 else -1.0
+        if best >= CENTROID_MIN_SIMILARITY and best - second >= CENTROID_MIN_MARGIN:
+            return self.labels[order[0]], float(best), "centroid"
+
+        similarities = self.example_vectors @ query
+        neighbours = np.argsort(similarities)[::-1][:KNN_K]
+        weights = {}
+        for i in neighbours:
+            weights[self.example_labels[i]] = weights.get(self.example_labels[i], 0.0) + max(float(similarities[i]), 0.0)
+        total = sum(weights.values())
+        if not total:
+            return None, 0.0, "knn"
+        label, weight = max(weights.items(), key=lambda item: item[1])
+        confidence = weight / total
+        if confidence >= KNN_MIN_CONFIDENCE and similarities[neighbours[0]] >= CENTROID_MIN_SIMILARITY:
+            return str(label), confidence, "knn"
+        return None, confidence, "knn"
+
+
+if __name__ == "__main__":
+    failures = check_rules()
+    for text, expected, actual in failures:
+        print(f"❌ {text} -> {actual}（預期 {expected}）")
+    print(f"✅ {len(RULE_EXAMPLES) - len(failures)}/{len(RULE_EXAMPLES)} 個規則範例符合預期")
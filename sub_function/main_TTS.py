@@ -1,28 +1,63 @@
-from TTS.api import TTS  # 需要安裝Visual Studio C++的MSVC、Windows SDK、CMake等工具
-import sounddevice as sd
-import torch
-from TTS.utils.radam import RAdam  # 👈 需要明確 import
-from collections import defaultdict
-
-safe_classes = [RAdam, defaultdict, dict, list, tuple, set, slice, complex]
-
-with torch.serialization.safe_globals({cls: None for cls in safe_classes}):
-    from TTS.api import TTS
-    tts_chinese = TTS(model_name="tts_models/zh-CN/baker/tacotron2-DDC-GST", progress_bar=False)
-    tts_english = TTS(model_name="tts_models/en/ljspeech/tacotron2-DDC", progress_bar=False)
-
-while True:
-    text = input("請輸入要轉換的中文字（或輸入 'exit' 退出）：")
-    text += "。"  # 少了的話會無限循環
+import re
+
+CHINESE_MODEL = "tts_models/zh-CN/baker/tacotron2-DDC-GST"
+ENGLISH_MODEL = "tts_models/en/ljspeech/tacotron2-DDC"
+CJK_PATTERN = re.compile(r"[\u4e00-\u9fff]")
+
+
+# === 載入模型 ===
+def load_models():
+    """回傳 {"zh": TTS, "en": TTS}；TTS 與 torch 延到真正需要時才 import"""
+    import torch
+    from collections import defaultdict
+    from TTS.utils.radam import RAdam  # 👈 需要明確 import
+
+    safe_classes = [RAdam, defaultdict, dict, list, tuple, set, slice, complex]
+
+    with torch.serialization.safe_globals({cls: None for cls in safe_classes}):
+        from TTS.api import TTS  # 需要安裝Visual Studio C++的MSVC、Windows SDK、CMake等工具
+        return {
+            "zh": TTS(model_name=CHINESE_MODEL, progress_bar=False),
+            "en": TTS(model_name=ENGLISH_MODEL, progress_bar=False),
+        }
+
+
+# === 合成與播放 ===
+def detect_language(text):
+    return "zh" if CJK_PATTERN.search(text) else "en"
+
+
+def synthesize(models, text, language=None):
+    """回傳 (音訊波形, 取樣率)"""
+    language = language or detect_language(text)
+    tts = models[language]
+    text += "。" if language == "zh" else "."  # 少了的話會無限循環
     # 🎧 使用 TTS 模型產生語音波形
-    audio = tts_chinese.tts(text)
+    audio = tts.tts(text)
+    return audio, tts.synthesizer.output_sample_rate
 
+
+def speak(models, text, language=None):
+    import sounddevice as sd
+    audio, sample_rate = synthesize(models, text, language)
     # 🔊 播放（不存檔）
-    sd.play(audio, samplerate=tts_chinese.synthesizer.output_sample_rate)
+    sd.play(audio, samplerate=sample_rate)
     sd.wait()
 
-    text = input("請輸入要轉換的英文句子（或輸入 'exit' 退出）：")
-    text += "."  # 少了的話會無限循環
-    audio = tts_english.tts(text)
-    sd.play(audio, samplerate=tts_english.synthesizer.output_sample_rate)
-    sd.wait()
\ No newline at end of file
+
+def main():
+    models = load_models()
+    while True:
+        text = input("請輸入要轉換的中文字（或輸入 'exit' 退出）：")
+        if text.strip() == "exit":
+            break
+        speak(models, text, "zh")
+
+        text = input("請輸入要轉換的英文句子（或輸入 'exit' 退出）：")
+        if text.strip() == "exit":
+            break
+        speak(models, text, "en")
+
+
+if __name__ == "__main__":
+    main()
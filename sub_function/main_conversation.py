@@ -1,19 +1,27 @@
 import sys
 import time
-import json
 import platform
-import signal
 import subprocess
-import requests
+import concurrent.futures
 
+from chat_engine import ChatEngine
 from conversation_handler import ConversationHandler
+from conversation_archive import ARCHIVE_AFTER_DAYS
+from history_manager import HistoryManager, HISTORY_STRATEGY
+from chat_metrics import SessionStats
 
 OLLAMA_URL = "http://localhost:11434/api/chat"
+LIST_PAGE_SIZE = 20
+SEARCH_LIMIT = 10
 
 class ConversationController:
-    def __init__(self, model="qwen2.5:3b", cot_enable=False, cot_prompt=None):
+    def __init__(self, model="qwen2.5:3b", cot_enable=False, cot_prompt=None, history_strategy=HISTORY_STRATEGY):
         self.model = model
         self.conversation_handler = ConversationHandler()
+        self.history_manager = HistoryManager(history_strategy, base_path=self.conversation_handler.base_path)
+        self.engine = ChatEngine(OLLAMA_URL)
+        self.active_chat = None
+        self.session_stats = SessionStats()
         self.conversation_id = self.conversation_handler.new_conversation(model)
         self.cot_enable = cot_enable
         self.cot_prompt = cot_prompt
@@ -38,6 +46,30 @@ class ConversationController:
         elif command == "/save":
             return self._save_conversation()
 
+        elif command == "/list":
+            page = int(cmd_parts[1]) if len(cmd_parts) > 1 and cmd_parts[1].isdigit() else 1
+            self._list_conversations(page)
+            return True
+
+        elif command == "/search" and len(cmd_parts) > 1:
+            self._search_conversations(cmd_parts[1])
+            return True
+
+        elif command == "/stats":
+            print(self.session_stats.format())
+            return True
+
+        elif command == "/delete" and len(cmd_parts) > 1:
+            self._delete_conversation(cmd_parts[1])
+            return True
+
+        elif command == "/archive":
+            days = int(cmd_parts[1]) if len(cmd_parts) > 1 and cmd_parts[1].isdigit() else ARCHIVE_AFTER_DAYS
+            count = self.conversation_handler.archive_conversations(days)
+            if not count:
+                print(f"📦 No conversations older than {days} days to archive")
+            return True
+
         elif command in ["/exit", "/quit", "/bye"]:
             self._exit_conversation()
             return True
@@ -60,6 +92,17 @@ class ConversationController:
         print(f"🆕 Started new conversation with ID: {self.conversation_id}")
 
     def _load_conversation(self, conv_id):
+        # Accept any unique ID prefix, e.g. "/load 20250612"
+        matches = self.conversation_handler.find_conversations(conv_id)
+        if not any(m["id"] == conv_id for m in matches):
+            if len(matches) == 1:
+                conv_id = matches[0]["id"]
+            elif len(matches) > 1:
+                print(f"🔎 Multiple conversations match '{conv_id}':")
+                for m in matches:
+                    print(f"  {m['id']}  [{m['model']}] {m['title']}")
+                return True
+
         if self.conversation_handler.load_conversation(conv_id):
             print(f"📂 Loaded conversation {conv_id}")
             history = self.conversation_handler.get_conversation_history()
@@ -72,6 +115,37 @@ class ConversationController:
             print(f"❌ Failed to load conversation {conv_id}")
             return True
 
+    def _delete_conversation(self, conv_id):
+        if not self.conversation_handler.delete_conversation(conv_id):
+            print(f"❌ No conversation with ID {conv_id}")
+            return
+        self.history_manager.forget(conv_id)
+        print(f"🗑️ Deleted conversation {conv_id}")
+        if self.conversation_handler.current_id is None:
+            self._start_new_conversation()
+
+    def _list_conversations(self, page=1, page_size=LIST_PAGE_SIZE):
+        conversations = self.conversation_handler.list_conversations(page=page, page_size=page_size)
+        if not conversations:
+            print("📭 No conversations on this page")
+            return
+        print(f"📚 Conversations (page {page}):")
+        for conv in conversations:
+            print(f"  {conv['id']}  {conv['date']}  [{conv['model']}] {conv['message_count']} msgs  {conv['title']}")
+        if len(conversations) == page_size:
+            print(f"➡️ /list {page + 1} for more")
+
+    def _search_conversations(self, query):
+        started = time.perf_counter()
+        hits = self.conversation_handler.search_conversations(query, limit=SEARCH_LIMIT)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if not hits:
+            print(f"🔍 No matches for '{query}' ({elapsed_ms:.1f} ms)")
+            return
+        print(f"🔍 {len(hits)} matches for '{query}' ({elapsed_ms:.1f} ms):")
+        for hit in hits:
+            print(f"  {hit['conversation_id']} #{hit['seq']} {hit['role'].title()}: {hit['snippet']}")
+
     def _save_conversation(self):
         if self.conversation_handler.save_conversation():
             print(f"💾 Saved conversation {self.conversation_handler.current_id}")
@@ -80,7 +154,8 @@ class ConversationController:
         return True
 
     def _exit_conversation(self):
-        self.conversation_handler.save_conversation()
+        # close() waits for the background writer to flush everything to disk
+        self.conversation_handler.close()
         print("👋 Goodbye!")
         sys.exit(0)
 
@@ -98,105 +173,64 @@ class ConversationController:
         self.model = new_model
         print(f"🤖 Model changed to: {self.model}")
 
-    def chat_with_llm(self, user_input):
-        self.conversation_handler.add_message("user", user_input)
-
-        # 準備 messages 結構
-        messages = [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in self.conversation_handler.get_conversation_history()
-        ]
+    def _history_messages(self):
+        return self.history_manager.build(
+            self.conversation_handler.current_id,
+            self.conversation_handler.get_conversation_history()
+        )
+
+    def start_chat(self, user_input, on_token=None, on_done=None, origin=None):
+        """非阻塞：送出使用者訊息並開始生成，回傳可取消的 ChatHandle"""
+        self.conversation_handler.add_message("user", user_input, origin=origin)
+
+        # 準備 messages 結構（依 history strategy 裁切）
+        messages = self._history_messages()
+
+        def done(result):
+            # 取消時保留已生成的部分內容
+            # 只有完整結束的回合才計入統計（取消/錯誤的回合沒有伺服器端計時）
+            metrics = result["metrics"] if result["final"] else None
+            self.session_stats.add(metrics)
+            if result["content"]:
+                self.conversation_handler.add_message("assistant", result["content"], origin=origin, metrics=metrics)
+            self.active_chat = None
+            if on_done:
+                on_done(result)
 
-        try:
-            response = requests.post(
-                OLLAMA_URL,
-                headers={"Content-Type": "application/json"},
-                data=json.dumps({
-                    "model": self.model,
-                    "messages": messages,
-                    "stream": True
-                }),
-                stream=True
-            )
-
-            if response.status_code != 200:
-                print(f"\n❌ Failed to get response: {response.status_code}")
-                print(response.text)
-                return
-
-            print("\nAssistant: ", end="", flush=True)
-            full_response = ""
-
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        chunk = json.loads(line)
-                        if "message" in chunk and "content" in chunk["message"]:
-                            content = chunk["message"]["content"]
-                            if content:
-                                print(content, end="", flush=True)
-                                full_response += content
-                        if chunk.get("done", False):
-                            break
-                    except json.JSONDecodeError:
-                        continue
-
-            print()
-            self.conversation_handler.add_message("assistant", full_response)
-
-        except Exception as e:
-            print(f"\n❌ Error communicating with Ollama: {e}")
+        self.active_chat = self.engine.start(self.model, messages, on_token=on_token, on_done=done)
+        return self.active_chat
 
+    def cancel_chat(self):
+        if self.is_generating():
+            self.active_chat.cancel()
 
-    def chat_with_llm_stream(self, user_input, on_token=None, on_done=None):
-        self.conversation_handler.add_message("user", user_input)
+    def is_generating(self):
+        return self.active_chat is not None and not self.active_chat.done()
 
-        messages = [
-            {"role": msg["role"], "content": msg["content"]}
-            for msg in self.conversation_handler.get_conversation_history()
-        ]
+    def chat_with_llm(self, user_input):
+        print("\nAssistant: ", end="", flush=True)
+        handle = self.start_chat(user_input, on_token=lambda token: print(token, end="", flush=True))
+
+        # 以短 timeout 輪詢，Ctrl+C 在各平台都能即時中斷生成
+        while True:
+            try:
+                result = handle.result(timeout=0.1)
+                break
+            except concurrent.futures.TimeoutError:
+                continue
+            except KeyboardInterrupt:
+                handle.cancel()
 
-        try:
-            response = requests.post(
-                OLLAMA_URL,
-                headers={"Content-Type": "application/json"},
-                data=json.dumps({
-                    "model": self.model,
-                    "messages": messages,
-                    "stream": True
-                }),
-                stream=True
-            )
-
-            if response.status_code != 200:
-                if on_done:
-                    on_done(f"\n❌ Failed: {response.status_code}")
-                return
-
-            full_response = ""
-
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        chunk = json.loads(line)
-                        if "message" in chunk and "content" in chunk["message"]:
-                            content = chunk["message"]["content"]
-                            if content:
-                                full_response += content
-                                if on_token:
-                                    on_token(content)
-                        if chunk.get("done", False):
-                            break
-                    except json.JSONDecodeError:
-                        continue
-
-            self.conversation_handler.add_message("assistant", full_response)
-            if on_done:
-                on_done(None)
+        print()
+        if result["cancelled"]:
+            print("⏹️ Generation stopped")
+        elif result["error"]:
+            print(f"\n❌ Error communicating with Ollama: {result['error']}")
 
-        except Exception as e:
-            if on_done:
-                on_done(f"\n❌ Error: {e}")
+    def chat_with_llm_stream(self, user_input, on_token=None, on_done=None):
+        result = self.start_chat(user_input, on_token=on_token).result()
+        if on_done:
+            on_done(f"\n❌ Error: {result['error']}" if result["error"] else None)
 
 # =============================
 # ✅ 可以直接執行測試指令 + Ollama 回應
@@ -224,7 +258,7 @@ if __name__ == "__main__":
     else:
         ctrl = ConversationController(model="qwen3:4b")
     
-    print("\n✅ 支援指令: /new, /load <id>, /save, /model <n>, /restart-ollama, /exit")
+    print("\n✅ 支援指令: /new, /list [page], /load <id|prefix>, /search <query>, /delete <id>, /archive [days], /stats, /save, /model <n>, /restart-ollama, /exit")
 
     while True:
         try:
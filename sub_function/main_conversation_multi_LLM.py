@@ -0,0 +1,215 @@
+import re
+import time
+import queue
+from collections import Counter
+
+from chat_engine import ChatEngine
+
+OLLAMA_URL = "http://localhost:11434/api/chat"
+MAX_CONCURRENT = 3            # 同時送往 Ollama 的請求上限（受 OLLAMA_NUM_PARALLEL 與記憶體限制）
+KEEP_ALIVE = "30m"
+DEFAULT_MODELS = ["qwen2.5:3b", "qwen3:4b", "gemma3:4b"]
+SAMPLE_TEMPERATURE = 0.8      # self-consistency 取樣溫度
+JUDGE_MODEL = "qwen3:4b"
+AGGREGATE_MODES = ("vote", "judge")
+
+ANSWER_INSTRUCTION = (
+    "Think step by step, then finish with a single line in the form "
+    "'Final answer: <answer>' that contains only the short final answer."
+)
+JUDGE_PROMPT = (
+    "You are a judge. Several assistants answered the same question independently.\n"
+    "Question:\n{question}\n\n{answers}\n\n"
+    "Compare the answers, point out mistakes, and give the best final answer. "
+    "Finish with a single line 'Final answer: <answer>'."
+)
+FINAL_ANSWER_PATTERN = re.compile(r"final answer\s*[:：]\s*(.+)", re.IGNORECASE)
+THINK_PATTERN = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+
+# === 答案擷取與正規化 ===
+def extract_answer(text):
+    """取最後一行 'Final answer:'，沒有時退回最後一個非空行"""
+    text = THINK_PATTERN.sub("", text or "")
+    matches = FINAL_ANSWER_PATTERN.findall(text)
+    if matches:
+        return matches[-1].strip()
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return lines[-1] if lines else ""
+
+
+def normalize_answer(answer):
+    """投票用的比較鍵：忽略大小寫、markdown 粗體、結尾標點與多餘空白"""
+    answer = answer.lower().replace("**", "").strip()
+    answer = re.sub(r"\s+", " ", answer)
+    return answer.strip(" .。!！")
+
+
+# === 參與者 ===
+class Participant:
+    def __init__(self, name, model, options=None):
+        self.name = name
+        self.model = model
+        self.options = options or {}
+
+
+def model_participants(models):
+    """K 個不同模型各答一次"""
+    return [Participant(f"{model}#{i + 1}", model) for i, model in enumerate(models)]
+
+
+def sample_participants(model, k, temperature=SAMPLE_TEMPERATURE):
+    """同一模型以不同 seed 取樣 K 次（self-consistency）"""
+    return [
+        Participant(f"{model}@{i + 1}", model, {"temperature": temperature, "seed": i + 1})
+        for i in range(k)
+    ]
+
+
+# === 平行多模型回答 ===
+class MultiLLMRunner:
+    """
+    把同一個問題透過 ChatEngine 同時送給 K 個參與者（同時生成數上限 max_concurrent，其餘排隊），再以多數決或裁判模型彙整。
+    多數決模式下，一旦某答案已取得過半數票，其餘仍在生成或排隊中的請求會以 ChatHandle.cancel() 中斷（early stop）。
+    """
+
+    def __init__(self, participants, max_concurrent=MAX_CONCURRENT, url=OLLAMA_URL, keep_alive=KEEP_ALIVE):
+        self.participants = participants
+        self.keep_alive = keep_alive
+        self.engine = ChatEngine(url, max_concurrent=max_concurrent)
+
+    def ask(self, participant, messages, on_done):
+        """開始單一參與者的生成並立即回傳 ChatHandle；完成或被取消時 on_done 收到結果 dict"""
+        chunks = [0]   # 被中斷時沒有 eval_count，以收到的 chunk 數（約等於 token 數）估計
+
+        def count(_):
+            chunks[0] += 1
+
+        def finish(raw):
+            on_done({"name": participant.name, "model": participant.model, "content": raw["content"],
+                     "cancelled": raw["cancelled"], "error": raw["error"], "metrics": raw["metrics"],
+                     "chunks": chunks[0], "answer": extract_answer(raw["content"])})
+
+        return self.engine.start(participant.model, messages, on_token=count, on_done=finish,
+                                 options=participant.options or None, keep_alive=self.keep_alive)
+
+    def run(self, question, aggregate="vote", quorum=None, judge_model=JUDGE_MODEL):
+        """
+        aggregate: "vote" 多數決 / "judge" 交給裁判模型
+        quorum: 多數決提前結束所需票數，預設為過半數；judge 模式會等所有人完成
+        """
+        if aggregate not in AGGREGATE_MODES:
+            raise ValueError(f"未知的彙整方式: {aggregate}")
+        started = time.perf_counter()
+        count = len(self.participants)
+        quorum = quorum or count // 2 + 1
+        finished = queue.Queue()
+        results, votes = [], Counter()
+        winner = None
+
+        messages = [{"role": "system", "content": ANSWER_INSTRUCTION},
+                    {"role": "user", "content": question}]
+        handles = [self.ask(p, messages, finished.put) for p in self.participants]
+        try:
+            for _ in handles:
+                result = finished.get()
+                results.append(result)
+                if aggregate != "vote" or result["cancelled"] or result["error"] or not result["answer"]:
+                    continue
+                key = normalize_answer(result["answer"])
+                votes[key] += 1
+                if votes[key] >= quorum and winner is None:
+                    winner = key
+                    for handle in handles:
+                        handle.cancel()
+                    print(f"⚡ {votes[key]}/{count} 票一致，提前結束其餘請求")
+        finally:
+            # 正常結束時都已完成，cancel 不會有作用；中途出錯（例如 Ctrl+C）則中斷所有生成
+            for handle in handles:
+                handle.cancel()
+
+        outcome = {"question": question, "aggregate": aggregate, "results": results, "votes": dict(votes)}
+        if aggregate == "vote":
+            if winner is None and votes:
+                winner = votes.most_common(1)[0][0]
+            outcome["answer"] = next((r["answer"] for r in results if normalize_answer(r["answer"]) == winner), "")
+            outcome["agreement"] = votes[winner] / count if winner else 0.0
+        else:
+            outcome["judge"] = self.judge(question, results, judge_model)
+            outcome["answer"] = outcome["judge"]["answer"]
+
+        outcome["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return outcome
+
+    def judge(self, question, results, judge_model):
+        answered = [r for r in results if r["content"] and not r["error"]]
+        answers = "\n\n".join(
+            f"Answer {i + 1} ({r['name']}):\n{THINK_PATTERN.sub('', r['content']).strip()}"
+            for i, r in enumerate(answered)
+        )
+        prompt = JUDGE_PROMPT.format(question=question, answers=answers)
+        finished = queue.Queue()
+        self.ask(Participant("judge", judge_model), [{"role": "user", "content": prompt}], finished.put)
+        return finished.get()
+
+
+def format_report(outcome):
+    """每位參與者的 token 數與延遲，以及彙整結果"""
+    lines = [f"\n📊 {'參與者':<20}{'狀態':<8}{'TTFT ms':>10}{'總時間 ms':>12}{'輸出 tok':>10}{'tok/s':>8}  答案"]
+    rows = list(outcome["results"])
+    if outcome.get("judge"):
+        rows.append(outcome["judge"])
+    total_tokens = 0
+    for r in rows:
+        m = r["metrics"] or {}
+        tokens = m.get("eval_tokens") or r.get("chunks", 0)
+        total_tokens += tokens
+        status = "錯誤" if r["error"] else "中斷" if r["cancelled"] else "完成"
+        ttft = f"{m['ttft_ms']:.0f}" if m.get("ttft_ms") is not None else "-"
+        tps = f"{m['tokens_per_sec']:.1f}" if m.get("tokens_per_sec") is not None else "-"
+        lines.append(f"   {r['name']:<20}{status:<8}{ttft:>10}{m.get('total_ms', 0):>12.0f}"
+                     f"{tokens:>10}{tps:>8}  {r['answer'][:40]}")
+    lines.append(f"🧮 輸出 token 合計 {total_tokens}，總時間 {outcome['elapsed_ms']:.0f} ms")
+    if outcome["aggregate"] == "vote":
+        lines.append(f"🗳️ 票數 {outcome['votes']}，一致率 {outcome['agreement']:.0%}")
+    lines.append(f"✅ 最終答案：{outcome['answer']}")
+    return "\n".join(lines)
+
+
+def run_multi_llm(question, models=None, samples=0, aggregate="vote"):
+    """samples > 0 時以第一個模型取樣 samples 次，否則每個模型各答一次"""
+    models = models or DEFAULT_MODELS
+    if samples:
+        participants = sample_participants(models[0], samples)
+    else:
+        participants = model_participants(models)
+    print("🧠 問題：", question)
+    print(f"🔁 {len(participants)} 位參與者平行作答（{aggregate}）...")
+    outcome = MultiLLMRunner(participants).run(question, aggregate=aggregate)
+    print(format_report(outcome))
+    return outcome
+
+
+def ask_mode(prompt, default="vote"):
+    while True:
+        mode = input(prompt).strip().lower() or default
+        if mode in AGGREGATE_MODES:
+            return mode
+        print(f"⚠️ 請輸入 {' / '.join(AGGREGATE_MODES)}")
+
+
+def ask_count(prompt, default=0):
+    while True:
+        value = input(prompt).strip()
+        if not value:
+            return default
+        if value.isdigit():
+            return int(value)
+        print("⚠️ 請輸入 0 以上的整數")
+
+
+if __name__ == "__main__":
+    user_question = input("請輸入問題： ").strip()
+    mode = ask_mode("彙整方式 vote / judge（預設 vote）： ")
+    samples = ask_count("self-consistency 取樣數（0 = 多模型，預設 0）： ")
+    run_multi_llm(user_question, samples=samples, aggregate=mode)
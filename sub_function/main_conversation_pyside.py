@@ -1,63 +1,44 @@
-from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QLineEdit, QTextEdit
-from PySide6.QtCore import QThread, Signal, Qt
-from PySide6.QtGui import QTextCursor
+from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QTextEdit, QPushButton
+from PySide6.QtCore import QObject, QTimer, Signal, Qt
+from PySide6.QtGui import QTextCursor, QShortcut, QKeySequence
 import sys
-import time
+import threading
 
 from main_conversation import ConversationController  # 請確保此檔案存在且包含 ConversationController
 
+GUI_ORIGIN = "gui"
+RENDER_INTERVAL_MS = 16  # 約 60 fps；token 先累積起來，每個畫面週期只更新一次文件
 
-# === LLM Streaming Thread ===
-class ChatThread(QThread):
-    token_received = Signal(str)
-    finished_stream = Signal()
 
-    def __init__(self, controller, user_input):
-        super().__init__()
-        self.controller = controller
-        self.user_input = user_input
-
-    def run(self):
-        def on_token(token):
-            self.token_received.emit(token)
-
-        def on_done(error_msg):
-            if error_msg:
-                self.token_received.emit(error_msg)
-            self.finished_stream.emit()
+# === Chat engine → Qt bridge ===
+# ChatEngine 在自己的 event loop 執行緒呼叫 callback；完成事件經由 Signal 排入 GUI 執行緒處理
+class ChatBridge(QObject):
+    finished_stream = Signal(object)
 
-        self.controller.chat_with_llm_stream(
-            self.user_input,
-            on_token=on_token,
-            on_done=on_done
-        )
 
+# === Token buffer：生成端只 append，GUI 計時器整批取走 ===
+class TokenBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tokens = []
 
-# === Background Sync Thread for terminal assistant output ===
-class SyncThread(QThread):
-    sync_update = Signal(str)
+    def push(self, token):
+        with self.lock:
+            self.tokens.append(token)
 
-    def __init__(self, controller, get_last_assistant_index):
-        super().__init__()
-        self.controller = controller
-        self.get_last_assistant_index = get_last_assistant_index
-        self.running = True
-        self.last_len = 0
+    def drain(self):
+        with self.lock:
+            tokens, self.tokens = self.tokens, []
+        return "".join(tokens)
 
-    def run(self):
-        while self.running:
-            time.sleep(0.5)
-            history = self.controller.conversation_handler.get_conversation_history()
-            gui_last_idx = self.get_last_assistant_index()
 
-            if len(history) > self.last_len:
-                for i, msg in enumerate(history[self.last_len:], start=self.last_len):
-                    if msg["role"] == "assistant" and i >= gui_last_idx:
-                        self.sync_update.emit(f"🤖 Assistant: {msg['content']}")
-                self.last_len = len(history)
+# === ConversationHandler events → Qt ===
+# 事件在觸發的執行緒上送出（終端機、chat engine…），經由 Signal 排入 GUI 執行緒
+class HistoryBridge(QObject):
+    history_event = Signal(str, object)
 
-    def stop(self):
-        self.running = False
+    def __call__(self, event, **data):
+        self.history_event.emit(event, data)
 
 
 # === GUI Window ===
@@ -75,36 +56,81 @@ class ChatWindow(QWidget):
         self.text_input = QLineEdit(self)
         self.text_input.returnPressed.connect(self.send_message)
 
+        self.stop_button = QPushButton("⏹ Stop", self)
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_generation)
+        QShortcut(QKeySequence(Qt.Key_Escape), self, activated=self.stop_generation)
+
+        input_row = QHBoxLayout()
+        input_row.addWidget(self.text_input)
+        input_row.addWidget(self.stop_button)
+
         self.layout.addWidget(self.text_display)
-        self.layout.addWidget(self.text_input)
+        self.layout.addLayout(input_row)
 
         self.controller = controller
         self.append_text("🟢 Connected to model: " + self.controller.model)
 
         self.current_output = ""
-        self.last_assistant_index = 0
 
-        self.sync_thread = SyncThread(self.controller, lambda: self.last_assistant_index)
-        self.sync_thread.sync_update.connect(self.append_text)
-        self.sync_thread.start()
+        self.bridge = ChatBridge()
+        self.bridge.finished_stream.connect(self.chat_done)
+
+        self.token_buffer = TokenBuffer()
+        self.stream_cursor = None  # 固定在回覆結尾的游標，不動到使用者的選取/捲動位置
+        self.render_timer = QTimer(self)
+        self.render_timer.setInterval(RENDER_INTERVAL_MS)
+        self.render_timer.timeout.connect(self.flush_tokens)
+
+        # 其他前端（例如終端機）新增的訊息即時同步到視窗，不需輪詢
+        self.history_bridge = HistoryBridge()
+        self.history_bridge.history_event.connect(self.on_history_event)
+        self.controller.conversation_handler.subscribe(self.history_bridge)
 
     def append_text(self, text):
         self.text_display.append(text)
 
-    def append_text_token(self, token):
-        self.current_output += token
-        self.text_display.moveCursor(QTextCursor.End)
-        self.text_display.insertPlainText(token)
-        self.text_display.moveCursor(QTextCursor.End)
-
-    def chat_done(self):
+    def flush_tokens(self):
+        text = self.token_buffer.drain()
+        if not text:
+            return
+        self.current_output += text
+
+        # 只有原本就在最底部時才自動捲動，讓使用者可以往上看舊訊息
+        scrollbar = self.text_display.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum() - 4
+        self.stream_cursor.insertText(text)
+        if at_bottom:
+            scrollbar.setValue(scrollbar.maximum())
+
+    def chat_done(self, result):
+        self.render_timer.stop()
+        self.flush_tokens()
+        self.stream_cursor = None
+        if result["cancelled"]:
+            self.append_text("⏹️ Generation stopped")
+        elif result["error"]:
+            self.append_text(f"❌ Error: {result['error']}")
         self.append_text("")  # 換行
-        self.last_assistant_index = len(self.controller.conversation_handler.get_conversation_history())
+        self.stop_button.setEnabled(False)
+
+    def on_history_event(self, event, data):
+        if event == "conversation_changed":
+            self.append_text(f"📂 Conversation {data['conversation_id']} ({len(data['messages'])} messages)")
+        elif event == "message_appended" and data["origin"] != GUI_ORIGIN:
+            message = data["message"]
+            if message["role"] == "user":
+                self.append_text(f"🧑 You (terminal): {message['content']}")
+            elif message["role"] == "assistant":
+                self.append_text(f"🤖 Assistant: {message['content']}")
 
     def send_message(self):
         user_input = self.text_input.text().strip()
         if not user_input:
             return
+        if self.controller.is_generating():
+            self.append_text("⏳ Still generating — press Stop (Esc) first.")
+            return
 
         self.append_text(f"🧑 You: {user_input}")
         self.append_text("🤖 Assistant: ")  # 為接下來 token 留出一行
@@ -115,13 +141,25 @@ class ChatWindow(QWidget):
             return
 
         self.current_output = ""
-        self.chat_thread = ChatThread(self.controller, user_input)
-        self.chat_thread.token_received.connect(self.append_text_token)
-        self.chat_thread.finished_stream.connect(self.chat_done)
-        self.chat_thread.start()
+        self.stop_button.setEnabled(True)
+        self.token_buffer.drain()
+        self.stream_cursor = QTextCursor(self.text_display.document())
+        self.stream_cursor.movePosition(QTextCursor.End)
+        self.render_timer.start()
+        self.controller.start_chat(
+            user_input,
+            on_token=self.token_buffer.push,
+            on_done=self.bridge.finished_stream.emit,
+            origin=GUI_ORIGIN
+        )
+
+    def stop_generation(self):
+        self.controller.cancel_chat()
 
     def closeEvent(self, event):
-        self.sync_thread.stop()
+        self.controller.cancel_chat()
+        self.controller.conversation_handler.unsubscribe(self.history_bridge)
+        self.controller.conversation_handler.close()
         super().closeEvent(event)
 
 
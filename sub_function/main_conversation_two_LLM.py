@@ -1,18 +1,34 @@
 import json
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chat_metrics import TurnTimer, SessionStats, format_turn
 
 OLLAMA_URL = "http://localhost:11434/api/chat"
+KEEP_ALIVE = "30m"            # 辯論期間讓所有參與模型留在記憶體中
+PREFILL_EVERY_CHARS = 200     # 發言者每多產生這麼多字，就替下一位送一次預先 prefill
+PREFILL_TIMEOUT = 60
+DEFAULT_ROUNDS = 3
+FINAL_PROMPT = "Please give us the final conclusion."
+
+def normalize_reply(text):
+    """發言寫入對話前的正規化；預先 prefill 的部分內容也用同一套，prompt 前綴才會和之後一致"""
+    return text.strip()
 
-def stream_chat(model, messages):
+def stream_chat(model, messages, stats=None, on_token=None, keep_alive=None):
+    timer = TurnTimer()
+    payload = {
+        "model": model,
+        "messages": messages,
+        "stream": True
+    }
+    if keep_alive:
+        payload["keep_alive"] = keep_alive
     response = requests.post(
         OLLAMA_URL,
         headers={"Content-Type": "application/json"},
-        data=json.dumps({
-            "model": model,
-            "messages": messages,
-            "stream": True
-        }),
+        data=json.dumps(payload),
         stream=True
     )
 
@@ -22,50 +38,172 @@ def stream_chat(model, messages):
             chunk = json.loads(line)
             if "message" in chunk and "content" in chunk["message"]:
                 content = chunk["message"]["content"]
+                if content:
+                    timer.mark_token()
                 print(content, end="", flush=True)
                 full_reply += content
+                if on_token:
+                    on_token(full_reply)
             if chunk.get("done", False):
+                metrics = timer.finish(chunk)
+                print()
+                print(format_turn(metrics, model))
+                if stats is not None:
+                    stats.setdefault(model, SessionStats()).add(metrics)
                 break
     print()
-    return full_reply.strip()
+    return normalize_reply(full_reply)
+
+# === 多模型辯論引擎 ===
+class Participant:
+    def __init__(self, name, model, system_prompt):
+        self.name = name
+        self.model = model
+        self.messages = [{"role": "system", "content": system_prompt}]
+
+
+class DebateEngine:
+    """
+    N 位參與者依序發言、進行多輪辯論。
+    - 開始前平行 warm-up 所有模型，並以 keep_alive 讓它們在整場辯論中保持載入
+    - 發言者串流輸出時，把目前為止的部分內容當成下一位的提示送出 num_predict=1 的請求，
+      讓 Ollama 先算好下一位的 prompt KV cache；真正輪到它時只需 prefill 最後一小段
+    - 同時最多一個預先 prefill 請求在途，避免和正在生成的模型搶資源
+    """
+
+    def __init__(self, participants, rounds=DEFAULT_ROUNDS, speculative=True, keep_alive=KEEP_ALIVE):
+        self.participants = participants
+        self.rounds = rounds
+        self.speculative = speculative
+        self.keep_alive = keep_alive
+        self.executor = None     # 只在 run() 期間存在
+        self.prefill_future = None
+        self.prefill_requests = 0
+        self.stats = {}          # model -> SessionStats
+        self.round_times = []    # 每輪 (輪次, 秒數)
+
+    def warm_up(self):
+        """平行載入所有模型（不帶 messages 的 chat 請求只會載入模型）"""
+        t0 = time.perf_counter()
+        models = sorted({p.model for p in self.participants})
+        futures = [
+            self.executor.submit(requests.post, OLLAMA_URL, json={"model": m, "keep_alive": self.keep_alive}, timeout=300)
+            for m in models
+        ]
+        for model, future in zip(models, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"⚠️ {model} warm-up 失敗: {e}")
+        print(f"🔥 已載入 {', '.join(models)}（{time.perf_counter() - t0:.1f}s）")
+
+    @staticmethod
+    def turn_message(speaker, content):
+        """其他參與者看到的發言：以 user 角色加上發言者名稱"""
+        return {"role": "user", "content": f"[{speaker.name}]: {content}"}
+
+    def _post_prefill(self, model, messages):
+        requests.post(OLLAMA_URL, json={
+            "model": model,
+            "messages": messages,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"num_predict": 1}
+        }, timeout=PREFILL_TIMEOUT)
+
+    def _speculative_prefill(self, listener, speaker, partial):
+        if self.prefill_future is not None and not self.prefill_future.done():
+            return
+        messages = listener.messages + [self.turn_message(speaker, normalize_reply(partial))]
+        self.prefill_future = self.executor.submit(self._post_prefill, listener.model, messages)
+        self.prefill_future.add_done_callback(self._log_prefill_error)
+        self.prefill_requests += 1
 
-def run_dual_llm_debate(user_question):
+    @staticmethod
+    def _log_prefill_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"\n⚠️ 預先 prefill 失敗: {future.exception()}")
+
+    def speak(self, speaker, listener=None):
+        """讓 speaker 發言；串流期間替 listener 預先 prefill"""
+        last_prefill = [0]
+
+        def on_token(partial):
+            if listener is None or len(partial) - last_prefill[0] < PREFILL_EVERY_CHARS:
+                return
+            last_prefill[0] = len(partial)
+            self._speculative_prefill(listener, speaker, partial)
+
+        use_prefill = self.speculative and listener is not None and listener is not speaker
+        return stream_chat(speaker.model, speaker.messages, self.stats,
+                           on_token=on_token if use_prefill else None, keep_alive=self.keep_alive)
+
+    def broadcast(self, speaker, reply):
+        for participant in self.participants:
+            if participant is speaker:
+                participant.messages.append({"role": "assistant", "content": reply})
+            else:
+                participant.messages.append(self.turn_message(speaker, reply))
+
+    def run(self, question, final_prompt=FINAL_PROMPT):
+        self.executor = ThreadPoolExecutor(max_workers=max(len({p.model for p in self.participants}), 1))
+        try:
+            return self._run(question, final_prompt)
+        finally:
+            # 還在途的 prefill 已無用處，不必等它回來
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            self.prefill_future = None
+
+    def _run(self, question, final_prompt):
+        for participant in self.participants:
+            participant.messages.append({"role": "user", "content": question})
+        self.warm_up()
+
+        started = time.perf_counter()
+        transcript = []
+        count = len(self.participants)
+        for round_index in range(self.rounds):
+            round_start = time.perf_counter()
+            for i, speaker in enumerate(self.participants):
+                listener = self.participants[(i + 1) % count]
+                print(f"\n🔷 Round {round_index + 1} - {speaker.name} ({speaker.model})")
+                reply = self.speak(speaker, listener)
+                self.broadcast(speaker, reply)
+                transcript.append({"round": round_index + 1, "speaker": speaker.name, "content": reply})
+            self.round_times.append((round_index + 1, time.perf_counter() - round_start))
+            print(f"⏱️ Round {round_index + 1}: {self.round_times[-1][1]:.1f}s")
+
+        # 最後由第一位參與者給出結論
+        concluder = self.participants[0]
+        concluder.messages.append({"role": "user", "content": final_prompt})
+        print(f"\n🎯 {concluder.name} 最終結論：")
+        conclusion = self.speak(concluder)
+        transcript.append({"round": "final", "speaker": concluder.name, "content": conclusion})
+
+        self.print_timing(time.perf_counter() - started)
+        return transcript
+
+    def print_timing(self, total):
+        print(f"\n📊 辯論總時間 {total:.1f}s，預先 prefill 請求 {self.prefill_requests} 次")
+        for round_number, seconds in self.round_times:
+            print(f"  Round {round_number}: {seconds:.1f}s")
+        for model, model_stats in self.stats.items():
+            print(model_stats.format(f"{model} stats"))
+
+
+def run_dual_llm_debate(user_question, rounds=DEFAULT_ROUNDS, speculative=True):
     print("🧠 問題：", user_question)
     print("🔁 啟動 Assistant1 / Assistant2 對話...\n")
 
     # 初始角色設定
-    system_prompt_1 = "You are Assistant1. Your job is to solve the user's question thoroughly and logically."
-    system_prompt_2 = "You are Assistant2. Your job is to question and challenge the reasoning or assumptions made by Assistant1."
-
-    # 對話歷史紀錄
-    conversation = [
-        {"role": "user", "content": user_question}
+    participants = [
+        Participant("Assistant1", "qwen2.5:3b",
+                    "You are Assistant1. Your job is to solve the user's question thoroughly and logically."),
+        Participant("Assistant2", "qwen3:4b",
+                    "You are Assistant2. Your job is to question and challenge the reasoning or assumptions made by Assistant1."),
     ]
-
-    assistant1_model = "qwen2.5:3b"
-    assistant2_model = "qwen3:4b"
-
-    # 加入 system prompt
-    conversation_1 = [{"role": "system", "content": system_prompt_1}] + conversation.copy()
-    conversation_2 = [{"role": "system", "content": system_prompt_2}] + conversation.copy()
-
-    for round in range(3):
-        print(f"\n🔷 Round {round+1} - Assistant1 回答")
-        assistant1_reply = stream_chat(assistant1_model, conversation_1)
-        conversation_1.append({"role": "assistant", "content": assistant1_reply})
-        conversation_2.append({"role": "assistant", "content": assistant1_reply})
-
-        print(f"\n🔶 Round {round+1} - Assistant2 質疑")
-        assistant2_reply = stream_chat(assistant2_model, conversation_2)
-        conversation_1.append({"role": "user", "content": assistant2_reply})
-        conversation_2.append({"role": "user", "content": assistant2_reply})
-
-    # 最後要求 Assistant1 給出結論
-    final_question = "Please give us the final conclusion."
-    print("\n🔚 Assistant2: (結尾質疑) →", final_question)
-    conversation_1.append({"role": "user", "content": final_question})
-    print("\n🎯 Assistant1 最終結論：")
-    final_reply = stream_chat(assistant1_model, conversation_1)
+    DebateEngine(participants, rounds=rounds, speculative=speculative).run(user_question)
 
     print("\n✅ 對話結束。")
 
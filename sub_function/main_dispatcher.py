@@ -5,6 +5,9 @@ import platform
 import time
 import json
 
+from intent_router import EmbeddingClassifier, match_rules
+from handler_registry import build_default_registry
+
 OLLAMA_URL = "http://localhost:11434/api/chat"
 OLLAMA_MODEL = "qwen2.5:3b"
 
@@ -43,9 +46,17 @@ QUICK_COMMANDS = [
 ]
 
 class DispatcherController:
-    def __init__(self):
+    """
+    分層路由，越前面越便宜：
+    shortcut（/指令）→ rule（關鍵字規則）→ embedding（label 中心 / k-NN）→ llm。
+    每次判斷的層級、信心與耗時記錄在 last_decision。
+    """
+
+    def __init__(self, use_embeddings=True):
         self.model = OLLAMA_MODEL
         self.history = []
+        self.classifier = EmbeddingClassifier() if use_embeddings else None
+        self.last_decision = None
         self._ensure_ollama_running()
 
     def _ensure_ollama_running(self):
@@ -60,17 +71,55 @@ class DispatcherController:
             time.sleep(3)
             print("✅ Ollama server 啟動完成")
 
+    def _decide(self, label, tier, started, confidence=1.0, detail=None):
+        self.last_decision = {
+            "label": label,
+            "tier": tier,
+            "confidence": round(confidence, 3),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+            "detail": detail,
+        }
+        return f"<model>{label}</model>"
+
+    def run(self, user_input: str, registry):
+        """判斷 label 後交給 registry 對應的 handler；快速指令本身不傳給 handler"""
+        model_tag = self.dispatch(user_input)
+        text = user_input
+        if self.last_decision["tier"] == "shortcut":
+            text = re.sub(r"^/\S+\s*", "", user_input.strip())
+        try:
+            return registry.handle(self.last_decision["label"], text)
+        except KeyError:
+            print(f"⚠️ {model_tag} 沒有對應的 handler")
+        except Exception as e:
+            print(f"❌ {self.last_decision['label']} 執行失敗: {e}")
+
     def dispatch(self, user_input: str) -> str:
+        started = time.perf_counter()
         self.history.append({"role": "user", "content": user_input})
 
         # ✅ 快速指令跳過模型判斷
         shortcut_match = re.match(r"/(reasoning|intuition|img-gen|img2txt|tts|stt|music-gen)", user_input.strip().lower())
         if shortcut_match:
             model_type = shortcut_match.group(1)
-            model_tag = f"<model>{model_type}</model>"
-            print(f"⚡ 快速指令觸發：{model_tag}")
-            return model_tag
+            print(f"⚡ 快速指令觸發：<model>{model_type}</model>")
+            return self._decide(model_type, "shortcut", started)
 
+        # ✅ 關鍵字規則
+        label = match_rules(user_input)
+        if label:
+            return self._decide(label, "rule", started)
+
+        # ✅ embedding 分類，信心不足才交給 LLM
+        confidence, method = 0.0, None
+        if self.classifier is not None:
+            label, confidence, method = self.classifier.classify(user_input)
+            if label:
+                return self._decide(label, "embedding", started, confidence, method)
+
+        return self._dispatch_llm(user_input, started, confidence)
+
+    def _dispatch_llm(self, user_input: str, started: float, embedding_confidence: float) -> str:
         prompt = ENHANCED_PROMPT_TEMPLATE.replace("{{ user_input }}", user_input)
 
         messages = [
@@ -94,7 +143,7 @@ class DispatcherController:
 
             if response.status_code != 200:
                 print(f"❌ Failed to get model prediction: {response.status_code}")
-                return "<model>intuition</model>"
+                return self._decide("intuition", "fallback", started, 0.0)
 
             data = response.json()
             full_output = data.get("message", {}).get("content", "").strip()
@@ -107,15 +156,15 @@ class DispatcherController:
             # 提取 <model>xxx</model>
             match = re.search(r"<model>(.*?)</model>", full_output, re.IGNORECASE)
             if match:
-                model_tag = f"<model>{match.group(1).strip()}</model>"
-                return model_tag
+                return self._decide(match.group(1).strip(), "llm", started, 1.0,
+                                    f"embedding confidence {embedding_confidence:.2f}")
             else:
                 print("⚠️ 無法從回應中提取模型，自動回退為 intuition")
-                return "<model>intuition</model>"
+                return self._decide("intuition", "fallback", started, 0.0)
 
         except Exception as e:
             print(f"❌ Error communicating with Ollama: {e}")
-            return "<model>intuition</model>"
+            return self._decide("intuition", "fallback", started, 0.0)
 
 
 # =============================
@@ -123,19 +172,32 @@ class DispatcherController:
 # =============================
 if __name__ == "__main__":
     dispatcher = DispatcherController()
+    # 各 handler 的模型在第一次用到時才載入，閒置或超出記憶體預算時卸載
+    registry = build_default_registry()
 
     print("\n🤖 Dispatcher ready. 請輸入任務描述（Ctrl+C 離開）：")
     print("💡 快速指令：可跳過模型推論直接輸出")
     for cmd in QUICK_COMMANDS:
         print(f"   {cmd}")
+    print("💡 /status 顯示已載入的模型，/unload <label> 卸載模型")
 
     while True:
         try:
             user_input = input("\n👤 User: ").strip()
             if not user_input:
                 continue
-            output = dispatcher.dispatch(user_input)
-            print(f"🎯 模型判斷結果: {output}")
+            if user_input == "/status":
+                print(registry.status())
+                continue
+            if user_input.startswith("/unload"):
+                label = user_input[len("/unload"):].strip()
+                if not registry.unload(label):
+                    print(f"⚠️ {label} 未載入或執行中")
+                continue
+            dispatcher.run(user_input, registry)
+            decision = dispatcher.last_decision
+            print(f"🎯 模型判斷結果: <model>{decision['label']}</model>（{decision['tier']}，{decision['elapsed_ms']} ms）")
         except KeyboardInterrupt:
             print("\n🛑 Dispatcher 結束")
+            registry.close()
             break
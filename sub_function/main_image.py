@@ -4,8 +4,9 @@ import requests
 import base64
 
 class ImageAnalyzer:
-    def __init__(self, vision_model="llama3.2-vision"):
+    def __init__(self, vision_model="llama3.2-vision", keep_alive=None):
         self.vision_model = vision_model
+        self.keep_alive = keep_alive    # None 時沿用 Ollama 預設（5 分鐘後卸載）
         self.ollama_url = "http://localhost:11434/api/chat"
 
     def encode_image_to_base64(self, image_path):
@@ -36,15 +37,19 @@ class ImageAnalyzer:
             }
         ]
 
+        payload = {
+            "model": self.vision_model,
+            "messages": messages,
+            "stream": True
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+
         try:
             response = requests.post(
                 self.ollama_url,
                 headers={"Content-Type": "application/json"},
-                data=json.dumps({
-                    "model": self.vision_model,
-                    "messages": messages,
-                    "stream": True
-                }),
+                data=json.dumps(payload),
                 stream=True
             )
 